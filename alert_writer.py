@@ -0,0 +1,563 @@
+import cv2
+import numpy as np
+import os
+import json
+import math
+import time
+import threading
+import collections
+
+# 保存形式ごとの拡張子と画質パラメータ
+ENCODE_FORMATS = {
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "png": (".png", cv2.IMWRITE_PNG_COMPRESSION),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+# 保存した異常検知画像のメタデータを記録するファイル名
+METADATA_FILENAME = "alerts.jsonl"
+
+# キューが満杯の場合の動作
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+
+class AlertWriter:
+    """
+    異常検知画像をバックグラウンドで保存するクラス
+    
+    監視ループは submit() でフレームをキューに入れるだけで、エンコードと書き込みは
+    ワーカースレッドが行う。キューには上限があり、満杯の場合は drop_policy に従って
+    最も古いフレーム（drop_oldest）または新しいフレーム（drop_newest）を破棄する。
+    
+    Parameters:
+    - image_format: 保存形式（"jpg", "png", "webp"）
+    - quality: 画質（jpg/webpは0〜100、pngは圧縮レベル0〜9）
+    - max_queue: キューに保持できるフレーム数
+    - drop_policy: キューが満杯の場合の動作（"drop_oldest" または "drop_newest"）
+    - workers: ワーカースレッドの数
+    """
+    def __init__(self, image_format="jpg", quality=95, max_queue=32, drop_policy=DROP_OLDEST, workers=1):
+        if image_format not in ENCODE_FORMATS:
+            raise ValueError(f"対応していない保存形式です: {image_format}")
+        if drop_policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"対応していない破棄方法です: {drop_policy}")
+        
+        self.image_format = image_format
+        self.extension, quality_flag = ENCODE_FORMATS[image_format]
+        self.encode_params = [quality_flag, int(quality)]
+        self.max_queue = max_queue
+        self.drop_policy = drop_policy
+        
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._in_progress = 0
+        self._record_count = 0  # キューにある画像を伴わないメタデータの数（上限には数えない）
+        self._closed = False
+        self._metadata_lock = threading.Lock()
+        
+        # メトリクス
+        self.submitted_count = 0
+        self.written_count = 0
+        self.dropped_count = 0
+        self.error_count = 0
+        self.max_queue_depth = 0
+        self.encode_time_total = 0.0
+        self.encode_time_max = 0.0
+        self.write_time_total = 0.0
+        self.write_time_max = 0.0
+        
+        self._threads = []
+        for i in range(max(1, workers)):
+            thread = threading.Thread(target=self._run, name=f"AlertWriter-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+    
+    @property
+    def queue_depth(self):
+        """キューで待っているフレーム数"""
+        return len(self._queue) - self._record_count
+    
+    def submit(self, path, frame, copy=True, metadata=None):
+        """
+        フレームを保存キューに追加する
+        
+        Parameters:
+        - path: 保存先のパス（拡張子なし、または任意の拡張子。保存形式の拡張子に置き換える）
+        - frame: 保存するフレーム
+        - copy: フレームをコピーしてからキューに入れるかどうか（呼び出し側で描画などを行う場合はTrue）
+        - metadata: 保存後に同じディレクトリの alerts.jsonl に1行追記する辞書（任意）
+        
+        Returns:
+        - 実際に保存されるパス（キューに入れなかった場合はNone）
+        """
+        path = os.path.splitext(path)[0] + self.extension
+        if copy:
+            frame = frame.copy()
+        
+        with self._condition:
+            if self._closed:
+                return None
+            self.submitted_count += 1
+            if self.queue_depth >= self.max_queue:
+                self.dropped_count += 1
+                if self.drop_policy == DROP_NEWEST:
+                    return None
+                # 画像を伴わないメタデータは破棄せず、最も古いフレームを破棄する
+                oldest = next((i for i, (_, queued, _) in enumerate(self._queue) if queued is not None), None)
+                if oldest is None:
+                    return None
+                del self._queue[oldest]
+            self._queue.append((path, frame, metadata))
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            self._condition.notify()
+        return path
+    
+    def submit_record(self, path, metadata):
+        """
+        画像を伴わないメタデータを alerts.jsonl に追記する（キューの順番を保ち、上限による破棄の対象にしない）
+        
+        Parameters:
+        - path: 関連する画像のパス（submit() が返したもの）
+        - metadata: 追記する辞書
+        """
+        with self._condition:
+            if self._closed:
+                return
+            self._queue.append((path, None, metadata))
+            self._record_count += 1
+            self._condition.notify()
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                path, frame, metadata = self._queue.popleft()
+                if frame is None:
+                    self._record_count -= 1
+                self._in_progress += 1
+            
+            try:
+                self._write(path, frame, metadata)
+            finally:
+                with self._condition:
+                    self._in_progress -= 1
+                    self._condition.notify_all()
+    
+    def _write(self, path, frame, metadata=None):
+        if frame is None:
+            try:
+                self._append_metadata(path, metadata)
+            except OSError as e:
+                print(f"異常検知画像のメタデータを書き込めませんでした: {path} ({e})")
+                with self._condition:
+                    self.error_count += 1
+            return
+        
+        try:
+            start = time.perf_counter()
+            ret, buffer = cv2.imencode(self.extension, frame, self.encode_params)
+            encode_time = time.perf_counter() - start
+            if not ret:
+                raise RuntimeError("画像のエンコードに失敗しました")
+            
+            start = time.perf_counter()
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(buffer.tobytes())
+            if metadata is not None:
+                self._append_metadata(path, metadata)
+            write_time = time.perf_counter() - start
+        except Exception as e:
+            print(f"異常検知画像の保存中にエラーが発生しました: {path} ({e})")
+            with self._condition:
+                self.error_count += 1
+            return
+        
+        with self._condition:
+            self.written_count += 1
+            self.encode_time_total += encode_time
+            self.encode_time_max = max(self.encode_time_max, encode_time)
+            self.write_time_total += write_time
+            self.write_time_max = max(self.write_time_max, write_time)
+    
+    def _append_metadata(self, path, metadata):
+        """保存した画像のメタデータを alerts.jsonl に追記する"""
+        record = {"file": os.path.basename(path)}
+        record.update(metadata)
+        line = json.dumps(record, ensure_ascii=False)
+        with self._metadata_lock:
+            with open(os.path.join(os.path.dirname(path), METADATA_FILENAME), "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    
+    def flush(self, timeout=None):
+        """
+        キューのフレームがすべて保存されるまで待つ
+        
+        Returns:
+        - すべて保存できた場合はTrue（タイムアウトした場合はFalse）
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._condition:
+            while self._queue or self._in_progress:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+    
+    def close(self, timeout=10.0):
+        """キューのフレームを保存してからワーカースレッドを終了する"""
+        flushed = self.flush(timeout)
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout=1.0)
+        if not flushed:
+            print(f"警告: 保存しきれなかった異常検知画像があります（{self.queue_depth}枚）")
+        return flushed
+    
+    def metrics(self):
+        """メトリクスを辞書で返す"""
+        with self._condition:
+            written = max(self.written_count, 1)
+            return {
+                "queue_depth": self.queue_depth,
+                "max_queue_depth": self.max_queue_depth,
+                "submitted": self.submitted_count,
+                "written": self.written_count,
+                "dropped": self.dropped_count,
+                "errors": self.error_count,
+                "encode_time_avg_ms": self.encode_time_total / written * 1000,
+                "encode_time_max_ms": self.encode_time_max * 1000,
+                "write_time_avg_ms": self.write_time_total / written * 1000,
+                "write_time_max_ms": self.write_time_max * 1000,
+            }
+
+class AlertDeduplicator:
+    """
+    ほぼ同じ異常検知画像が連続して保存されるのを防ぐクラス
+    
+    フレームの差分ハッシュ（dHash）を最後に保存した画像のハッシュと比較し、
+    異なるビット数が max_distance 以下であれば保存を省略する。
+    ただし最後の保存から keyframe_interval 秒が経過した場合は必ず保存する。
+    
+    Parameters:
+    - max_distance: 同じ場面とみなすハッシュの最大距離（ビット数）
+    - keyframe_interval: 変化がなくても保存する間隔（秒）。Noneの場合は変化がない限り保存しない
+    - hash_size: ハッシュの一辺の大きさ（hash_size * hash_size ビット）
+    """
+    def __init__(self, max_distance=12, keyframe_interval=60.0, hash_size=16):
+        self.max_distance = max_distance
+        self.keyframe_interval = keyframe_interval
+        self.hash_size = hash_size
+        self.suppressed_total = 0
+        self.suppressed_since_last = 0
+        self.last_distance = None
+        self.reset()
+    
+    def reset(self):
+        """
+        最後に保存した画像の情報を破棄する（異常状態が終わったときなど）
+        
+        Returns:
+        - 最後の保存以降に省略したフレーム数（次の保存では報告されないため、呼び出し側で記録する）
+        """
+        suppressed = self.suppressed_since_last
+        self._last_hash = None
+        self._last_saved_at = None
+        self.suppressed_since_last = 0
+        return suppressed
+    
+    def compute_hash(self, frame):
+        """フレームの差分ハッシュ（bool配列）を返す"""
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if frame.ndim == 3 else frame
+        small = cv2.resize(gray, (self.hash_size + 1, self.hash_size), interpolation=cv2.INTER_AREA)
+        return small[:, 1:] > small[:, :-1]
+    
+    def should_save(self, frame, timestamp=None):
+        """
+        フレームを保存すべきかどうかを判断する
+        
+        保存すべきと判断した場合は、そのフレームを最後に保存した画像として記録する。
+        保存しない場合は suppressed_since_last と suppressed_total を加算する。
+        
+        Returns:
+        - save: 保存すべき場合はTrue
+        - suppressed: 保存する場合、前回の保存以降に省略したフレーム数
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        
+        frame_hash = self.compute_hash(frame)
+        if self._last_hash is not None:
+            self.last_distance = int(np.count_nonzero(frame_hash != self._last_hash))
+            is_keyframe = (self.keyframe_interval is not None and
+                           timestamp - self._last_saved_at >= self.keyframe_interval)
+            if self.last_distance <= self.max_distance and not is_keyframe:
+                self.suppressed_since_last += 1
+                self.suppressed_total += 1
+                return False, 0
+        
+        suppressed = self.suppressed_since_last
+        self._last_hash = frame_hash
+        self._last_saved_at = timestamp
+        self.suppressed_since_last = 0
+        return True, suppressed
+
+class FrameRing:
+    """
+    直近のフレームを事前に確保した配列に保持するリングバッファ
+    
+    フレームは (容量, 高さ, 幅, 3) の1つの numpy 配列に上書きしながら保存するため、
+    フレームごとのメモリ確保は行わない。解像度が異なるフレームは保存時に縮小する。
+    フレームには通し番号を付け、読み込み側は番号で順番に取り出す。
+    
+    Parameters:
+    - seconds: 保持する時間（秒）
+    - fps: 保持するフレームレート（これより短い間隔で渡されたフレームは保存しない）
+    - resolution: 保存する解像度（幅, 高さ）
+    - max_bytes: 配列の大きさの上限（バイト）。超える場合は保持する時間を短くする
+    """
+    def __init__(self, seconds, fps=10.0, resolution=(640, 360), max_bytes=None):
+        width, height = resolution
+        frame_bytes = width * height * 3
+        capacity = max(2, int(math.ceil(seconds * fps)))
+        if max_bytes is not None and capacity * frame_bytes > max_bytes:
+            capacity = max(2, int(max_bytes // frame_bytes))
+            print(f"警告: メモリの上限のため、保持する時間を {capacity / fps:.1f}秒 に短くしました")
+        
+        self.fps = fps
+        self.resolution = (width, height)
+        self.capacity = capacity
+        self.frames = np.zeros((capacity, height, width, 3), np.uint8)
+        self.timestamps = np.zeros(capacity)
+        self.sequence = 0  # 次に保存するフレームの通し番号
+        self._min_spacing = 0.9 / fps
+        self._last_timestamp = None
+        self._condition = threading.Condition()
+    
+    @property
+    def seconds(self):
+        """保持できる時間（秒）"""
+        return self.capacity / self.fps
+    
+    @property
+    def nbytes(self):
+        """確保している配列の大きさ（バイト）"""
+        return self.frames.nbytes + self.timestamps.nbytes
+    
+    def push(self, frame, timestamp=None):
+        """
+        フレームを保存する（前回の保存から 1/fps 秒経っていない場合は何もしない）
+        
+        Returns:
+        - 保存した場合はTrue
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if self._last_timestamp is not None and timestamp - self._last_timestamp < self._min_spacing:
+            return False
+        
+        with self._condition:
+            index = self.sequence % self.capacity
+            slot = self.frames[index]
+            if frame.shape == slot.shape:
+                np.copyto(slot, frame)
+            else:
+                cv2.resize(frame, self.resolution, dst=slot, interpolation=cv2.INTER_AREA)
+            self.timestamps[index] = timestamp
+            self.sequence += 1
+            self._last_timestamp = timestamp
+            self._condition.notify_all()
+        return True
+    
+    def find(self, timestamp):
+        """timestamp 以降の最初のフレームの通し番号を返す（ない場合は次に保存される番号）"""
+        with self._condition:
+            oldest = max(0, self.sequence - self.capacity)
+            sequences = np.arange(oldest, self.sequence)
+            later = self.timestamps[sequences % self.capacity] >= timestamp
+            return int(sequences[np.argmax(later)]) if later.any() else self.sequence
+    
+    def read(self, sequence, out):
+        """
+        通し番号のフレームを out にコピーする
+        
+        すでに上書きされていた場合は、残っている最も古いフレームを読む
+        
+        Returns:
+        - (読んだフレームの通し番号, 時刻)。まだ保存されていない場合は時刻がNone
+        """
+        with self._condition:
+            if sequence >= self.sequence:
+                return sequence, None
+            sequence = max(sequence, self.sequence - self.capacity)
+            index = sequence % self.capacity
+            np.copyto(out, self.frames[index])
+            return sequence, float(self.timestamps[index])
+    
+    def wait(self, sequence, timeout):
+        """通し番号のフレームが保存されるまで最大 timeout 秒待つ"""
+        with self._condition:
+            if self.sequence <= sequence:
+                self._condition.wait(timeout)
+            return self.sequence > sequence
+    
+    def wake(self):
+        """wait() で待っているスレッドを起こす"""
+        with self._condition:
+            self._condition.notify_all()
+
+class ClipRecorder:
+    """
+    異常検知の前後のフレームを動画として保存するクラス
+    
+    trigger() で保存を依頼すると、ワーカースレッドが FrameRing から pre_roll 秒前以降の
+    フレームを順番に読み出してエンコードし、post_roll 秒後のフレームまで書き込む。
+    保存中に依頼された場合は順番に処理する（待ちが max_pending を超えた依頼は破棄する）。
+    
+    動画は ring.fps で書き込み、各フレームは取得時刻に合わせて配置する。フレームの間隔が
+    ring.fps より長い場合（読み込みスレッドがなく、チェックごとにしかフレームが届かない場合など）は
+    直前のフレームを繰り返し、短い場合は間引くため、再生速度と動画の長さは実際の時間と一致する。
+    
+    Parameters:
+    - ring: フレームを読み出す FrameRing
+    - pre_roll: 異常検知より前に含める時間（秒）
+    - post_roll: 異常検知より後に含める時間（秒）
+    - fourcc: 動画のコーデック
+    - max_pending: 保存待ちにできる依頼の数
+    """
+    def __init__(self, ring, pre_roll=5.0, post_roll=5.0, fourcc="mp4v", max_pending=4):
+        self.ring = ring
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.fourcc = fourcc
+        self.max_pending = max_pending
+        
+        self.clips_written = 0
+        self.frames_written = 0
+        self.frames_lost = 0
+        self.dropped_count = 0
+        self.error_count = 0
+        
+        width, height = ring.resolution
+        self._buffer = np.zeros((height, width, 3), np.uint8)
+        self._previous = np.zeros((height, width, 3), np.uint8)
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="ClipRecorder", daemon=True)
+        self._thread.start()
+    
+    def trigger(self, path, timestamp=None):
+        """
+        timestamp の前後の動画の保存を依頼する
+        
+        Returns:
+        - 保存先のパス（依頼を破棄した場合はNone）
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        with self._condition:
+            if self._closed or len(self._queue) >= self.max_pending:
+                self.dropped_count += 1
+                return None
+            self._queue.append((path, timestamp))
+            self._condition.notify()
+        return path
+    
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                path, timestamp = self._queue.popleft()
+            try:
+                self._record(path, timestamp)
+            except Exception as e:
+                print(f"異常検知動画の保存中にエラーが発生しました: {path} ({e})")
+                self.error_count += 1
+    
+    def _record(self, path, timestamp):
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*self.fourcc), self.ring.fps, self.ring.resolution)
+        if not writer.isOpened():
+            raise RuntimeError("動画ファイルを開けませんでした")
+        
+        end_time = timestamp + self.post_roll
+        sequence = self.ring.find(timestamp - self.pre_roll)
+        frames = 0  # 動画に使ったフレーム数
+        written = 0  # 書き込んだ動画のフレーム数（繰り返しを含む）
+        start_time = None
+        try:
+            while True:
+                read_sequence, frame_time = self.ring.read(sequence, self._buffer)
+                if frame_time is None:
+                    # 次のフレームを待つ（終了時や取得元が止まった場合は、そこまでで保存する）
+                    if self._closed or time.time() > end_time + 2.0:
+                        break
+                    self.ring.wait(sequence, 0.5)
+                    continue
+                if frame_time > end_time:
+                    # 最後のフレームは post_roll の終わりまで表示する
+                    if start_time is not None:
+                        written = self._write_until(writer, written, (end_time - start_time) * self.ring.fps)
+                    break
+                self.frames_lost += read_sequence - sequence
+                sequence = read_sequence + 1
+                if start_time is None:
+                    start_time = frame_time
+                # 前のフレームをこのフレームの時刻まで繰り返し、時刻が進んでいれば書き込む
+                position = (frame_time - start_time) * self.ring.fps
+                written = self._write_until(writer, written, position)
+                if written <= position:
+                    writer.write(self._buffer)
+                    written += 1
+                    frames += 1
+                self._previous[:] = self._buffer
+        finally:
+            writer.release()
+        self.clips_written += 1
+        self.frames_written += frames
+        print(f"異常検知動画を保存しました: {path} ({frames}フレーム, {written / self.ring.fps:.1f}秒)")
+    
+    def _write_until(self, writer, written, position):
+        """直前のフレームを、書き込んだフレーム数が position に達するまで繰り返し書き込む"""
+        if written == 0:
+            return written
+        while written < int(position):
+            writer.write(self._previous)
+            written += 1
+        return written
+    
+    def close(self, timeout=None):
+        """
+        保存待ちの動画を書き込んでからワーカースレッドを終了する
+        
+        まだ届いていない post_roll のフレームは待たず、保持しているフレームまでで保存する
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.ring.wake()
+        self._thread.join(timeout)
+    
+    def metrics(self):
+        """メトリクスを辞書で返す"""
+        return {
+            "clips_written": self.clips_written,
+            "frames_written": self.frames_written,
+            "frames_lost": self.frames_lost,
+            "dropped": self.dropped_count,
+            "errors": self.error_count,
+        }
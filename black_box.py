@@ -0,0 +1,360 @@
+import cv2
+import numpy as np
+import os
+import json
+import time
+import bisect
+import argparse
+
+from frame_sources import FrameSource
+from camera_monitor import is_white_cat_plush, DetectionParams, DEFAULT_PARAMS
+from check_log import find_intervals, format_time, parse_time
+
+# 記録ディレクトリ内のファイル名
+HEADER_FILENAME = "blackbox.json"
+FRAMES_FILENAME = "frames.bin"
+INDEX_FILENAME = "index.bin"
+
+# スロットごとのインデックス（sequence が -1 のスロットは空または書き込み中）
+INDEX_DTYPE = np.dtype([("sequence", "<i8"), ("timestamp", "<f8")])
+
+def allocate_file(path, size):
+    """ファイルを指定の大きさで作成し、可能な場合はディスク領域を確保する"""
+    with open(path, "wb") as f:
+        f.truncate(size)
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(f.fileno(), 0, size)
+
+class BlackBoxRecorder:
+    """
+    縮小したフレームを固定長のスロットのリングファイルに書き続けるクラス
+    
+    frames.bin は (スロット数, 高さ, 幅, 3) の配列、index.bin はスロットごとの
+    (通し番号, 時刻) で、どちらも作成時に最大の大きさで確保してメモリマップで書き込む。
+    ディスクの使用量は「スロット数 × 幅 × 高さ × 3 バイト」から増えない。
+    同じ構成の記録が既にある場合は、その続きから書き込む。
+    
+    スロットを書き換える間はインデックスの通し番号を -1 にしておき、読み込み側が
+    書きかけのフレームを使わないようにする。
+    
+    Parameters:
+    - directory: 記録ディレクトリ
+    - seconds: 記録する時間（秒）。max_bytes を指定した場合はそちらを優先する
+    - fps: 記録するフレームレート（これより短い間隔で渡されたフレームは記録しない）
+    - resolution: 記録する解像度（幅, 高さ）
+    - max_bytes: frames.bin の大きさの上限（バイト、任意）
+    - source_resolution: 元の映像の解像度（再生時に面積の閾値を換算するために記録する）
+    - camera: 記録するカメラ名
+    - flush_interval: メモリマップの内容をディスクに書き出す間隔（秒）
+    """
+    def __init__(self, directory, seconds=3600.0, fps=1.0, resolution=(320, 180), max_bytes=None,
+                 source_resolution=None, camera="camera", flush_interval=10.0):
+        width, height = resolution
+        frame_bytes = width * height * 3
+        slots = int(max_bytes // frame_bytes) if max_bytes is not None else int(round(seconds * fps))
+        if slots < 2:
+            raise ValueError("記録できるフレーム数が少なすぎます")
+        
+        self.directory = directory
+        self.fps = fps
+        self.resolution = (width, height)
+        self.slots = slots
+        self.flush_interval = flush_interval
+        self.frames_written = 0
+        self._min_spacing = 0.9 / fps
+        self._last_timestamp = None
+        self._last_flush = time.time()
+        
+        header = {
+            "resolution": [width, height],
+            "slots": slots,
+            "fps": fps,
+            "source_resolution": list(source_resolution) if source_resolution else None,
+            "camera": camera,
+        }
+        os.makedirs(directory, exist_ok=True)
+        header_path = os.path.join(directory, HEADER_FILENAME)
+        frames_path = os.path.join(directory, FRAMES_FILENAME)
+        index_path = os.path.join(directory, INDEX_FILENAME)
+        if not self._matches(header_path, header) or not os.path.exists(frames_path):
+            print(f"記録ファイルを確保しています: {frames_path} ({slots * frame_bytes / 1024 / 1024:.0f}MB)")
+            allocate_file(frames_path, slots * frame_bytes)
+            allocate_file(index_path, slots * INDEX_DTYPE.itemsize)
+            self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode="r+", shape=(slots,))
+            self.index["sequence"] = -1
+            self.index.flush()
+            with open(header_path, "w", encoding="utf-8") as f:
+                json.dump(header, f, ensure_ascii=False, indent=2)
+        else:
+            self.index = np.memmap(index_path, dtype=INDEX_DTYPE, mode="r+", shape=(slots,))
+        self.frames = np.memmap(frames_path, dtype=np.uint8, mode="r+", shape=(slots, height, width, 3))
+        self.sequence = int(self.index["sequence"].max()) + 1  # 次に書き込む通し番号
+    
+    @staticmethod
+    def _matches(header_path, header):
+        """既存の記録が同じ構成かどうか"""
+        try:
+            with open(header_path, encoding="utf-8") as f:
+                existing = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return all(existing.get(key) == header[key] for key in ("resolution", "slots"))
+    
+    @property
+    def nbytes(self):
+        """ディスク上の大きさ（バイト）"""
+        return self.frames.nbytes + self.index.nbytes
+    
+    def push(self, frame, timestamp=None):
+        """
+        フレームを記録する（前回の記録から 1/fps 秒経っていない場合は何もしない）
+        
+        Returns:
+        - 記録した場合はTrue
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if self._last_timestamp is not None and timestamp - self._last_timestamp < self._min_spacing:
+            return False
+        
+        slot = self.sequence % self.slots
+        entry = self.index[slot:slot + 1]
+        entry["sequence"] = -1
+        target = self.frames[slot]
+        if frame.shape == target.shape:
+            np.copyto(target, frame)
+        else:
+            cv2.resize(frame, self.resolution, dst=target, interpolation=cv2.INTER_AREA)
+        entry["timestamp"] = timestamp
+        entry["sequence"] = self.sequence
+        
+        self.sequence += 1
+        self.frames_written += 1
+        self._last_timestamp = timestamp
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+        return True
+    
+    def flush(self):
+        """メモリマップの内容をディスクに書き出す"""
+        self._last_flush = time.time()
+        self.frames.flush()
+        self.index.flush()
+    
+    def close(self):
+        """記録を書き出して閉じる"""
+        self.flush()
+        del self.frames
+        del self.index
+
+class BlackBoxReader:
+    """
+    BlackBoxRecorder の記録を読み込むクラス
+    
+    記録されているフレームは古い順の位置（0 〜 len - 1）で扱う。時刻は位置の順に増えるため、
+    seek() はインデックスの二分探索で O(log n) で位置を求める。記録中のファイルも読める
+    （新しく書かれたフレームを含めるには refresh() を呼ぶ）。
+    
+    Parameters:
+    - directory: 記録ディレクトリ
+    """
+    def __init__(self, directory):
+        with open(os.path.join(directory, HEADER_FILENAME), encoding="utf-8") as f:
+            self.header = json.load(f)
+        width, height = self.header["resolution"]
+        self.directory = directory
+        self.resolution = (width, height)
+        self.slots = self.header["slots"]
+        self.fps = self.header["fps"]
+        self.frames = np.memmap(os.path.join(directory, FRAMES_FILENAME), dtype=np.uint8, mode="r",
+                                shape=(self.slots, height, width, 3))
+        self.index = np.memmap(os.path.join(directory, INDEX_FILENAME), dtype=INDEX_DTYPE, mode="r",
+                               shape=(self.slots,))
+        self.refresh()
+    
+    def refresh(self):
+        """最新の通し番号を読み直す"""
+        latest = int(self.index["sequence"].max())
+        self.first_sequence = max(0, latest - self.slots + 1)
+        self.end_sequence = latest + 1
+    
+    def __len__(self):
+        return self.end_sequence - self.first_sequence
+    
+    def __getitem__(self, position):
+        """位置のフレームの時刻（上書きされたフレームは -inf）"""
+        sequence = self.first_sequence + position
+        entry = self.index[sequence % self.slots]
+        if entry["sequence"] == sequence:
+            return float(entry["timestamp"])
+        # 一致しないのは refresh() 以降に上書きされた（または上書き中の）最も古い側のスロットだけなので、
+        # 最も古いものとして扱えば時刻の順序は保たれる
+        return float("-inf")
+    
+    def time_range(self):
+        """記録されている最初と最後のフレームの時刻を返す（記録がない場合はNone）"""
+        if len(self) == 0:
+            return None
+        return self[0], self[len(self) - 1]
+    
+    def seek(self, timestamp):
+        """timestamp 以降の最初のフレームの位置を返す（ない場合は len）"""
+        return bisect.bisect_left(self, timestamp)
+    
+    def read(self, position, out=None):
+        """
+        位置のフレームを読み込む
+        
+        Returns:
+        - (時刻, フレーム)。上書きされていた場合は (None, None)
+        """
+        sequence = self.first_sequence + position
+        slot = sequence % self.slots
+        if self.index[slot]["sequence"] != sequence:
+            return None, None
+        timestamp = float(self.index[slot]["timestamp"])
+        if out is None:
+            out = np.empty(self.frames.shape[1:], np.uint8)
+        np.copyto(out, self.frames[slot])
+        # コピー中に上書きされていないことを確認する
+        if self.index[slot]["sequence"] != sequence:
+            return None, None
+        return timestamp, out
+    
+    def detection_params(self, params=DEFAULT_PARAMS):
+        """
+        記録の解像度で使う検出パラメータを返す
+        
+        面積の閾値は元の映像の解像度で決めたものなので、フレーム面積に対する比率に換算する
+        """
+        source_resolution = self.header.get("source_resolution")
+        if params.area_ratio is not None or not source_resolution:
+            return params
+        return params.replace(area_ratio=params.area_threshold / (source_resolution[0] * source_resolution[1]))
+
+class BlackBoxSource(FrameSource):
+    """
+    BlackBoxRecorder の記録をフレームの取得元として読み込む（monitor_camera での再生用）
+    
+    Parameters:
+    - directory: 記録ディレクトリ
+    - start, end: 再生する時刻の範囲（time.time() の値、任意）
+    """
+    def __init__(self, directory, start=None, end=None):
+        super().__init__(f"blackbox:{directory}")
+        self.reader = BlackBoxReader(directory)
+        self.position = self.reader.seek(start) if start is not None else 0
+        self.end_position = self.reader.seek(end) if end is not None else len(self.reader)
+        self.timestamp = None
+    
+    @property
+    def frame_count(self):
+        return max(0, self.end_position - self.position)
+    
+    def isOpened(self):
+        return len(self.reader) > 0
+    
+    def read(self):
+        while self.position < self.end_position:
+            timestamp, frame = self.reader.read(self.position)
+            self.position += 1
+            if frame is not None:
+                self.timestamp = timestamp
+                return True, frame
+        self.finished = True
+        return False, None
+
+def replay(reader, start=None, end=None, params=DEFAULT_PARAMS, step=1, verbose=False):
+    """
+    記録を検出処理にかけ、(時刻, 判定, 信頼度) のリストを返す
+    
+    Parameters:
+    - reader: BlackBoxReader
+    - start, end: 対象とする時刻の範囲（time.time() の値、任意）
+    - params: 検出パラメータ（面積の閾値は記録の解像度に換算する）
+    - step: 何フレームごとに判定するか
+    - verbose: フレームごとの判定を表示するかどうか
+    """
+    params = reader.detection_params(params)
+    first = reader.seek(start) if start is not None else 0
+    last = reader.seek(end) if end is not None else len(reader)
+    buffer = np.empty(reader.frames.shape[1:], np.uint8)
+    results = []
+    for position in range(first, last, step):
+        timestamp, frame = reader.read(position, buffer)
+        if frame is None:
+            continue
+        is_cat, confidence, details = is_white_cat_plush(frame, params)
+        results.append((timestamp, is_cat, confidence))
+        if verbose:
+            print(f"{format_time(timestamp)} {'Normal' if is_cat else 'Alert'} "
+                  f"(信頼度: {confidence:.2f}, 白色率: {details['white_percentage']:.1f}%)")
+    return results
+
+def print_info(reader):
+    """記録の概要を表示する"""
+    header = reader.header
+    width, height = reader.resolution
+    print(f"カメラ: {header.get('camera')}")
+    print(f"解像度: {width}x{height} / {reader.fps}fps / スロット数: {reader.slots} "
+          f"({reader.frames.nbytes / 1024 / 1024:.0f}MB)")
+    time_range = reader.time_range()
+    if time_range is None:
+        print("記録されたフレームがありません")
+        return
+    print(f"記録: {len(reader)}フレーム ({format_time(time_range[0])} 〜 {format_time(time_range[1])})")
+
+def main():
+    parser = argparse.ArgumentParser(description="常時記録（ブラックボックス）の確認と再生")
+    parser.add_argument("directory", help="記録ディレクトリ（例: camera_logs/blackbox）")
+    parser.add_argument("--at", default=None, help="この日時のフレームを画像として保存する（YYYY-MM-DD HH:MM:SS）")
+    parser.add_argument("--output", default="blackbox_frame.jpg", help="--at で保存する画像のパス")
+    parser.add_argument("--replay", action="store_true", help="記録を検出処理にかけて異常区間を表示する")
+    parser.add_argument("--since", default=None, help="再生の開始日時（YYYY-MM-DD [HH:MM:SS]）")
+    parser.add_argument("--until", default=None, help="再生の終了日時（YYYY-MM-DD [HH:MM:SS]）")
+    parser.add_argument("--step", type=int, default=1, help="何フレームごとに判定するか")
+    parser.add_argument("--params", default=None, help="検出パラメータのJSONファイル")
+    parser.add_argument("--verbose", action="store_true", help="フレームごとの判定を表示する")
+    args = parser.parse_args()
+    
+    reader = BlackBoxReader(args.directory)
+    print_info(reader)
+    
+    if args.at:
+        position = reader.seek(parse_time(args.at))
+        if position >= len(reader):
+            print("指定した日時以降のフレームがありません")
+        else:
+            timestamp, frame = reader.read(position)
+            if frame is None:
+                print("フレームが上書きされていました")
+            else:
+                cv2.imwrite(args.output, frame)
+                print(f"{format_time(timestamp)} のフレームを保存しました: {args.output}")
+    
+    if args.replay:
+        params = DEFAULT_PARAMS
+        if args.params:
+            with open(args.params, encoding="utf-8") as f:
+                params = DetectionParams(**json.load(f))
+        start = time.perf_counter()
+        results = replay(reader, parse_time(args.since), parse_time(args.until), params,
+                         step=args.step, verbose=args.verbose)
+        elapsed = time.perf_counter() - start
+        if not results:
+            print("対象のフレームがありません")
+            return
+        timestamps = np.array([r[0] for r in results])
+        alerts = np.array([not r[1] for r in results])
+        print(f"\n判定: {len(results)}フレーム / {elapsed:.1f}秒 ({len(results) / max(elapsed, 1e-9):.0f} FPS)")
+        print(f"正常: {len(results) - int(alerts.sum())}フレーム / 異常: {int(alerts.sum())}フレーム")
+        # 記録が途切れた位置でも区間を区切る
+        intervals = find_intervals(timestamps, alerts, max_gap=max(10.0, 5 * args.step / reader.fps))
+        print(f"異常区間: {len(intervals)}件")
+        for begin, finish, count in intervals[:20]:
+            print(f"  {format_time(begin)} 〜 {format_time(finish)} ({finish - begin:.0f}秒, {count}フレーム)")
+        if len(intervals) > 20:
+            print(f"  ... 他 {len(intervals) - 20}件")
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,15 @@ import platform
 import subprocess
 import datetime
 import os
+import sys
+import threading
+import collections
+import copy
+
+from frame_sources import CameraSource, open_frame_source
+from notifier import EVENT_ALERT, EVENT_NORMAL, EVENT_CAPTURE_FAILURE, EVENT_CAPTURE_RECOVERED
+from monitor_options import CaptureOptions, ScheduleOptions, AlertOptions
+from monitor_features import MonitorFeatures
 
 def ensure_dir(directory):
     """ディレクトリが存在することを確認し、存在しない場合は作成する"""
@@ -13,128 +22,489 @@ def ensure_dir(directory):
         print(f"ディレクトリを作成しました: {directory}")
     return directory
 
-def close_camera_app():
-    """カメラアプリを閉じる（Windowsのみ）"""
-    if platform.system() == 'Windows':
+def close_camera_app(timeout=2.0):
+    """
+    カメラアプリを閉じる（Windowsのみ）
+    
+    アプリが起動していた場合だけ、プロセスが終了してカメラが解放されるまで最大timeout秒待つ
+    
+    Returns:
+    - 待った時間（秒）
+    """
+    if platform.system() != 'Windows':
+        return 0.0
+    start = time.perf_counter()
+    try:
+        # タスクキルコマンドを使用してカメラアプリを終了（起動していなければ失敗する）
+        result = subprocess.run(['taskkill', '/f', '/im', 'WindowsCamera.exe'],
+                                capture_output=True, text=True)
+        if result.returncode != 0:
+            return time.perf_counter() - start
+        
+        print("カメラアプリを閉じています...")
+        # プロセスが終了する（カメラリソースが解放される）まで待つ
+        while time.perf_counter() - start < timeout:
+            tasks = subprocess.run(['tasklist', '/fi', 'IMAGENAME eq WindowsCamera.exe', '/nh'],
+                                   capture_output=True, text=True)
+            if 'WindowsCamera.exe' not in tasks.stdout:
+                break
+            time.sleep(0.1)
+        print(f"カメラアプリを閉じました（{time.perf_counter() - start:.1f}秒）")
+    except Exception as e:
+        print(f"カメラアプリを閉じる際にエラーが発生しました: {e}")
+    return time.perf_counter() - start
+
+# Linuxのカメラデバイスの情報
+VIDEO4LINUX_DIR = "/sys/class/video4linux"
+
+# デバイスの変化を検知できない環境（Windows）で一覧を再利用する時間（秒）
+CAMERA_LIST_TTL = 60.0
+
+# realtime=False でもカメラからの取得に失敗した場合に、次に読み込むまで待つ時間（秒）
+CAPTURE_RETRY_DELAY = 0.5
+
+# カメラデバイスの一覧のキャッシュ
+_camera_cache = {"devices": None, "key": None, "time": 0.0}
+
+def _list_windows_cameras():
+    """WMICでカメラデバイスを取得する（一覧の順番をデバイス番号とみなす）"""
+    devices = []
+    # WMICコマンドを使用してカメラデバイスを取得
+    result = subprocess.run(
+        ['wmic', 'path', 'Win32_PnPEntity', 'where', "PNPClass='Image'", 'get', 'Name,Status'],
+        capture_output=True, text=True, check=True
+    )
+    
+    lines = result.stdout.strip().split('\n')
+    # ヘッダー行をスキップ
+    for line in lines[1:]:
+        if line.strip():
+            # 名前とステータスを分離
+            parts = line.strip().split('  ')
+            if len(parts) >= 1:
+                name = parts[0].strip()
+                status = "OK" if len(parts) > 1 else "Unknown"
+                devices.append((len(devices), name, status))
+    return devices
+
+def _list_linux_cameras():
+    """/sys/class/video4linux からカメラデバイスを取得する（videoN の N がデバイス番号）"""
+    devices = []
+    for entry in os.listdir(VIDEO4LINUX_DIR):
+        if not entry.startswith("video") or not entry[5:].isdigit():
+            continue
+        path = os.path.join(VIDEO4LINUX_DIR, entry)
+        # UVCカメラはメタデータ用のノードも作るため、各デバイスの最初のノード（index 0）だけを使う
         try:
-            print("カメラアプリを閉じています...")
-            # タスクキルコマンドを使用してカメラアプリを終了
-            subprocess.run(['taskkill', '/f', '/im', 'WindowsCamera.exe'], 
-                          capture_output=True, text=True)
-            time.sleep(2)  # カメラリソースが解放されるのを待つ
-            print("カメラアプリを閉じました")
-        except Exception as e:
-            print(f"カメラアプリを閉じる際にエラーが発生しました: {e}")
-
-def get_camera_list():
-    """システムに接続されているカメラのリストを取得する"""
-    camera_list = []
-    
-    # Windowsの場合
-    if platform.system() == 'Windows':
+            with open(os.path.join(path, "index")) as f:
+                if f.read().strip() != "0":
+                    continue
+        except OSError:
+            pass
         try:
-            # WMICコマンドを使用してカメラデバイスを取得
-            result = subprocess.run(
-                ['wmic', 'path', 'Win32_PnPEntity', 'where', "PNPClass='Image'", 'get', 'Name,Status'],
-                capture_output=True, text=True, check=True
-            )
-            
-            lines = result.stdout.strip().split('\n')
-            # ヘッダー行をスキップ
-            for line in lines[1:]:
-                if line.strip():
-                    # 名前とステータスを分離
-                    parts = line.strip().split('  ')
-                    if len(parts) >= 1:
-                        name = parts[0].strip()
-                        status = "OK" if len(parts) > 1 else "Unknown"
-                        camera_list.append((name, status))
-            
-            print(f"検出されたカメラデバイス: {len(camera_list)}")
-            for i, (name, status) in enumerate(camera_list):
-                print(f"  {i}: {name} ({status})")
+            with open(os.path.join(path, "name")) as f:
+                name = f.read().strip()
+        except OSError:
+            name = entry
+        devices.append((int(entry[5:]), name, "OK"))
+    return sorted(devices)
+
+def _camera_list_key():
+    """デバイスの構成が変わったかどうかを判断するためのキー（取得できない環境ではNone）"""
+    if os.path.isdir(VIDEO4LINUX_DIR):
+        return tuple(sorted(os.listdir(VIDEO4LINUX_DIR)))
+    return None
+
+def invalidate_camera_list():
+    """カメラデバイスの一覧のキャッシュを破棄する（カメラを抜き差しした場合など）"""
+    _camera_cache["devices"] = None
+
+def get_camera_devices(refresh=False):
+    """
+    システムに接続されているカメラを (デバイス番号, 名前, 状態) のリストで取得する
+    
+    一覧はキャッシュし、Linuxではデバイスの構成が変わったとき、それ以外では
+    CAMERA_LIST_TTL 秒が経過したときだけ取得し直す
+    
+    Parameters:
+    - refresh: Trueの場合はキャッシュを使わずに取得し直す
+    """
+    key = _camera_list_key()
+    cached = _camera_cache["devices"]
+    if (not refresh and cached is not None and key == _camera_cache["key"] and
+            (key is not None or time.time() - _camera_cache["time"] < CAMERA_LIST_TTL)):
+        return list(cached)
+    
+    devices = []
+    try:
+        if platform.system() == 'Windows':
+            devices = _list_windows_cameras()
+        elif key is not None:
+            devices = _list_linux_cameras()
+    except Exception as e:
+        print(f"カメラリストの取得中にエラーが発生しました: {e}")
+        return devices
+    
+    print(f"検出されたカメラデバイス: {len(devices)}")
+    for index, name, status in devices:
+        print(f"  {index}: {name} ({status})")
+    _camera_cache.update(devices=devices, key=key, time=time.time())
+    return list(devices)
+
+def get_camera_list(refresh=False):
+    """システムに接続されているカメラを (名前, 状態) のリストで取得する"""
+    return [(name, status) for _, name, status in get_camera_devices(refresh)]
+
+def find_camera_index(camera_name, refresh=False):
+    """
+    名前に camera_name を含むカメラのデバイス番号を返す
+    
+    Returns:
+    - デバイス番号（見つからない場合はNone）
+    """
+    for index, name, _ in get_camera_devices(refresh):
+        if camera_name.lower() in name.lower():
+            return index
+    return None
+
+# 絶対値の面積閾値（ピクセル）を決めたときの基準解像度
+REFERENCE_RESOLUTION = (640, 360)
+
+# OpenCVの8ビットHSVでの色相の範囲（0〜179）
+HUE_MAX = 179
+
+class WhiteColorTable:
+    """
+    HSVの白色の閾値を、BGRから直接マスクを作るための参照表に変換したもの
+    
+    色相の範囲を制限しない閾値では、HSVの判定は V = max(B, G, R) と S（最大値と最小値の差の比率）
+    だけで決まる。そこで最大値ごとに許される最小値の範囲を256要素の表にしておき、
+    フレームからはチャンネルの最大値・最小値を求めて表と比較するだけでマスクを作る。
+    HSV画像を作らず、結果は cvtColor + inRange と完全に一致する。
+    
+    色相の範囲を制限した閾値では使えない（usable がFalse）。
+    
+    Parameters:
+    - lower_white: HSV色空間での白色の下限 (H, S, V)
+    - upper_white: HSV色空間での白色の上限 (H, S, V)
+    """
+    def __init__(self, lower_white, upper_white):
+        self.key = (tuple(int(v) for v in lower_white), tuple(int(v) for v in upper_white))
+        lower, upper = np.array(self.key[0]), np.array(self.key[1])
+        self.usable = bool(lower[0] <= 0 and upper[0] >= HUE_MAX)
+        self.min_lower = None
+        self.min_upper = None
+        self._local = threading.local()
+        if not self.usable:
+            return
         
-        except Exception as e:
-            print(f"カメラリストの取得中にエラーが発生しました: {e}")
+        # 最大値 v、残りの2チャンネルが m の色をHSVの閾値で判定した表 (v, m) を作る
+        values = np.arange(256, dtype=np.uint8)
+        max_values = np.repeat(values, 256).reshape(256, 256)
+        min_values = np.tile(values, 256).reshape(256, 256)
+        colors = np.dstack([max_values, min_values, min_values])
+        accepted = cv2.inRange(cv2.cvtColor(colors, cv2.COLOR_BGR2HSV), lower, upper) > 0
+        accepted &= min_values <= max_values
+        
+        # 最大値ごとに許される最小値の範囲 [min_lower, min_upper] を求める（許される値がない場合は空の範囲）
+        self.min_lower = np.full(256, 255, np.uint8)
+        min_upper = np.zeros(256, np.uint8)
+        for v in range(256):
+            allowed = np.flatnonzero(accepted[v])
+            if len(allowed) == 0:
+                continue
+            if allowed[-1] - allowed[0] + 1 != len(allowed):
+                # 範囲が連続しない場合は表にできない（通常は起こらない）
+                self.usable = False
+                return
+            self.min_lower[v], min_upper[v] = allowed[0], allowed[-1]
+        
+        # 許される値がない最大値は下限（255）との比較で除外できるため、上限の比較は
+        # Sの下限がある場合や最大値255を除外する場合だけ行う
+        valid = accepted.any(axis=1)
+        if np.any(min_upper[valid] < values[valid]) or not valid[255]:
+            self.min_upper = min_upper
     
-    return camera_list
+    def get_workspace(self, shape):
+        """途中結果を書き込むバッファを返す（フレームの大きさごと、スレッドごとに使い回す）"""
+        workspace = getattr(self._local, "workspace", None)
+        if workspace is None or workspace[0].shape != shape:
+            workspace = [np.empty(shape, np.uint8) for _ in range(6)]
+            self._local.workspace = workspace
+        return workspace
+    
+    def compute_mask(self, frame):
+        """BGRのフレームから白色のマスクを作成する"""
+        # 大きなフレームでは途中結果の確保のほうが計算より時間がかかるため、バッファを使い回す
+        blue, green, red, max_value, min_value, bound = self.get_workspace(frame.shape[:2])
+        cv2.split(frame, [blue, green, red])
+        cv2.max(blue, green, max_value)
+        cv2.max(max_value, red, max_value)
+        cv2.min(blue, green, min_value)
+        cv2.min(min_value, red, min_value)
+        cv2.LUT(max_value, self.min_lower, bound)
+        mask = cv2.compare(min_value, bound, cv2.CMP_GE)
+        if self.min_upper is not None:
+            cv2.LUT(max_value, self.min_upper, bound)
+            cv2.bitwise_and(mask, cv2.compare(min_value, bound, cv2.CMP_LE), mask)
+        return mask
 
-def is_white_cat_plush(frame):
+class DetectionParams:
     """
-    画像内に白い猫のぬいぐるみが映っているかどうかを判断する
+    白色検出のパラメータ
     
     Parameters:
-    - frame: 分析するフレーム
+    - lower_white: HSV色空間での白色の下限 (H, S, V)
+    - upper_white: HSV色空間での白色の上限 (H, S, V)
+    - white_threshold: 白色率の閾値（%）
+    - area_threshold: 大きな白色領域とみなす面積の閾値（ピクセル）
+    - kernel_size: ノイズ除去に使うモルフォロジー演算のカーネルサイズ
+    - min_vertices: 猫の形状（丸み）とみなす近似多角形の頂点数の下限（この値より多い場合）
+    - confidence_scale: 白色率の信頼度が最大になる白色率（%）
+    - area_ratio: 面積閾値をフレーム面積に対する比率で指定する場合の値（Noneの場合はarea_thresholdを使用）
+    - cascade: 縮小画像で粗く判定し、曖昧な場合だけ元の解像度で判定するかどうか
+    - cascade_width: 粗い判定に使う縮小画像の幅の下限（この幅を下回らない範囲で縮小する）
+    - cascade_margin: 粗い判定で確定とみなす閾値からの余裕（比率）
+    - color_lut: HSV変換の代わりに参照表（WhiteColorTable）でBGRから直接白色のマスクを作るかどうか
+      （色相の範囲を制限した閾値ではHSV変換を使う）
+    """
+    def __init__(self, lower_white=(0, 0, 150), upper_white=(180, 80, 255),
+                 white_threshold=10.0, area_threshold=5000, kernel_size=5,
+                 min_vertices=4, confidence_scale=20.0, area_ratio=None,
+                 cascade=False, cascade_width=320, cascade_margin=0.3, color_lut=False):
+        self.lower_white = np.array(lower_white)
+        self.upper_white = np.array(upper_white)
+        self.white_threshold = white_threshold
+        self.area_threshold = area_threshold
+        self.kernel_size = kernel_size
+        self.min_vertices = min_vertices
+        self.confidence_scale = confidence_scale
+        self.cascade = cascade
+        self.cascade_width = cascade_width
+        self.cascade_margin = cascade_margin
+        self.color_lut = color_lut
+        self.kernel = np.ones((kernel_size, kernel_size), np.uint8)
+        self.coarse_params_cache = {}
+        self._white_table = None
+        
+        # カスケード判定では解像度が変わるため、面積閾値は常にフレーム面積に対する比率で扱う
+        if area_ratio is None and cascade:
+            area_ratio = area_threshold / (REFERENCE_RESOLUTION[0] * REFERENCE_RESOLUTION[1])
+        self.area_ratio = area_ratio
     
-    Returns:
-    - is_cat: 白い猫のぬいぐるみが映っていると判断された場合はTrue
-    - confidence: 信頼度（0.0〜1.0）
-    - details: 詳細情報（デバッグ用）
+    def area_threshold_for(self, frame_pixels):
+        """画素数がframe_pixelsのフレームでの面積閾値（ピクセル）を返す"""
+        if self.area_ratio is not None:
+            return self.area_ratio * frame_pixels
+        return self.area_threshold
+    
+    def to_dict(self):
+        """コンストラクタに渡せる形式の辞書を返す"""
+        return {
+            "lower_white": tuple(int(v) for v in self.lower_white),
+            "upper_white": tuple(int(v) for v in self.upper_white),
+            "white_threshold": self.white_threshold,
+            "area_threshold": self.area_threshold,
+            "kernel_size": self.kernel_size,
+            "min_vertices": self.min_vertices,
+            "confidence_scale": self.confidence_scale,
+            "area_ratio": self.area_ratio,
+            "cascade": self.cascade,
+            "cascade_width": self.cascade_width,
+            "cascade_margin": self.cascade_margin,
+            "color_lut": self.color_lut,
+        }
+    
+    def white_table(self):
+        """色判定の参照表を返す（HSVの閾値が変わった場合だけ作り直す）"""
+        key = (tuple(int(v) for v in self.lower_white), tuple(int(v) for v in self.upper_white))
+        if self._white_table is None or self._white_table.key != key:
+            self._white_table = WhiteColorTable(*key)
+        return self._white_table
+    
+    def replace(self, **changes):
+        """一部の値を変更した新しいパラメータを返す"""
+        values = self.to_dict()
+        values.update(changes)
+        return DetectionParams(**values)
+
+def make_custom_params(lower_white, upper_white, white_threshold=10.0, area_threshold=3000):
     """
-    # フレームがNoneの場合はFalseを返す
-    if frame is None:
-        return False, 0.0, "フレームがありません"
+    パラメータ調整モード用の検出パラメータを作成する
     
-    # フレームのサイズを取得
-    height, width = frame.shape[:2]
+    信頼度の白色率スケールは白色率の閾値の2.5倍とする
+    """
+    return DetectionParams(lower_white=lower_white, upper_white=upper_white,
+                           white_threshold=white_threshold, area_threshold=area_threshold,
+                           confidence_scale=white_threshold * 2.5)
+
+# デフォルトの検出パラメータ
+DEFAULT_PARAMS = DetectionParams()
+
+class DetectionResult:
+    """
+    1フレーム分の検出結果
     
-    # HSV色空間に変換
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    判定結果に加えて、途中で計算したマスクや輪郭も保持するため、
+    オーバーレイ表示や画像保存で同じフレームを再計算する必要がない。
+    従来どおり ``is_cat, confidence, details = result`` の形で展開できる。
     
-    # 白色の範囲を定義（HSV色空間）- さらに広い範囲に調整
-    # 白色は彩度が低く、明度が高い
-    lower_white = np.array([0, 0, 150])  # 明度の下限をさらに下げる（180→150）
-    upper_white = np.array([180, 80, 255])  # 彩度の上限をさらに上げる（50→80）
+    Attributes:
+    - is_cat: 白い猫のぬいぐるみが映っていると判断された場合はTrue
+    - confidence: 信頼度（0.0〜1.0）
+    - details: 詳細情報（デバッグ用）
+    - hsv_mask: HSV閾値処理直後の白色マスク
+    - clean_mask: ノイズ除去後の白色マスク
+    - contours: 白色領域の輪郭
+    - regions: 輪郭ごとの特徴（area, vertices, is_large, is_cat_shape）
+    - params: 判定に使用したパラメータ
+    - frame_timestamp: フレームを取得した時刻（time.time()）
+    - frame_age: 判定時点でのフレームの経過時間（秒）
+    - reused: 場面に変化がないため前回の判定結果を再利用した場合はTrue
+    """
+    def __init__(self, is_cat, confidence, details, hsv_mask=None, clean_mask=None,
+                 contours=(), regions=(), params=None):
+        self.is_cat = is_cat
+        self.confidence = confidence
+        self.details = details
+        self.hsv_mask = hsv_mask
+        self.clean_mask = clean_mask
+        self.contours = contours
+        self.regions = regions
+        self.params = params
+        self.frame_timestamp = None
+        self.frame_age = None
+        self.reused = False
     
-    # 白色のマスクを作成
-    white_mask = cv2.inRange(hsv, lower_white, upper_white)
+    def __iter__(self):
+        return iter((self.is_cat, self.confidence, self.details))
     
-    # ノイズ除去のためのモルフォロジー演算
-    kernel = np.ones((5, 5), np.uint8)
-    white_mask = cv2.morphologyEx(white_mask, cv2.MORPH_OPEN, kernel)
-    white_mask = cv2.morphologyEx(white_mask, cv2.MORPH_CLOSE, kernel)
+    @property
+    def large_contours(self):
+        """面積の閾値を超えた輪郭のリスト"""
+        return [contour for contour, region in zip(self.contours, self.regions)
+                if region["is_large"]]
+
+# 処理段階ごとの所要時間を記録する際の段階名
+STAGES = ("pyramid", "coarse", "hsv", "in_range", "color_lut", "morphology", "contours", "shape", "evaluate", "zones")
+
+def record_stage(timings, stage, start):
+    """timingsが指定されていれば、startからの経過時間（秒）を段階ごとに加算する"""
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+
+def compute_white_mask(frame, params=DEFAULT_PARAMS, timings=None):
+    """
+    フレームをHSV色空間に変換し、白色のマスクを作成する
     
-    # マスクを適用して白い部分だけを抽出
-    white_result = cv2.bitwise_and(frame, frame, mask=white_mask)
+    params.color_lut がTrueの場合は、HSV変換の代わりに参照表でBGRから直接マスクを作成する
+    """
+    if params.color_lut:
+        table = params.white_table()
+        if table.usable:
+            start = time.perf_counter()
+            mask = table.compute_mask(frame)
+            record_stage(timings, "color_lut", start)
+            return mask
     
-    # 白色のピクセル数をカウント
-    white_pixel_count = cv2.countNonZero(white_mask)
-    white_percentage = white_pixel_count / (height * width) * 100
+    start = time.perf_counter()
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    record_stage(timings, "hsv", start)
     
-    # 輪郭を検出
-    contours, _ = cv2.findContours(white_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    start = time.perf_counter()
+    mask = cv2.inRange(hsv, params.lower_white, params.upper_white)
+    record_stage(timings, "in_range", start)
+    return mask
+
+def clean_white_mask(mask, params=DEFAULT_PARAMS, timings=None):
+    """ノイズ除去のためのモルフォロジー演算を行う"""
+    start = time.perf_counter()
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, params.kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, params.kernel)
+    record_stage(timings, "morphology", start)
+    return mask
+
+def find_white_contours(mask, timings=None):
+    """白色マスクから外側の輪郭を抽出する"""
+    start = time.perf_counter()
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    record_stage(timings, "contours", start)
+    return contours
+
+def classify_regions(contours, mask_shape, params=DEFAULT_PARAMS, timings=None, area_scale=1.0):
+    """
+    輪郭ごとに面積と形状の特徴を求める
     
-    # 大きな白色の塊があるかチェック
-    large_white_regions = 0
-    largest_area = 0
-    for contour in contours:
-        area = cv2.contourArea(contour)
-        largest_area = max(largest_area, area)
-        if area > 5000:  # 閾値を上げる（3000→5000）
-            large_white_regions += 1
+    Parameters:
+    - contours: 輪郭のリスト
+    - mask_shape: 輪郭を抽出したマスクの shape
+    - params: 検出パラメータ
+    - timings: 処理段階ごとの所要時間を加算する辞書（任意）
+    - area_scale: マスクの1ピクセルが元のフレームで何ピクセルに当たるか（縮小画像の場合）
     
-    # 猫の形状に関する特徴を検出
-    cat_shape_detected = False
+    Returns:
+    - 輪郭ごとの特徴の辞書のリスト
+    """
+    start = time.perf_counter()
+    height, width = mask_shape[:2]
+    area_threshold = params.area_threshold_for(height * width * area_scale)
+    regions = []
     for contour in contours:
-        if cv2.contourArea(contour) > 5000:
+        area = cv2.contourArea(contour) * area_scale
+        region = {"area": area, "vertices": None, "is_large": False, "is_cat_shape": False}
+        if area > area_threshold:
+            region["is_large"] = True
             # 輪郭の近似
             epsilon = 0.02 * cv2.arcLength(contour, True)
             approx = cv2.approxPolyDP(contour, epsilon, True)
-            
+            region["vertices"] = len(approx)
             # 猫の形状の特徴（丸みを帯びた形状）
-            if len(approx) > 4:  # 多角形の頂点数が多い（丸みがある）- 条件をさらに緩和（6→4）
-                cat_shape_detected = True
+            region["is_cat_shape"] = len(approx) > params.min_vertices
+        regions.append(region)
+    record_stage(timings, "shape", start)
+    return regions
+
+def extract_regions(mask, params=DEFAULT_PARAMS, timings=None, area_scale=1.0):
+    """
+    白色マスクから輪郭と領域ごとの特徴を抽出する
+    
+    Parameters:
+    - mask: 白色マスク
+    - params: 検出パラメータ
+    - timings: 処理段階ごとの所要時間を加算する辞書（任意）
+    - area_scale: マスクの1ピクセルが元のフレームで何ピクセルに当たるか（縮小画像の場合）
+    
+    Returns:
+    - contours: 輪郭のリスト
+    - regions: 輪郭ごとの特徴の辞書のリスト
+    """
+    contours = find_white_contours(mask, timings)
+    regions = classify_regions(contours, mask.shape, params, timings, area_scale)
+    return contours, regions
+
+def evaluate_regions(white_percentage, regions, params=DEFAULT_PARAMS):
+    """
+    白色率と領域の特徴から判定と信頼度を計算する
     
-    # 判定ロジック - 閾値を調整
+    Returns:
+    - is_cat: 白い猫のぬいぐるみが映っていると判断された場合はTrue
+    - confidence: 信頼度（0.0〜1.0）
+    - details: 詳細情報（デバッグ用）
+    """
+    large_white_regions = sum(1 for region in regions if region["is_large"])
+    largest_area = max((region["area"] for region in regions), default=0)
+    cat_shape_detected = any(region["is_cat_shape"] for region in regions)
+    
+    # 判定ロジック
     # 1. 白色のピクセルが一定割合以上ある
     # 2. 大きな白色の塊が存在する
     # 3. 猫の形状の特徴がある
-    is_cat = (white_percentage > 10 and  # 白色率の閾値を下げる（15→10）
+    is_cat = (white_percentage > params.white_threshold and 
               large_white_regions >= 1 and 
               cat_shape_detected)
     
-    # 信頼度の計算（調整版）
-    confidence = min(white_percentage / 20, 1.0) * 0.5  # 白色率の閾値変更に合わせて調整（30→20）
+    # 信頼度の計算
+    confidence = min(white_percentage / params.confidence_scale, 1.0) * 0.5
     if large_white_regions >= 1:
         confidence += 0.3
     if cat_shape_detected:
@@ -150,8 +520,565 @@ def is_white_cat_plush(frame):
     
     return is_cat, confidence, details
 
+def analyze_frame(frame, params=DEFAULT_PARAMS, timings=None, area_scale=1.0):
+    """
+    フレームの解像度のまま検出処理（マスク作成、ノイズ除去、輪郭抽出、判定）を行う
+    
+    Parameters:
+    - frame: 分析するフレーム
+    - params: 検出パラメータ（DetectionParams）
+    - timings: 処理段階ごとの所要時間を加算する辞書（任意）
+    - area_scale: フレームの1ピクセルが元のフレームで何ピクセルに当たるか（縮小画像の場合）
+    
+    Returns:
+    - DetectionResult
+    """
+    # 白色のマスクを作成（HSV色空間）
+    hsv_mask = compute_white_mask(frame, params, timings)
+    return analyze_mask(hsv_mask, params, timings, area_scale)
+
+def analyze_mask(hsv_mask, params=DEFAULT_PARAMS, timings=None, area_scale=1.0):
+    """
+    閾値処理直後のマスクからノイズ除去、輪郭抽出、判定を行う
+    
+    Parameters:
+    - hsv_mask: HSV閾値処理直後のマスク
+    - params: 検出パラメータ（DetectionParams）
+    - timings: 処理段階ごとの所要時間を加算する辞書（任意）
+    - area_scale: マスクの1ピクセルが元のフレームで何ピクセルに当たるか（縮小画像の場合）
+    
+    Returns:
+    - DetectionResult
+    """
+    # マスクのサイズを取得
+    height, width = hsv_mask.shape[:2]
+    
+    # 該当する色がまったくない場合は、ノイズ除去と輪郭抽出を行っても結果は変わらない
+    if not cv2.countNonZero(hsv_mask):
+        is_cat, confidence, details = evaluate_regions(0.0, [], params)
+        return DetectionResult(is_cat, confidence, details, hsv_mask=hsv_mask, clean_mask=hsv_mask,
+                               contours=(), regions=[], params=params)
+    
+    # ノイズ除去
+    clean_mask = clean_white_mask(hsv_mask, params, timings)
+    
+    # 輪郭と領域の特徴を抽出
+    contours, regions = extract_regions(clean_mask, params, timings, area_scale)
+    
+    # 白色のピクセル数をカウントして判定
+    start = time.perf_counter()
+    white_pixel_count = cv2.countNonZero(clean_mask)
+    white_percentage = white_pixel_count / (height * width) * 100
+    is_cat, confidence, details = evaluate_regions(white_percentage, regions, params)
+    record_stage(timings, "evaluate", start)
+    
+    return DetectionResult(is_cat, confidence, details, hsv_mask=hsv_mask, clean_mask=clean_mask,
+                           contours=contours, regions=regions, params=params)
+
+def is_coarse_result_decisive(coarse, params, frame_pixels):
+    """
+    縮小画像での判定結果が、元の解像度で判定し直さなくても確定できるかどうかを返す
+    
+    白色率と最大面積がどちらも閾値から cascade_margin 以上離れている場合のみ確定とする
+    """
+    margin = params.cascade_margin
+    white_percentage = coarse.details["white_percentage"]
+    largest_area = coarse.details["largest_area"]
+    area_threshold = params.area_threshold_for(frame_pixels)
+    
+    # 白色が明らかに少ない、または大きな塊が明らかにない場合は「映っていない」で確定
+    if (white_percentage < params.white_threshold * (1 - margin) or
+            largest_area < area_threshold * (1 - margin)):
+        return True
+    
+    # すべての条件を余裕をもって満たしている場合は「映っている」で確定
+    return (coarse.is_cat and
+            white_percentage > params.white_threshold * (1 + margin) and
+            largest_area > area_threshold * (1 + margin))
+
+def detect_cascaded(frame, params, timings=None):
+    """
+    縮小画像での粗い判定と元の解像度での判定を段階的に行う
+    
+    1/2ずつの画像ピラミッドの段に相当する大きさまで縮小した画像で白色率と大きな塊を確認し、結果が曖昧な場合だけ
+    元の解像度で輪郭と形状を判定する。面積閾値はフレーム面積に対する比率で扱う。
+    結果の details["cascade_stage"] に判定した段階（"coarse" または "full"）を記録する。
+    """
+    height, width = frame.shape[:2]
+    
+    # cascade_widthを下回らない範囲で1/2ずつ縮小した大きさを求める
+    # pyrDownを繰り返すと高解像度では元の解像度でのHSV変換と同程度の時間がかかるため、
+    # 同じ大きさへ一度のresizeで縮小する
+    start = time.perf_counter()
+    small_width, small_height = width, height
+    while small_width // 2 >= params.cascade_width:
+        small_width, small_height = small_width // 2, small_height // 2
+    small = frame
+    if small_width != width:
+        small = cv2.resize(frame, (small_width, small_height), interpolation=cv2.INTER_LINEAR)
+    record_stage(timings, "pyramid", start)
+    
+    if small is not frame:
+        start = time.perf_counter()
+        scale = width / small.shape[1]
+        coarse_params = get_coarse_params(params, scale)
+        coarse = analyze_frame(small, coarse_params, area_scale=(height * width) / (small.shape[0] * small.shape[1]))
+        record_stage(timings, "coarse", start)
+        
+        if is_coarse_result_decisive(coarse, params, height * width):
+            coarse.params = params
+            coarse.details["cascade_stage"] = "coarse"
+            return coarse
+    
+    result = analyze_frame(frame, params, timings)
+    result.details["cascade_stage"] = "full"
+    return result
+
+def get_coarse_params(params, scale):
+    """縮小画像用にモルフォロジー演算のカーネルを小さくしたパラメータを返す（縮小率ごとにキャッシュする）"""
+    coarse_params = params.coarse_params_cache.get(scale)
+    if coarse_params is None:
+        kernel_size = max(3, int(params.kernel_size / scale) | 1)
+        coarse_params = params.replace(kernel_size=kernel_size, cascade=False)
+        params.coarse_params_cache[scale] = coarse_params
+    return coarse_params
+
+def is_white_cat_plush(frame, params=DEFAULT_PARAMS, timings=None):
+    """
+    画像内に白い猫のぬいぐるみが映っているかどうかを判断する
+    
+    Parameters:
+    - frame: 分析するフレーム
+    - params: 検出パラメータ（DetectionParams）。cascadeがTrueの場合はカスケード判定を行う
+    - timings: 辞書を渡すと処理段階（STAGES）ごとの所要時間（秒）を加算する
+    
+    Returns:
+    - DetectionResult: 検出結果。is_cat, confidence, details の3つに展開できる
+      - is_cat: 白い猫のぬいぐるみが映っていると判断された場合はTrue
+      - confidence: 信頼度（0.0〜1.0）
+      - details: 詳細情報（デバッグ用）
+    """
+    # フレームがNoneの場合はFalseを返す
+    if frame is None:
+        return DetectionResult(False, 0.0, "フレームがありません", params=params)
+    
+    if params.cascade:
+        return detect_cascaded(frame, params, timings)
+    
+    return analyze_frame(frame, params, timings)
+
+def draw_status_overlay(frame, result, status, status_color, current_time):
+    """フレームに判定結果のテキストを描画する（英語で表示して文字化けを防止）"""
+    details = result.details
+    cached = " [cached]" if result.reused else ""
+    cv2.putText(frame, f"Status: {status} ({result.confidence:.2f}){cached}", (10, 30), 
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2)
+    cv2.putText(frame, f"Time: {current_time}", (10, 60), 
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    cv2.putText(frame, f"White %: {details['white_percentage']:.1f}%", (10, 90), 
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    cv2.putText(frame, f"White regions: {details['large_white_regions']} (Max area: {details['largest_area']})", (10, 120), 
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    cv2.putText(frame, f"Cat shape: {details['cat_shape_detected']}", (10, 150), 
+               cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+
+def draw_mask_overlay(frame, result, mask_size=(320, 180)):
+    """
+    検出結果のマスク画像をフレームの右下に小さく描画する（デバッグ用）
+    
+    判定に使用したマスクと輪郭をそのまま使うため、再計算は行わない
+    """
+    height, width = frame.shape[:2]
+    mask_width, mask_height = mask_size
+    if result.clean_mask is None or height < mask_height or width < mask_width:
+        return
+    
+    # 大きな輪郭のみ塗りつぶして描画
+    contour_mask = np.zeros_like(result.clean_mask)
+    large_contours = result.large_contours
+    if large_contours:
+        cv2.drawContours(contour_mask, large_contours, -1, 255, -1)
+    
+    # マスクを白、輪郭を赤で合成
+    white_mask_display = cv2.cvtColor(result.clean_mask, cv2.COLOR_GRAY2BGR)
+    contour_mask_color = np.zeros_like(white_mask_display)
+    contour_mask_color[:,:,2] = contour_mask  # R
+    combined_mask = cv2.addWeighted(white_mask_display, 0.7, contour_mask_color, 0.3, 0)
+    
+    # 画像の右下にマスク画像を配置
+    frame[height-mask_height:height, width-mask_width:width] = cv2.resize(combined_mask, (mask_width, mask_height))
+    
+    # マスク画像の境界線を描画
+    cv2.rectangle(frame, (width-mask_width, height-mask_height), 
+                 (width, height), (0, 255, 255), 2)
+    
+    # マスク画像のタイトルを表示（英語で表示）
+    cv2.putText(frame, "Mask Image", (width-mask_width+10, height-mask_height+20), 
+               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
+
+class MotionGate:
+    """
+    場面に変化がない間は検出処理を省略し、前回の判定結果を再利用するクラス
+    
+    最後に解析したフレームの縮小グレー画像（フィンガープリント）を保持し、
+    新しいフレームとの平均輝度差が閾値以下であれば前回の結果を返す。
+    ただし最後の解析から max_staleness 秒が経過した場合は必ず解析し直す。
+    
+    Parameters:
+    - threshold: 変化ありとみなす平均輝度差（0〜255）
+    - max_staleness: 前回の結果を再利用できる最大時間（秒）
+    - fingerprint_width: フィンガープリントの幅（ピクセル）
+    """
+    def __init__(self, threshold=3.0, max_staleness=30.0, fingerprint_width=64):
+        self.threshold = threshold
+        self.max_staleness = max_staleness
+        self.fingerprint_width = fingerprint_width
+        self.analysed_count = 0
+        self.skipped_count = 0
+        self.last_difference = None
+        self.reset()
+    
+    def reset(self):
+        """保持している結果を破棄し、次のフレームを必ず解析させる（パラメータ変更時など）"""
+        self._fingerprint = None
+        self._result = None
+        self._analysed_at = None
+    
+    def fingerprint(self, frame):
+        """フレームの縮小グレー画像を返す"""
+        height, width = frame.shape[:2]
+        small_width = min(self.fingerprint_width, width)
+        small_height = max(1, height * small_width // width)
+        # 線形補間で4倍の大きさまで縮小してから面積平均で縮小し、ノイズの影響を抑える
+        if width > small_width * 4:
+            frame = cv2.resize(frame, (small_width * 4, small_height * 4), interpolation=cv2.INTER_LINEAR)
+        small = cv2.resize(frame, (small_width, small_height), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+    
+    def process(self, frame, detect, timestamp=None):
+        """
+        必要な場合だけ検出処理を行い、判定結果を返す
+        
+        Parameters:
+        - frame: 分析するフレーム
+        - detect: フレームを受け取り DetectionResult を返す関数
+        - timestamp: フレームの時刻（秒）。Noneの場合は現在時刻
+        
+        Returns:
+        - DetectionResult（再利用した場合は reused が True のコピー）
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        
+        fingerprint = self.fingerprint(frame)
+        if (self._result is not None and
+                self._fingerprint.shape == fingerprint.shape and
+                timestamp - self._analysed_at < self.max_staleness):
+            self.last_difference = float(np.mean(np.abs(fingerprint - self._fingerprint)))
+            if self.last_difference <= self.threshold:
+                self.skipped_count += 1
+                result = copy.copy(self._result)
+                result.details = dict(self._result.details)
+                result.reused = True
+                return result
+        
+        result = detect(frame)
+        self.analysed_count += 1
+        self._fingerprint = fingerprint
+        self._result = result
+        self._analysed_at = timestamp
+        return result
+
+class CheckScheduler:
+    """
+    チェックの開始時刻を締め切りで管理し、処理時間に関係なく一定の周期でチェックするクラス
+    
+    前回の締め切りに周期を足した時刻まで待つため、処理時間が変わっても周期はずれない。
+    処理が締め切りを過ぎた場合は待たずに次のチェックを始め、周期超過として記録する
+    （遅れを取り戻すために連続でチェックすることはしない）。
+    
+    min_interval と max_interval を指定すると周期を判定結果に合わせて変える。
+    判定が変わった直後や確信の低い判定のあとは min_interval でチェックし、
+    同じ判定が続く間は周期を backoff 倍ずつ max_interval まで延ばす。
+    
+    Parameters:
+    - interval: 基本のチェック間隔（秒）
+    - min_interval: 判定が変わった直後のチェック間隔（秒）。Noneの場合は interval
+    - max_interval: 状態が安定しているときの最大のチェック間隔（秒）。Noneの場合は interval
+    - backoff: 同じ判定が続いたときに周期を延ばす倍率
+    - uncertain_confidence: 信頼度がこの範囲 (下限, 上限) に入る判定は確信が低いとみなす（Noneの場合は使わない）
+    """
+    def __init__(self, interval=2.0, min_interval=None, max_interval=None, backoff=1.5,
+                 uncertain_confidence=(0.4, 0.7)):
+        self.configure(interval, min_interval, max_interval, backoff, uncertain_confidence)
+        self.check_count = 0
+        self.fast_count = 0
+        self.overrun_count = 0
+        self.overrun_max = 0.0
+        self.period_total = 0.0
+        self._last_is_cat = None
+        self._deadline = time.monotonic()
+    
+    def configure(self, interval, min_interval=None, max_interval=None, backoff=1.5,
+                  uncertain_confidence=(0.4, 0.7)):
+        """周期の設定を変更する（締め切りと統計は引き継ぐ）"""
+        self.interval = interval
+        self.min_interval = min(interval, min_interval if min_interval is not None else interval)
+        self.max_interval = max(interval, max_interval if max_interval is not None else interval)
+        self.backoff = backoff
+        self.uncertain_confidence = uncertain_confidence
+        self.period = interval
+    
+    @property
+    def adaptive(self):
+        """判定結果に合わせて周期を変えるかどうか"""
+        return self.min_interval < self.max_interval
+    
+    def update(self, is_cat, confidence):
+        """
+        判定結果から次のチェックまでの周期を決める
+        
+        Returns:
+        - 次のチェックまでの周期（秒）
+        """
+        changed = self._last_is_cat is not None and is_cat != self._last_is_cat
+        uncertain = (self.uncertain_confidence is not None and
+                     self.uncertain_confidence[0] <= confidence <= self.uncertain_confidence[1])
+        self._last_is_cat = is_cat
+        if not self.adaptive:
+            self.period = self.interval
+        elif changed or uncertain:
+            self.period = self.min_interval
+            self.fast_count += 1
+        else:
+            self.period = min(self.period * self.backoff, self.max_interval)
+        return self.period
+    
+    def wait(self, stop_event=None):
+        """
+        次の締め切りまで待つ（stop_event が指定されていれば停止要求ですぐに戻る）
+        
+        Returns:
+        - 締め切りを過ぎていた場合はその秒数、間に合った場合は0.0
+        """
+        self.check_count += 1
+        self.period_total += self.period
+        deadline = self._deadline + self.period
+        now = time.monotonic()
+        if now >= deadline:
+            # 締め切りを過ぎた場合は、今から次の周期を数え直す
+            overrun = now - deadline
+            self.overrun_count += 1
+            self.overrun_max = max(self.overrun_max, overrun)
+            self._deadline = now
+            return overrun
+        
+        self._deadline = deadline
+        if stop_event is not None:
+            stop_event.wait(deadline - now)
+        else:
+            time.sleep(deadline - now)
+        return 0.0
+    
+    def stats(self):
+        """スケジュールの統計の辞書を返す"""
+        return {
+            "checks": self.check_count,
+            "average_interval": self.period_total / self.check_count if self.check_count else None,
+            "fast_checks": self.fast_count,
+            "overruns": self.overrun_count,
+            "overrun_max": self.overrun_max,
+        }
+
+class FrameReader:
+    """
+    バックグラウンドスレッドでカメラからフレームを読み続けるクラス
+    
+    ドライバのバッファを常に空にしておき、最新のフレームだけを取得時刻と
+    一緒に小さなリングバッファに保持する。監視ループは待たずに最新の
+    フレームを取得できるため、grab() によるバッファの読み捨てが不要になる。
+    
+    Parameters:
+    - cap: フレームを読み込む cv2.VideoCapture（read() を持つオブジェクト）
+    - buffer_size: 保持するフレーム数（1の場合は最新フレームのみ）
+    - on_frame: 読み込んだフレームごとに読み込みスレッドで on_frame(frame, timestamp) を呼び出す関数（任意）
+    """
+    def __init__(self, cap, buffer_size=1, on_frame=None):
+        self.cap = cap
+        self.on_frame = on_frame
+        self.frames_read = 0
+        self.read_failures = 0
+        self._frames = collections.deque(maxlen=max(1, buffer_size))
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+    
+    def start(self):
+        """読み込みスレッドを開始する"""
+        if self._thread is not None:
+            return self
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="FrameReader", daemon=True)
+        self._thread.start()
+        return self
+    
+    def _run(self):
+        while self._running:
+            ret, frame = self.cap.read()
+            timestamp = time.time()
+            if not ret:
+                self.read_failures += 1
+                time.sleep(0.01)  # 取得失敗時にCPUを占有しないように少し待つ
+                continue
+            with self._condition:
+                self._frames.append((frame, timestamp))
+                self.frames_read += 1
+                self._condition.notify_all()
+            if self.on_frame is not None:
+                self.on_frame(frame, timestamp)
+    
+    def read(self, timeout=1.0):
+        """
+        最新のフレームを取得する
+        
+        まだ1枚もフレームがない場合のみ、最大timeout秒待つ
+        
+        Returns:
+        - ret: フレームを取得できた場合はTrue
+        - frame: 最新フレームのコピー
+        - timestamp: フレームを取得した時刻（time.time()）
+        """
+        with self._condition:
+            if not self._frames:
+                self._condition.wait(timeout)
+            if not self._frames:
+                return False, None, None
+            frame, timestamp = self._frames[-1]
+        # 描画などで書き換えられても読み込みスレッド側に影響しないようにコピーする
+        return True, frame.copy(), timestamp
+    
+    def recent_frames(self):
+        """バッファ内のフレームを (frame, timestamp) のリストとして古い順に返す"""
+        with self._condition:
+            return list(self._frames)
+    
+    def stop(self):
+        """読み込みスレッドを停止する"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+def warm_up_camera(cap, max_frames=30, timeout=3.0, stable_frames=3, threshold=2.0):
+    """
+    カメラの露出やホワイトバランスが落ち着くまでフレームを読み捨てる
+    
+    前のフレームとの平均輝度差（MotionGate と同じ縮小グレー画像で比較）が threshold 以下の
+    フレームが stable_frames 枚続いた時点で終了する。読み込みはカメラのフレームレートで
+    待たされるため、間に sleep は入れない。
+    
+    Parameters:
+    - cap: フレームを読み込む取得元
+    - max_frames: 読み捨てる最大フレーム数
+    - timeout: 最大の待ち時間（秒）
+    - stable_frames: 安定したとみなすまでに続けて変化がないフレーム数
+    - threshold: 変化がないとみなす平均輝度差（0〜255）
+    
+    Returns:
+    - frames: 読み込んだフレーム数
+    - stable: 映像が安定した場合はTrue（上限に達して終了した場合はFalse）
+    """
+    gate = MotionGate(fingerprint_width=32)
+    start = time.perf_counter()
+    previous = None
+    unchanged = 0
+    frames = 0
+    while frames < max_frames and time.perf_counter() - start < timeout:
+        ret, frame = cap.read()
+        frames += 1
+        if not ret:
+            previous = None
+            unchanged = 0
+            time.sleep(0.05)  # 取得失敗時にCPUを占有しないように少し待つ
+            continue
+        fingerprint = gate.fingerprint(frame)
+        if (previous is not None and previous.shape == fingerprint.shape and
+                np.mean(np.abs(fingerprint - previous)) <= threshold):
+            unchanged += 1
+            if unchanged >= stable_frames:
+                return frames, True
+        else:
+            unchanged = 0
+        previous = fingerprint
+    return frames, False
+
+def build_detectors(profiles=None, zones=None):
+    """
+    監視する物体のプロファイルと領域の規則から、判定に使う検出器を作成する
+    
+    設定が正しくない場合（名前の重複や、領域のプロファイルが見つからない場合）は ValueError
+    
+    Returns:
+    - profile_detector: color_profiles.MultiProfileDetector（プロファイルを指定しない場合はNone）
+    - zone_monitor: zones.ZoneMonitor（領域を指定しない場合はNone）
+    """
+    from color_profiles import MultiProfileDetector
+    from zones import ZoneMonitor
+    profile_detector = MultiProfileDetector(profiles) if profiles else None
+    zone_monitor = None
+    if zones:
+        zone_monitor = ZoneMonitor(zones)
+        zone_monitor.validate([profile.name for profile in profiles or ()])
+    return profile_detector, zone_monitor
+
+def open_camera(camera_index, resolution, capture):
+    """CaptureOptions の設定でカメラを開く"""
+    return CameraSource(camera_index, resolution=resolution, backend=capture.backend,
+                        fourcc=capture.fourcc, buffer_size=capture.buffer_size)
+
+def start_reader(cap, capture, features):
+    """
+    バックグラウンドでのフレーム読み込みを開始する
+    
+    録画などの有限の取得元はフレームを読み飛ばさないよう、順番に直接読み込む（Noneを返す）
+    """
+    if not capture.threaded or not cap.is_live:
+        return None
+    return FrameReader(cap, buffer_size=capture.reader_buffer_size,
+                       on_frame=features.push_frame if features.records_frames else None).start()
+
+def find_reopened_index(camera_name, camera_index):
+    """カメラを開き直すときに、カメラ名に一致するデバイス番号を探し直す（見つからない場合は camera_index）"""
+    # デバイス番号0も見つかった結果として扱う
+    found_index = find_camera_index(camera_name, refresh=True)
+    if found_index is None:
+        print(f"警告: カメラ名 '{camera_name}' に一致するデバイスが見つかりません（デバイス番号 {camera_index} を開きます）")
+        return camera_index
+    return found_index
+
+def reopen_camera(camera_index, resolution, capture, features):
+    """
+    設定の変更に合わせてカメラを開き直し、バックグラウンドでの読み込みを再開する
+    
+    Returns:
+    - (cap, reader)。カメラを開けなかった場合は (None, None)
+    """
+    print(f"カメラを開き直します: デバイス番号 {camera_index} / {resolution[0]}x{resolution[1]}")
+    cap = open_camera(camera_index, resolution, capture)
+    if not cap.isOpened():
+        print(f"エラー: カメラを開くことができませんでした")
+        cap.release()
+        return None, None
+    warm_up_camera(cap)
+    return cap, start_reader(cap, capture, features)
+
 def monitor_camera(interval=2.0, duration=None, camera_index=0, camera_name=None, 
-                  resolution=(640, 360), log_dir="camera_logs", save_alerts=True):
+                  resolution=(640, 360), log_dir="camera_logs", save_alerts=True,
+                  params=DEFAULT_PARAMS, source=None, realtime=True, show_window=True, stop_event=None,
+                  on_check=None, config_watcher=None, max_frame_age=2.0, profiles=None, zones=None,
+                  preview_port=None, preview_fps=5.0, check_log=True, check_log_max_records=50000,
+                  startup_budget=3.0, capture=None, schedule=None, motion=None, alerts=None, clips=None,
+                  black_box=None, notify=None, metrics=None):
     """
     カメラを定期的に監視し、白い猫のぬいぐるみが映っているかどうかを判断する
     
@@ -163,9 +1090,58 @@ def monitor_camera(interval=2.0, duration=None, camera_index=0, camera_name=None
     - resolution: 解像度（幅, 高さ）
     - log_dir: ログを保存するディレクトリ
     - save_alerts: 異常検知時に画像を保存するかどうか
+    - params: 検出パラメータ（DetectionParams）
+    - source: カメラの代わりに使うフレームの取得元（録画ファイル、画像ディレクトリ、"synthetic"、FrameSource）
+    - realtime: Falseの場合はチェック間隔を無視してできるだけ速く処理する（録画の再生やベンチマーク用）
+    - show_window: 監視画面のウィンドウを表示するかどうか（Falseの場合はGUIを一切使わないヘッドレスモード）
+    - stop_event: is_set() がTrueになったら監視を終了するイベント（別スレッド・別プロセスからの停止用）
+    - on_check: チェックごとに on_check(result, status) を呼び出す関数（任意）
+    - config_watcher: 設定ファイルの変更を反映する ConfigWatcher（monitor_config.py）。検出パラメータと
+      チェック間隔などは次のチェックから切り替え、解像度とカメラの変更時だけカメラを開き直す
+    - max_frame_age: この秒数より古いフレームは取得失敗として扱う（バックグラウンド読み込み時のみ）
+    - profiles: 同時に監視する物体の色のプロファイル（color_profiles.ColorProfile のリスト）。
+      指定した場合は params の代わりに使い、すべての物体が映っている場合を正常とする
+    - zones: 占有率の規則を調べる領域（zones.Zone のリスト）。規則を満たさない領域がある場合は異常とする
+    - preview_port: 指定した場合、localhostのこのポートで注釈付きフレームをMJPEG配信する（0の場合は空きポート）
+    - preview_fps: プレビュー配信の最大フレームレート（チェック間隔とは独立）
+    - check_log: チェックごとの判定結果と段階別の所要時間を log_dir/checks に固定長のバイナリ形式で記録するかどうか
+      （check_log.py で集計できる）
+    - check_log_max_records: 1つのチェックログファイルに記録する最大チェック数（超えると次のファイルに切り替える）
+    - startup_budget: 呼び出しから最初の判定までの目標時間（秒）。超えた場合は内訳とともに警告を表示する
+    - capture: フレームの取得の設定（monitor_options.CaptureOptions、Noneの場合はデフォルト値）
+    - schedule: 判定に合わせてチェック間隔を変える設定（ScheduleOptions、Noneの場合は常に interval 秒ごと）
+      （チェックは処理時間を含めて interval 秒ごとに行う）
+    - motion: 場面に変化がない間は解析を省略する設定（MotionOptions、Noneの場合は毎回解析する）
+    - alerts: 異常検知画像の保存形式と間引きの設定（AlertOptions、Noneの場合はデフォルト値）
+    - clips: 正常から異常に変わったときに前後のフレームを動画として保存する設定（ClipOptions、Noneの場合は保存しない）
+    - black_box: 縮小したフレームを log_dir/blackbox に常時記録する設定（BlackBoxOptions、Noneの場合は記録しない）
+    - notify: 状態の変化を通知する設定（NotifyOptions、Noneの場合は通知しない）
+    - metrics: 段階ごとの所要時間とカウンターの計測の設定（MetricsOptions、Noneの場合は計測しない）
+    
+    Returns:
+    - 監視結果の辞書（カメラを開けなかった場合はNone）
     """
+    capture = capture or CaptureOptions()
+    schedule = schedule or ScheduleOptions()
+    alerts = alerts or AlertOptions()
+    
+    # 最初の判定までの時間の内訳（秒）
+    launch_time = time.perf_counter()
+    startup = {}
+    
+    # カメラ以外の取得元が指定されていれば、それを使う
+    start = time.perf_counter()
+    if source is not None:
+        cap = open_frame_source(source, resolution=resolution)
+    else:
+        cap = None
+    record_stage(startup, "open", start)
+    
     # カメラアプリを閉じる
-    close_camera_app()
+    if cap is None:
+        start = time.perf_counter()
+        close_camera_app()
+        record_stage(startup, "close_app", start)
     
     # ログディレクトリを確保
     log_dir = ensure_dir(log_dir)
@@ -174,52 +1150,103 @@ def monitor_camera(interval=2.0, duration=None, camera_index=0, camera_name=None
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     session_dir = os.path.join(log_dir, f"session_{timestamp}")
     
-    # カメラ名が指定されている場合、カメラインデックスを探す
-    if camera_name is not None:
-        camera_list = get_camera_list()
-        for i, (name, _) in enumerate(camera_list):
-            if camera_name.lower() in name.lower():
-                print(f"カメラ名 '{camera_name}' に一致するデバイスを見つけました: {name}")
-                camera_index = i
-                break
+    # カメラ名が指定されている場合、カメラインデックスを探す（一覧はキャッシュを使う）
+    if cap is None and camera_name is not None:
+        start = time.perf_counter()
+        found_index = find_camera_index(camera_name)
+        if found_index is not None:
+            print(f"カメラ名 '{camera_name}' に一致するデバイスを見つけました: デバイス番号 {found_index}")
+            camera_index = found_index
+        record_stage(startup, "enumerate", start)
     
     print(f"カメラ監視を開始します...")
-    print(f"カメラデバイス: {camera_index}")
+    if cap is None:
+        print(f"カメラデバイス: {camera_index}")
+    else:
+        print(f"取得元: {cap.name}")
     print(f"解像度: {resolution[0]}x{resolution[1]}")
-    print(f"チェック間隔: {interval}秒")
+    if realtime and schedule.adaptive:
+        print(f"チェック間隔: {interval}秒（{schedule.min_interval or interval}〜{schedule.max_interval or interval}秒で調整）")
+    elif realtime:
+        print(f"チェック間隔: {interval}秒")
+    else:
+        print(f"チェック間隔: なし（最大速度で処理）")
     if duration:
         print(f"監視時間: {duration}秒")
     else:
         print(f"監視時間: 無制限（Ctrl+Cで終了）")
     
+    # 複数の物体（1回のHSV変換ですべてのプロファイルを判定する）と領域の規則を判定に加える
+    from color_profiles import draw_profile_overlay
+    from zones import draw_zone_overlay
+    profile_detector, zone_monitor = build_detectors(profiles, zones)
+    if profile_detector is not None:
+        print(f"監視する物体: {', '.join(profile.name for profile in profiles)}")
+    if zone_monitor is not None:
+        print(f"監視する領域: {', '.join(zone_monitor.names)}")
+    
     # カメラを初期化
-    cap = cv2.VideoCapture(camera_index, cv2.CAP_DSHOW)  # DirectShowバックエンドを使用
+    if cap is None:
+        start = time.perf_counter()
+        cap = open_camera(camera_index, resolution, capture)
+        record_stage(startup, "open", start)
     
     if not cap.isOpened():
         print(f"エラー: カメラを開くことができませんでした")
         return
     
-    # カメラのプロパティを設定
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
-    cap.set(cv2.CAP_PROP_FPS, 15)  # フレームレートを15fpsに設定
-    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # バッファサイズを1に設定
+    # 映像が安定するまでフレームを読み飛ばす（カメラのみ）
+    if cap.is_live:
+        print("カメラウォームアップ中...")
+        start = time.perf_counter()
+        warm_up_frames, warm_up_stable = warm_up_camera(cap)
+        record_stage(startup, "warm_up", start)
+        if warm_up_stable:
+            print(f"  {warm_up_frames}フレームで映像が安定しました（{startup['warm_up']:.2f}秒）")
+        else:
+            print(f"  警告: 映像が安定しないまま開始します（{warm_up_frames}フレーム, {startup['warm_up']:.2f}秒）")
     
-    # ウォームアップのためにいくつかのフレームを読み飛ばす
-    print("カメラウォームアップ中...")
-    for i in range(10):
-        ret, _ = cap.read()
-        if not ret:
-            print(f"  ウォームアップ {i+1}/10 - フレーム取得失敗")
-        time.sleep(0.2)
+    # 監視ループとは別に動く機能を有効にする（取得したフレームは動画用のリングバッファと常時記録に渡す）
+    features = MonitorFeatures(log_dir, camera_name or cap.name)
+    if clips is not None:
+        features.start_clips(clips)
+    if black_box is not None:
+        features.start_black_box(black_box, resolution)
+    reader = start_reader(cap, capture, features)
     
     print("カメラ監視を開始しました！")
     print("監視中... (ESCキーで終了、Ctrl+Cでも終了できます)")
     
+    # 場面に変化がない間は解析を省略する
+    motion_gate = None
+    if motion is not None:
+        motion_gate = MotionGate(threshold=motion.threshold, max_staleness=motion.max_staleness)
+    
+    if save_alerts:
+        features.start_alerts(alerts)
+    if notify is not None:
+        features.start_notifier(notify)
+    if preview_port is not None:
+        features.start_preview(preview_port, preview_fps)
+    if metrics is not None:
+        features.start_metrics(metrics, preview_port)
+    if check_log:
+        features.start_check_log(timestamp, check_log_max_records,
+                                 zone_monitor.names if zone_monitor is not None else ())
+    
+    # チェックの開始時刻を締め切りで管理する
+    scheduler = CheckScheduler(interval, min_interval=schedule.min_interval, max_interval=schedule.max_interval,
+                               backoff=schedule.backoff, uncertain_confidence=schedule.uncertain_confidence)
+    
     # 監視開始時間
     start_time = time.time()
     alert_count = 0
     normal_count = 0
+    clip_count = 0
+    previous_is_cat = None
+    capture_failed = False
+    frame_age_total = 0.0
+    frame_age_max = 0.0
     
     try:
         while True:
@@ -228,134 +1255,286 @@ def monitor_camera(interval=2.0, duration=None, camera_index=0, camera_name=None
             if duration and elapsed_time >= duration:
                 print(f"指定された監視時間 {duration}秒 が経過しました")
                 break
+            if stop_event is not None and stop_event.is_set():
+                print("停止要求を受け取りました")
+                break
             
-            # バッファをクリア
-            for _ in range(5):
-                cap.grab()
+            # 設定ファイルの変更を反映する
+            change = config_watcher.poll() if config_watcher is not None else None
+            if change is not None:
+                if change["params"] is not None:
+                    # 参照を差し替えるだけなので、判定の途中でパラメータが混ざることはない
+                    params = change["params"]
+                    if motion_gate is not None:
+                        motion_gate.reset()
+                live = change["live"]
+                if live:
+                    duration = live.get("duration", duration)
+                    max_frame_age = live.get("max_frame_age", max_frame_age)
+                    interval = live.get("interval", interval)
+                    schedule = live.get("schedule", schedule) or ScheduleOptions()
+                    if "profiles" in live or "zones" in live:
+                        try:
+                            profile_detector, zone_monitor = build_detectors(live.get("profiles", profiles),
+                                                                             live.get("zones", zones))
+                            profiles, zones = live.get("profiles", profiles), live.get("zones", zones)
+                        except ValueError as e:
+                            print(f"物体のプロファイルと領域の変更を反映できませんでした: {e}")
+                        if features.check_writer is not None:
+                            features.check_writer.set_zones(zone_monitor.names if zone_monitor is not None else ())
+                        if motion_gate is not None:
+                            motion_gate.reset()
+                    scheduler.configure(interval, schedule.min_interval, schedule.max_interval, schedule.backoff,
+                                        schedule.uncertain_confidence)
+                reopen = change["reopen"]
+                if reopen and source is None:
+                    resolution = reopen.get("resolution", resolution)
+                    camera_index = reopen.get("camera_index", camera_index)
+                    camera_name = reopen.get("camera_name", camera_name)
+                    capture = reopen.get("capture", capture) or CaptureOptions()
+                    if camera_name is not None and "camera_index" not in reopen:
+                        camera_index = find_reopened_index(camera_name, camera_index)
+                    if reader is not None:
+                        reader.stop()
+                    cap.release()
+                    cap, reader = reopen_camera(camera_index, resolution, capture, features)
+                    if cap is None:
+                        if features.notifier is not None:
+                            features.notifier.notify(EVENT_CAPTURE_FAILURE, camera=camera_name or f"camera:{camera_index}",
+                                                     message="カメラを開き直せませんでした")
+                        break
+                elif reopen:
+                    print(f"録画などの取得元では次の設定は反映されません: {', '.join(sorted(reopen))}")
+                if change["restart"]:
+                    print(f"次の設定は監視を再起動するまで反映されません: {', '.join(change['restart'])}")
+                changed = ((["params"] if change["params"] is not None else []) + sorted(live) +
+                           (sorted(reopen) if source is None else []))
+                if changed:
+                    print(f"設定ファイルの変更を反映しました: {', '.join(changed)}")
+                if features.metrics is not None:
+                    features.metrics.observe({}, {"config_reloads": 1})
+            
+            timings = {} if features.metrics is not None or features.check_writer is not None else None
+            iteration_start = time.perf_counter()
             
             # フレームを取得
-            ret, frame = cap.read()
+            start = time.perf_counter()
+            if reader is not None:
+                # 読み込みスレッドが保持している最新フレームを待たずに取得
+                ret, frame, frame_timestamp = reader.read()
+                if ret and time.time() - frame_timestamp > max_frame_age:
+                    print(f"警告: フレームが古すぎます（{time.time() - frame_timestamp:.1f}秒前）")
+                    ret = False
+            else:
+                # バッファをクリア（カメラのみ）
+                if cap.is_live:
+                    for _ in range(5):
+                        cap.grab()
+                ret, frame = cap.read()
+                frame_timestamp = time.time()
+            record_stage(timings, "capture", start)
             
             if not ret:
+                if cap.finished:
+                    print("取得元の最後のフレームまで処理しました")
+                    break
                 print("エラー: フレームの取得に失敗しました")
-                time.sleep(interval)
+                features.record_capture_failure(timings)
+                # 失敗が続いている間は、最初の1回だけ通知する
+                if features.notifier is not None and not capture_failed:
+                    features.notifier.notify(EVENT_CAPTURE_FAILURE, camera=camera_name or cap.name,
+                                             message="フレームの取得に失敗しました")
+                capture_failed = True
+                if realtime:
+                    scheduler.wait(stop_event)
+                elif cap.is_live:
+                    # できるだけ速く処理する場合も、カメラが止まっている間は読み込みを繰り返さない
+                    if stop_event is not None:
+                        stop_event.wait(CAPTURE_RETRY_DELAY)
+                    else:
+                        time.sleep(CAPTURE_RETRY_DELAY)
                 continue
             
+            if capture_failed:
+                capture_failed = False
+                if features.notifier is not None:
+                    features.notifier.notify(EVENT_CAPTURE_RECOVERED, camera=camera_name or cap.name)
+            
+            # 読み込みスレッドがない場合は、チェックしたフレームを動画用に保持し、常時記録する
+            if features.records_frames and reader is None:
+                features.push_frame(frame, frame_timestamp)
+            
             # 現在の時刻
             current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
-            # 白い猫のぬいぐるみが映っているかどうかを判断
-            is_cat, confidence, details = is_white_cat_plush(frame)
+            # 白い猫のぬいぐるみが映っているかどうかを判断（1フレームにつき1回だけ解析する）
+            start = time.perf_counter()
+            if profile_detector is not None:
+                analyze = lambda f: profile_detector.detect(f, timings)
+            else:
+                analyze = lambda f: is_white_cat_plush(f, params, timings)
+            if zone_monitor is not None:
+                detect = lambda f: zone_monitor.apply(analyze(f), timings)
+            else:
+                detect = analyze
+            if motion_gate is not None:
+                result = motion_gate.process(frame, detect, frame_timestamp)
+            else:
+                result = detect(frame)
+            record_stage(timings, "detect", start)
+            is_cat, confidence, details = result
+            result.frame_timestamp = frame_timestamp
+            result.frame_age = time.time() - frame_timestamp
+            frame_age_total += result.frame_age
+            frame_age_max = max(frame_age_max, result.frame_age)
+            
+            # 最初の判定までの時間を表示する
+            if "first_verdict" not in startup:
+                startup["first_verdict"] = time.perf_counter() - launch_time
+                breakdown = ", ".join(f"{name} {seconds:.2f}秒" for name, seconds in startup.items()
+                                      if name != "first_verdict")
+                print(f"最初の判定までの時間: {startup['first_verdict']:.2f}秒（{breakdown}）")
+                if startup_budget is not None and startup["first_verdict"] > startup_budget:
+                    print(f"警告: 最初の判定までの時間が目標の {startup_budget}秒 を超えました")
             
             # 状態に応じて表示を変更（英語で表示）
+            start = time.perf_counter()
+            submitted = 0
+            suppressed_now = 0
+            alert_image = None
             if is_cat:
                 status = "Normal"  # 「監視中」を「Normal」に変更
                 status_color = (0, 255, 0)  # 緑色
                 normal_count += 1
+                
+                # 異常状態が終わったら、次の異常の最初のフレームは必ず保存する
+                features.end_alert(current_time)
             else:
                 status = "Alert"  # 「異常」を「Alert」に変更
                 status_color = (0, 0, 255)  # 赤色
                 alert_count += 1
                 
                 # 異常検知時に画像を保存
-                if save_alerts:
-                    if not os.path.exists(session_dir):
-                        os.makedirs(session_dir)
-                    alert_filename = f"alert_{alert_count:03d}.jpg"
-                    alert_filepath = os.path.join(session_dir, alert_filename)
-                    cv2.imwrite(alert_filepath, frame)
-                    print(f"異常を検知しました: {alert_filepath}")
-            
-            # フレームに情報を追加（英語で表示して文字化けを防止）
-            cv2.putText(frame, f"Status: {status} ({confidence:.2f})", (10, 30), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, status_color, 2)
-            cv2.putText(frame, f"Time: {current_time}", (10, 60), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            cv2.putText(frame, f"White %: {details['white_percentage']:.1f}%", (10, 90), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            cv2.putText(frame, f"White regions: {details['large_white_regions']} (Max area: {details['largest_area']})", (10, 120), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            cv2.putText(frame, f"Cat shape: {details['cat_shape_detected']}", (10, 150), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            
-            # マスク画像も表示（デバッグ用）
-            try:
-                # is_white_cat_plush関数から白色マスクを取得する必要があるため、再度計算
-                height, width = frame.shape[:2]
-                hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-                lower_white = np.array([0, 0, 150])  # 明度の下限をさらに下げる（180→150）
-                upper_white = np.array([180, 80, 255])  # 彩度の上限をさらに上げる（50→80）
-                white_mask = cv2.inRange(hsv, lower_white, upper_white)
-                kernel = np.ones((5, 5), np.uint8)
-                white_mask = cv2.morphologyEx(white_mask, cv2.MORPH_OPEN, kernel)
-                white_mask = cv2.morphologyEx(white_mask, cv2.MORPH_CLOSE, kernel)
-                
-                # 輪郭を検出して描画
-                contours, _ = cv2.findContours(white_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                contour_mask = np.zeros_like(white_mask)
-                cat_shape_detected = False
-                
-                for contour in contours:
-                    area = cv2.contourArea(contour)
-                    if area > 5000:  # 一定以上の大きさの輪郭のみ描画
-                        cv2.drawContours(contour_mask, [contour], -1, 255, -1)
-                        
-                        # 猫の形状の特徴を検出
-                        epsilon = 0.02 * cv2.arcLength(contour, True)
-                        approx = cv2.approxPolyDP(contour, epsilon, True)
-                        if len(approx) > 4:  # 多角形の頂点数が多い（丸みがある）- 条件をさらに緩和（6→4）
-                            cat_shape_detected = True
-                
-                # マスク画像をリサイズして表示（右下に小さく表示）
-                white_mask_display = cv2.cvtColor(white_mask, cv2.COLOR_GRAY2BGR)
-                contour_mask_display = cv2.cvtColor(contour_mask, cv2.COLOR_GRAY2BGR)
-                
-                # 輪郭を色付けして表示
-                contour_mask_color = np.zeros_like(contour_mask_display)
-                contour_mask_color[:,:,0] = 0    # B
-                contour_mask_color[:,:,1] = 0    # G
-                contour_mask_color[:,:,2] = contour_mask  # R
-                
-                # マスク画像と輪郭画像を合成
-                combined_mask = cv2.addWeighted(white_mask_display, 0.7, contour_mask_color, 0.3, 0)
+                save_frame, suppressed = True, 0
+                if features.alert_dedup is not None:
+                    save_frame, suppressed = features.alert_dedup.should_save(frame, frame_timestamp)
+                    suppressed_now = 0 if save_frame else 1
                 
-                mask_height, mask_width = 180, 320
-                mask_small = cv2.resize(combined_mask, (mask_width, mask_height))
+                if features.alert_writer is not None and save_frame:
+                    alert_filename = f"alert_{alert_count:03d}"
+                    metadata = {
+                        "time": current_time,
+                        "confidence": confidence,
+                        "white_percentage": details["white_percentage"],
+                        "large_white_regions": details["large_white_regions"],
+                        "largest_area": details["largest_area"],
+                        "suppressed_before": suppressed,
+                    }
+                    if profile_detector is not None:
+                        metadata["missing_profiles"] = result.missing
+                    if zone_monitor is not None:
+                        metadata["zones"] = details["zones"]
+                        metadata["zone_violations"] = details["zone_violations"]
+                    alert_filepath = features.submit_alert(os.path.join(session_dir, alert_filename), frame,
+                                                           metadata)
+                    if alert_filepath is None:
+                        alert_filepath = "（保存待ちが上限のため破棄）"
+                    else:
+                        submitted = 1
+                        alert_image = alert_filepath
+                    print(f"異常を検知しました: {alert_filepath} "
+                          f"(信頼度: {confidence:.2f}, 白色率: {details['white_percentage']:.1f}%, "
+                          f"省略した類似フレーム: {suppressed}枚)")
+                    if profile_detector is not None:
+                        print(f"映っていない物体: {', '.join(result.missing)}")
+                    if zone_monitor is not None and details["zone_violations"]:
+                        print("規則を満たさない領域: " + ", ".join(
+                            f"{name} ({details['zones'][name]:.1f}%)" for name in details["zone_violations"]))
+            
+            # 正常から異常に変わったときは、前後のフレームを動画として保存する
+            if features.clip_recorder is not None and previous_is_cat and not is_cat:
+                clip_count += 1
+                clip_path = features.clip_recorder.trigger(
+                    os.path.join(session_dir, f"clip_{clip_count:03d}.mp4"), frame_timestamp)
+                if clip_path is not None:
+                    print(f"異常検知動画の保存を開始しました: {clip_path}")
+            
+            # 正常と異常が切り替わったときは通知する（監視の開始時は正常だったものとみなす）
+            if features.notifier is not None and is_cat != (previous_is_cat is None or previous_is_cat):
+                event = {"confidence": confidence, "white_percentage": details["white_percentage"]}
+                if alert_image is not None:
+                    event["image"] = alert_image
+                if profile_detector is not None:
+                    event["missing_profiles"] = result.missing
+                if zone_monitor is not None:
+                    event["zone_violations"] = details["zone_violations"]
+                features.notifier.notify(EVENT_NORMAL if is_cat else EVENT_ALERT, camera=camera_name or cap.name, **event)
+            previous_is_cat = is_cat
+            
+            record_stage(timings, "alert", start)
+            
+            # 表示または配信する場合のみ、フレームに情報を追加
+            start = time.perf_counter()
+            annotate = show_window or (features.preview is not None and features.preview.wants_frame())
+            if annotate:
+                draw_status_overlay(frame, result, status, status_color, current_time)
+                if profile_detector is not None:
+                    draw_profile_overlay(frame, result)
+                if zone_monitor is not None:
+                    draw_zone_overlay(frame, result, zone_monitor)
                 
-                # 画像の右下にマスク画像を配置
-                if height >= mask_height and width >= mask_width:
-                    frame[height-mask_height:height, width-mask_width:width] = mask_small
-                    
-                    # マスク画像の境界線を描画
-                    cv2.rectangle(frame, (width-mask_width, height-mask_height), 
-                                 (width, height), (0, 255, 255), 2)
-                    
-                    # マスク画像のタイトルを表示（英語で表示）
-                    cv2.putText(frame, "Mask Image", (width-mask_width+10, height-mask_height+20), 
-                               cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
-            except Exception as e:
-                print(f"マスク画像の表示中にエラーが発生しました: {e}")
+                # マスク画像も表示（デバッグ用）
+                try:
+                    draw_mask_overlay(frame, result)
+                except Exception as e:
+                    print(f"マスク画像の表示中にエラーが発生しました: {e}")
+            record_stage(timings, "overlay", start)
+            
+            start = time.perf_counter()
+            if features.preview is not None:
+                features.publish_preview(frame if annotate else None, result, status, current_time,
+                                         normal_count, alert_count)
+            record_stage(timings, "preview", start)
+            
+            if on_check is not None:
+                on_check(result, status)
             
             # フレームを表示
-            cv2.imshow('C922 Pro Stream Webcam 監視', frame)
+            start = time.perf_counter()
+            if show_window:
+                cv2.imshow('C922 Pro Stream Webcam 監視', frame)
+            record_stage(timings, "display", start)
             
             # 監視状態をコンソールに表示（定期的に）
             if int(elapsed_time) % 10 == 0 and int(elapsed_time) > 0:
                 if is_cat:
-                    print(f"監視中... 経過時間: {int(elapsed_time)}秒 - 状態: 正常 (白い猫のぬいぐるみを検出)")
+                    print(f"監視中... 経過時間: {int(elapsed_time)}秒 - 状態: 正常 (白い猫のぬいぐるみを検出, 信頼度: {confidence:.2f}, フレーム遅延: {result.frame_age*1000:.0f}ms)")
                 else:
-                    print(f"監視中... 経過時間: {int(elapsed_time)}秒 - 状態: 異常 (白い猫のぬいぐるみを検出できません)")
+                    print(f"監視中... 経過時間: {int(elapsed_time)}秒 - 状態: 異常 (白い猫のぬいぐるみを検出できません, 信頼度: {confidence:.2f}, フレーム遅延: {result.frame_age*1000:.0f}ms)")
             
             # キー入力をチェック
-            key = cv2.waitKey(1)
+            if show_window:
+                start = time.perf_counter()
+                key = cv2.waitKey(1)
+                record_stage(timings, "wait_key", start)
+                
+                # ESCキーで終了
+                if key == 27:  # ESCキー
+                    print("監視を中断しました")
+                    break
             
-            # ESCキーで終了
-            if key == 27:  # ESCキー
-                print("監視を中断しました")
-                break
+            # 次のチェックの締め切りまで待機（停止要求があればすぐに抜ける）
+            start = time.perf_counter()
+            overrun = 0.0
+            if realtime:
+                scheduler.update(is_cat, confidence)
+                overrun = scheduler.wait(stop_event)
+            record_stage(timings, "sleep", start)
             
-            # 次のチェックまで待機
-            time.sleep(interval)
+            record_stage(timings, "iteration", iteration_start)
+            features.record_check(timings, result, status, submitted=submitted, suppressed=suppressed_now,
+                                  overrun=overrun, check_interval=scheduler.period if realtime else None,
+                                  first_verdict=startup.get("first_verdict"))
     
     except KeyboardInterrupt:
         print("\n監視が中断されました（Ctrl+C）")
@@ -365,10 +1544,16 @@ def monitor_camera(interval=2.0, duration=None, camera_index=0, camera_name=None
     
     finally:
         # リソースを解放
+        if reader is not None:
+            reader.stop()
         if cap is not None:
             cap.release()
         
-        cv2.destroyAllWindows()
+        if show_window:
+            cv2.destroyAllWindows()
+        
+        # 保存待ちの異常検知画像と動画、届いている通知をすべて書き出す
+        features.close()
         
         # 監視結果を表示
         elapsed_time = time.time() - start_time
@@ -377,13 +1562,42 @@ def monitor_camera(interval=2.0, duration=None, camera_index=0, camera_name=None
         print("\n===== 監視結果 =====")
         print(f"監視時間: {elapsed_time:.1f}秒")
         print(f"チェック回数: {total_checks}回")
-        print(f"正常: {normal_count}回 ({normal_count/total_checks*100:.1f}%)")
-        print(f"異常: {alert_count}回 ({alert_count/total_checks*100:.1f}%)")
-        
-        if alert_count > 0 and save_alerts:
-            print(f"異常検知画像の保存先: {session_dir}")
+        if total_checks > 0:
+            print(f"正常: {normal_count}回 ({normal_count/total_checks*100:.1f}%)")
+            print(f"異常: {alert_count}回 ({alert_count/total_checks*100:.1f}%)")
+            print(f"フレーム遅延: 平均 {frame_age_total/total_checks*1000:.1f}ms / 最大 {frame_age_max*1000:.1f}ms")
+        if motion_gate is not None:
+            print(f"解析: {motion_gate.analysed_count}回 / 省略: {motion_gate.skipped_count}回（場面に変化なし）")
+        if realtime and scheduler.check_count > 0:
+            schedule_stats = scheduler.stats()
+            print(f"平均チェック間隔: {schedule_stats['average_interval']:.2f}秒 / "
+                  f"短い間隔でのチェック: {schedule_stats['fast_checks']}回 / "
+                  f"締め切り超過: {schedule_stats['overruns']}回（最大 {schedule_stats['overrun_max']*1000:.0f}ms）")
+        features.print_summary(session_dir, alert_count)
+    
+    summary = {
+        "elapsed_time": elapsed_time,
+        "total_checks": total_checks,
+        "normal_count": normal_count,
+        "alert_count": alert_count,
+        "frame_age_avg": frame_age_total / total_checks if total_checks > 0 else None,
+        "frame_age_max": frame_age_max,
+        "analysed_count": motion_gate.analysed_count if motion_gate is not None else total_checks,
+        "skipped_count": motion_gate.skipped_count if motion_gate is not None else 0,
+        "session_dir": session_dir if alert_count > 0 and save_alerts else None,
+        "schedule": scheduler.stats(),
+        "startup": startup,
+    }
+    summary.update(features.summary())
+    return summary
 
 if __name__ == "__main__":
+    # 引数が指定された場合は対話メニューを使わず、設定ファイルとコマンドラインの指定で監視する
+    if len(sys.argv) > 1:
+        from monitor_config import main
+        main()
+        sys.exit(0)
+    
     print("C922 Pro Stream Webcam 監視ツール")
     
     # カメラリストを取得
@@ -401,10 +1615,42 @@ if __name__ == "__main__":
         print("\n以下のオプションから選択してください:")
         print("1. 通常監視モード")
         print("2. 白色検出パラメータ調整モード")
+        print("3. 録画再生モード（動画ファイル・画像ディレクトリ・合成映像）")
+        print("4. ライブ調整モード（カメラを開いたまま閾値を調整）")
         
-        choice = input("\n選択してください (1-2): ") or "1"
+        choice = input("\n選択してください (1-4): ") or "1"
         
-        if choice == "2":
+        if choice == "4":
+            from live_tuning import tune_live
+            
+            print("\nライブ調整モード")
+            camera_index = 0
+            if camera_name:
+                camera_index = find_camera_index(camera_name) or 0
+            save_path = input("調整後のパラメータを保存するJSONファイル [保存しない場合は空欄]: ") or None
+            params = tune_live(camera_index=camera_index, save_path=save_path)
+            
+            if params is not None:
+                start_input = input("調整したパラメータで監視を開始しますか？ (y/n) [デフォルト: n]: ") or "n"
+                if start_input.lower() == "y":
+                    interval = float(input("チェック間隔（秒）を入力してください [デフォルト: 2.0]: ") or "2.0")
+                    monitor_camera(interval=interval, camera_index=camera_index, params=params)
+        elif choice == "3":
+            print("\n録画再生モード")
+            source = input("動画ファイル・画像ディレクトリのパス [合成映像の場合は空欄]: ") or "synthetic"
+            
+            # 最大速度で再生するかどうか
+            fast_input = input("チェック間隔を無視して最大速度で処理しますか？ (y/n) [デフォルト: y]: ") or "y"
+            realtime = fast_input.lower() != "y"
+            interval = 0.0
+            if realtime:
+                interval = float(input("チェック間隔（秒）を入力してください [デフォルト: 2.0]: ") or "2.0")
+            
+            save_alerts_input = input("異常検知時に画像を保存しますか？ (y/n) [デフォルト: n]: ") or "n"
+            save_alerts = save_alerts_input.lower() == "y"
+            
+            monitor_camera(interval=interval, source=source, realtime=realtime, save_alerts=save_alerts)
+        elif choice == "2":
             print("\n白色検出パラメータ調整モード")
             print("このモードでは、白色検出のパラメータを調整できます")
             
@@ -422,9 +1668,9 @@ if __name__ == "__main__":
             # 白色領域の面積閾値
             area_threshold = int(input("白色領域の面積閾値 [デフォルト: 3000]: ") or "3000")
             
-            # HSV値を配列に設定
-            lower_white = np.array([h_min, s_min, v_min])
-            upper_white = np.array([h_max, s_max, v_max])
+            # HSV値を設定
+            lower_white = (h_min, s_min, v_min)
+            upper_white = (h_max, s_max, v_max)
             
             # 監視間隔（秒）
             interval = float(input("\nチェック間隔（秒）を入力してください [デフォルト: 2.0]: ") or "2.0")
@@ -437,86 +1683,16 @@ if __name__ == "__main__":
             save_alerts_input = input("異常検知時に画像を保存しますか？ (y/n) [デフォルト: y]: ") or "y"
             save_alerts = save_alerts_input.lower() == "y"
             
-            # カスタムパラメータでモニター関数を定義
-            def custom_is_white_cat_plush(frame):
-                if frame is None:
-                    return False, 0.0, "フレームがありません"
-                
-                height, width = frame.shape[:2]
-                hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-                
-                # カスタムHSV値を使用
-                white_mask = cv2.inRange(hsv, lower_white, upper_white)
-                
-                kernel = np.ones((5, 5), np.uint8)
-                white_mask = cv2.morphologyEx(white_mask, cv2.MORPH_OPEN, kernel)
-                white_mask = cv2.morphologyEx(white_mask, cv2.MORPH_CLOSE, kernel)
-                
-                white_result = cv2.bitwise_and(frame, frame, mask=white_mask)
-                white_pixel_count = cv2.countNonZero(white_mask)
-                white_percentage = white_pixel_count / (height * width) * 100
-                
-                contours, _ = cv2.findContours(white_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-                
-                large_white_regions = 0
-                largest_area = 0
-                
-                # 猫の形状に関する特徴を検出
-                cat_shape_detected = False
-                
-                for contour in contours:
-                    area = cv2.contourArea(contour)
-                    largest_area = max(largest_area, area)
-                    if area > area_threshold:
-                        large_white_regions += 1
-                        
-                        # 輪郭の近似
-                        epsilon = 0.02 * cv2.arcLength(contour, True)
-                        approx = cv2.approxPolyDP(contour, epsilon, True)
-                        
-                        # 猫の形状の特徴（丸みを帯びた形状）
-                        if len(approx) > 4:  # 多角形の頂点数が多い（丸みがある）- 条件をさらに緩和（6→4）
-                            cat_shape_detected = True
-                
-                # 判定ロジック - 閾値を調整
-                # 1. 白色のピクセルが一定割合以上ある
-                # 2. 大きな白色の塊が存在する
-                # 3. 猫の形状の特徴がある
-                is_cat = (white_percentage > white_threshold and 
-                          large_white_regions >= 1 and 
-                          cat_shape_detected)
-                
-                # 信頼度の計算（調整版）
-                confidence = min(white_percentage / (white_threshold * 2.5), 1.0) * 0.5
-                if large_white_regions >= 1:
-                    confidence += 0.3
-                if cat_shape_detected:
-                    confidence += 0.2
-                
-                details = {
-                    "white_percentage": white_percentage,
-                    "large_white_regions": large_white_regions,
-                    "largest_area": largest_area,
-                    "cat_shape_detected": cat_shape_detected,
-                    "confidence": confidence
-                }
-                
-                return is_cat, confidence, details
-            
-            # オリジナル関数を保存
-            original_is_white_cat_plush = is_white_cat_plush
-            
-            # カスタム関数に置き換え
-            is_white_cat_plush = custom_is_white_cat_plush
+            # カスタムパラメータで検出パラメータを作成
+            params = make_custom_params(lower_white, upper_white,
+                                        white_threshold=white_threshold,
+                                        area_threshold=area_threshold)
             
             # カメラ監視を開始
             if camera_name:
-                monitor_camera(interval=interval, duration=duration, camera_name=camera_name, save_alerts=save_alerts)
+                monitor_camera(interval=interval, duration=duration, camera_name=camera_name, save_alerts=save_alerts, params=params)
             else:
-                monitor_camera(interval=interval, duration=duration, save_alerts=save_alerts)
-            
-            # 元の関数に戻す
-            is_white_cat_plush = original_is_white_cat_plush
+                monitor_camera(interval=interval, duration=duration, save_alerts=save_alerts, params=params)
         else:
             # 通常監視モード
             # 監視間隔（秒）
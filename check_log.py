@@ -0,0 +1,422 @@
+import numpy as np
+import os
+import glob
+import json
+import time
+import datetime
+import argparse
+
+# ファイルの先頭に書き込む識別子
+MAGIC = b"CHKLOG1\n"
+
+# 判定結果の値
+VERDICT_ALERT = 0
+VERDICT_NORMAL = 1
+VERDICT_CAPTURE_FAILURE = 2
+
+# 記録する処理段階の所要時間（ミリ秒、記録がない段階はNaN）
+TIMING_COLUMNS = ("capture", "detect", "pyramid", "coarse", "hsv", "in_range", "color_lut",
+                  "morphology", "contours", "shape", "evaluate", "zones", "alert", "iteration")
+
+# 1回のチェックの固定長レコード
+CHECK_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("verdict", "u1"),
+    ("reused", "u1"),
+    ("large_white_regions", "<u2"),
+    ("confidence", "<f4"),
+    ("white_percentage", "<f4"),
+    ("largest_area", "<f4"),
+    ("frame_age_ms", "<f4"),
+] + [(f"{stage}_ms", "<f4") for stage in TIMING_COLUMNS])
+
+def zone_column(name):
+    """領域の占有率（%）を記録する列名を返す"""
+    return f"zone_{name}"
+
+# ファイル名のパターン
+LOG_PATTERN = "checks_*.bin"
+
+class CheckLogWriter:
+    """
+    チェックごとの判定結果を固定長のバイナリ形式で追記するクラス
+    
+    ファイルは「識別子、ヘッダーの長さ、JSONのヘッダー（列の定義など）、固定長レコードの並び」で、
+    読み込み側は numpy.memmap でそのまま列として扱える。レコード数が max_records に達するか
+    日付が変わると新しいファイルに切り替える。
+    
+    Parameters:
+    - directory: ログを保存するディレクトリ
+    - camera: ヘッダーに記録するカメラ名
+    - session: ファイル名に使うセッション名（Noneの場合は開始日時）
+    - max_records: 1ファイルに書き込むレコード数の上限
+    - flush_interval: ファイルに書き出す間隔（秒）
+    - zone_names: 占有率を記録する領域名のリスト（領域ごとに zone_<領域名> の列を加える）
+    """
+    def __init__(self, directory, camera="camera", session=None, max_records=50000, flush_interval=5.0,
+                 zone_names=()):
+        self.directory = directory
+        self.camera = camera
+        self.session = session or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.max_records = max_records
+        self.flush_interval = flush_interval
+        self.paths = []
+        self.record_count = 0
+        
+        self._file = None
+        self._file_records = 0
+        self._file_date = None
+        self._last_flush = time.time()
+        self.set_zones(zone_names)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+    
+    def set_zones(self, zone_names):
+        """
+        占有率を記録する領域を変更する
+        
+        列の定義はファイルごとにヘッダーに記録するため、領域が変わった場合は次のレコードから新しいファイルに切り替える
+        """
+        zone_names = list(zone_names)
+        if getattr(self, "zone_names", None) == zone_names:
+            return
+        self.zone_names = zone_names
+        self.dtype = np.dtype(CHECK_DTYPE.descr + [(zone_column(name), "<f4") for name in zone_names])
+        self._record = np.zeros(1, self.dtype)
+        self._file_records = self.max_records
+    
+    def _open(self, timestamp):
+        if self._file is not None:
+            self._file.close()
+        path = os.path.join(self.directory, f"checks_{self.session}_{len(self.paths):03d}.bin")
+        header = json.dumps({
+            "camera": self.camera,
+            "session": self.session,
+            "created": timestamp,
+            "fields": [[name, self.dtype.fields[name][0].str] for name in self.dtype.names],
+        }).encode("utf-8")
+        # レコードの開始位置を8バイト境界にそろえる
+        header += b" " * (-(len(MAGIC) + 4 + len(header)) % 8)
+        self._file = open(path, "wb")
+        self._file.write(MAGIC + len(header).to_bytes(4, "little") + header)
+        self._file_records = 0
+        self._file_date = datetime.date.fromtimestamp(timestamp)
+        self.paths.append(path)
+    
+    def append(self, timestamp, verdict, result=None, timings=None):
+        """
+        1回のチェックの結果を追記する
+        
+        Parameters:
+        - timestamp: フレームを取得した時刻（time.time()）
+        - verdict: VERDICT_ALERT / VERDICT_NORMAL / VERDICT_CAPTURE_FAILURE
+        - result: DetectionResult（取得に失敗した場合はNone）
+        - timings: 段階名 → 所要時間（秒）の辞書（任意）
+        """
+        if (self._file is None or self._file_records >= self.max_records or
+                datetime.date.fromtimestamp(timestamp) != self._file_date):
+            self._open(timestamp)
+        
+        record = self._record
+        record.fill(0)
+        record["timestamp"] = timestamp
+        record["verdict"] = verdict
+        if result is not None:
+            details = result.details
+            record["reused"] = result.reused
+            record["confidence"] = result.confidence
+            record["white_percentage"] = details["white_percentage"]
+            record["large_white_regions"] = details["large_white_regions"]
+            record["largest_area"] = details["largest_area"]
+            record["frame_age_ms"] = (result.frame_age or 0.0) * 1000
+        zones = getattr(result, "zones", None) or {}
+        for name in self.zone_names:
+            zone = zones.get(name)
+            record[zone_column(name)] = np.nan if zone is None else zone["percentage"]
+        for stage in TIMING_COLUMNS:
+            seconds = timings.get(stage) if timings is not None else None
+            record[f"{stage}_ms"] = np.nan if seconds is None else seconds * 1000
+        
+        self._file.write(record.tobytes())
+        self._file_records += 1
+        self.record_count += 1
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+    
+    def flush(self):
+        """バッファの内容をファイルに書き出す"""
+        self._last_flush = time.time()
+        if self._file is not None:
+            self._file.flush()
+    
+    def close(self):
+        """ファイルを閉じる"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def read_header(path):
+    """
+    ログファイルのヘッダーを読み込む
+    
+    Returns:
+    - header: ヘッダーの辞書
+    - offset: 最初のレコードの位置（バイト）
+    - dtype: レコードの dtype
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"チェックログのファイルではありません: {path}")
+        length = int.from_bytes(f.read(4), "little")
+        header = json.loads(f.read(length).decode("utf-8"))
+    dtype = np.dtype([(name, type_str) for name, type_str in header["fields"]])
+    return header, len(MAGIC) + 4 + length, dtype
+
+def open_log(path):
+    """
+    ログファイルをメモリマップで開く
+    
+    書き込み途中の不完全なレコードは含めない
+    
+    Returns:
+    - (header, records) の組（records は構造化配列の numpy.memmap、レコードがない場合は空の配列）
+    """
+    header, offset, dtype = read_header(path)
+    count = (os.path.getsize(path) - offset) // dtype.itemsize
+    if count <= 0:
+        return header, np.zeros(0, dtype)
+    return header, np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+def find_logs(paths):
+    """ファイルまたはディレクトリ（サブディレクトリを含む）のリストからログファイルを探す"""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found.extend(glob.glob(os.path.join(path, "**", LOG_PATTERN), recursive=True))
+        else:
+            found.append(path)
+    return sorted(set(found))
+
+def load_columns(paths, columns, since=None, until=None, camera=None):
+    """
+    複数のログファイルから必要な列だけを読み出して時刻順に連結する
+    
+    Parameters:
+    - paths: ログファイルのリスト
+    - columns: 読み出す列名のリスト（timestamp は常に含める）
+    - since, until: 対象とする時刻の範囲（time.time() の値、任意）
+    - camera: 対象とするカメラ名（任意）
+    
+    Returns:
+    - 列名 → 配列の辞書
+    """
+    columns = ["timestamp"] + [column for column in columns if column != "timestamp"]
+    parts = {column: [] for column in columns}
+    for path in paths:
+        header, records = open_log(path)
+        if len(records) == 0 or (camera is not None and header.get("camera") != camera):
+            continue
+        timestamps = records["timestamp"]
+        # 時刻は追記順に増えるため、範囲の端は二分探索で求める
+        start = np.searchsorted(timestamps, since) if since is not None else 0
+        end = np.searchsorted(timestamps, until) if until is not None else len(records)
+        if start >= end:
+            continue
+        for column in columns:
+            if column in records.dtype.names:
+                parts[column].append(np.asarray(records[column][start:end]))
+            else:
+                parts[column].append(np.full(end - start, np.nan, np.float32))
+    
+    if not parts["timestamp"]:
+        return {column: np.zeros(0) for column in columns}
+    data = {column: np.concatenate(values) for column, values in parts.items()}
+    order = np.argsort(data["timestamp"], kind="stable")
+    return {column: values[order] for column, values in data.items()}
+
+def find_intervals(timestamps, flags, max_gap=None):
+    """
+    flags がTrueの連続区間を (開始時刻, 終了時刻, チェック数) のリストで返す
+    
+    max_gap を指定した場合は、チェックの間隔がそれより空いた位置でも区間を区切る
+    """
+    if len(flags) == 0:
+        return []
+    flags = np.asarray(flags, bool)
+    breaks = np.zeros(len(flags), bool)
+    if max_gap is not None and len(flags) > 1:
+        breaks[1:] = np.diff(timestamps) > max_gap
+    starts = np.flatnonzero(flags & (~np.r_[False, flags[:-1]] | breaks))
+    ends = np.flatnonzero(flags & (~np.r_[flags[1:], False] | np.r_[breaks[1:], False]))
+    return [(float(timestamps[s]), float(timestamps[e]), int(e - s + 1)) for s, e in zip(starts, ends)]
+
+def compute_uptime(timestamps, max_gap):
+    """
+    監視が動いていた割合と停止期間を求める
+    
+    チェックの間隔が max_gap を超えた区間を停止期間とみなす
+    
+    Returns:
+    - (稼働率, 停止期間 (開始時刻, 終了時刻) のリスト)
+    """
+    if len(timestamps) < 2:
+        return 1.0, []
+    gaps = np.diff(timestamps)
+    outage = np.flatnonzero(gaps > max_gap)
+    span = timestamps[-1] - timestamps[0]
+    downtime = float(gaps[outage].sum())
+    outages = [(float(timestamps[i]), float(timestamps[i + 1])) for i in outage]
+    return (1.0 - downtime / span) if span > 0 else 1.0, outages
+
+def format_time(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+def summarize(data, max_gap=None, min_alert_checks=1):
+    """
+    読み出した列から集計結果の辞書を作成する
+    
+    Parameters:
+    - data: load_columns() の結果（verdict と時間の列を含む）
+    - max_gap: 停止とみなすチェックの間隔（秒）。Noneの場合はチェック間隔の中央値の5倍（最低10秒）
+    - min_alert_checks: 異常区間として数える最小のチェック数
+    """
+    timestamps = data["timestamp"]
+    verdict = data["verdict"]
+    total = len(timestamps)
+    if total == 0:
+        return {"checks": 0}
+    
+    if max_gap is None:
+        median = float(np.median(np.diff(timestamps))) if total > 1 else 0.0
+        max_gap = max(10.0, median * 5)
+    
+    checked = verdict != VERDICT_CAPTURE_FAILURE
+    uptime, outages = compute_uptime(timestamps, max_gap)
+    alert_intervals = [interval for interval in
+                       find_intervals(timestamps[checked], verdict[checked] == VERDICT_ALERT, max_gap)
+                       if interval[2] >= min_alert_checks]
+    
+    stages = {}
+    for stage in TIMING_COLUMNS:
+        values = data.get(f"{stage}_ms")
+        if values is None:
+            continue
+        values = values[~np.isnan(values)]
+        if len(values):
+            stages[stage] = {"mean_ms": float(values.mean()), "p50_ms": float(np.percentile(values, 50)),
+                             "p99_ms": float(np.percentile(values, 99)), "max_ms": float(values.max())}
+    
+    return {
+        "checks": total,
+        "first": float(timestamps[0]),
+        "last": float(timestamps[-1]),
+        "normal": int(np.count_nonzero(verdict == VERDICT_NORMAL)),
+        "alert": int(np.count_nonzero(verdict == VERDICT_ALERT)),
+        "capture_failures": int(np.count_nonzero(~checked)),
+        "reused": int(np.count_nonzero(data["reused"])) if "reused" in data else None,
+        "confidence_mean": float(np.nanmean(data["confidence"][checked])) if checked.any() else None,
+        "white_percentage_mean": float(np.nanmean(data["white_percentage"][checked])) if checked.any() else None,
+        "max_gap": max_gap,
+        "uptime": uptime,
+        "outages": outages,
+        "alert_intervals": alert_intervals,
+        "stages": stages,
+    }
+
+def daily_counts(data):
+    """日ごとの (日付, 正常, 異常, 取得失敗) のリストを返す"""
+    timestamps = data["timestamp"]
+    if len(timestamps) == 0:
+        return []
+    days = np.array([datetime.date.fromtimestamp(t).toordinal() for t in (timestamps[0], timestamps[-1])])
+    # 日付の境界の時刻を求め、二分探索で日ごとに分ける
+    rows = []
+    for ordinal in range(days[0], days[1] + 1):
+        day = datetime.date.fromordinal(ordinal)
+        start = time.mktime(day.timetuple())
+        end = time.mktime((day + datetime.timedelta(days=1)).timetuple())
+        i, j = np.searchsorted(timestamps, [start, end])
+        verdict = data["verdict"][i:j]
+        rows.append((day.isoformat(), int(np.count_nonzero(verdict == VERDICT_NORMAL)),
+                     int(np.count_nonzero(verdict == VERDICT_ALERT)),
+                     int(np.count_nonzero(verdict == VERDICT_CAPTURE_FAILURE))))
+    return rows
+
+def parse_time(value):
+    """'YYYY-MM-DD' または 'YYYY-MM-DD HH:MM:SS' を time.time() の値に変換する"""
+    if value is None:
+        return None
+    for pattern in ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d"):
+        try:
+            return time.mktime(datetime.datetime.strptime(value, pattern).timetuple())
+        except ValueError:
+            continue
+    raise ValueError(f"日時の形式が正しくありません: {value}")
+
+def print_summary(summary, daily=None, max_intervals=20):
+    """集計結果を表示する"""
+    if summary["checks"] == 0:
+        print("対象のチェック結果がありません")
+        return
+    checks = summary["checks"]
+    print("\n===== チェックログの集計 =====")
+    print(f"期間: {format_time(summary['first'])} 〜 {format_time(summary['last'])}")
+    print(f"チェック回数: {checks}回")
+    print(f"正常: {summary['normal']}回 ({summary['normal']/checks*100:.1f}%) / "
+          f"異常: {summary['alert']}回 ({summary['alert']/checks*100:.1f}%) / "
+          f"取得失敗: {summary['capture_failures']}回")
+    if summary["confidence_mean"] is not None:
+        print(f"平均信頼度: {summary['confidence_mean']:.3f} / 平均白色率: {summary['white_percentage_mean']:.1f}%")
+    print(f"稼働率: {summary['uptime']*100:.2f}%（{summary['max_gap']:.0f}秒以上チェックがない期間を停止とみなす）")
+    for start, end in summary["outages"][:max_intervals]:
+        print(f"  停止: {format_time(start)} 〜 {format_time(end)} ({end - start:.0f}秒)")
+    
+    intervals = summary["alert_intervals"]
+    print(f"異常区間: {len(intervals)}件")
+    for start, end, count in intervals[:max_intervals]:
+        print(f"  {format_time(start)} 〜 {format_time(end)} ({end - start:.0f}秒, {count}回)")
+    if len(intervals) > max_intervals:
+        print(f"  ... 他 {len(intervals) - max_intervals}件")
+    
+    if summary["stages"]:
+        print("段階ごとの所要時間 (平均 / p50 / p99, ms):")
+        for stage, values in summary["stages"].items():
+            print(f"  {stage:<12} {values['mean_ms']:8.2f} {values['p50_ms']:8.2f} {values['p99_ms']:8.2f}")
+    
+    if daily:
+        print("日ごとの回数 (正常 / 異常 / 取得失敗):")
+        for day, normal, alert, failures in daily:
+            print(f"  {day}: {normal} / {alert} / {failures}")
+
+def main():
+    parser = argparse.ArgumentParser(description="チェックログの集計")
+    parser.add_argument("paths", nargs="*", default=["camera_logs"], help="ログファイルまたはディレクトリ")
+    parser.add_argument("--since", default=None, help="開始日時（YYYY-MM-DD [HH:MM:SS]）")
+    parser.add_argument("--until", default=None, help="終了日時（YYYY-MM-DD [HH:MM:SS]）")
+    parser.add_argument("--camera", default=None, help="対象のカメラ名")
+    parser.add_argument("--max-gap", type=float, default=None, help="停止とみなすチェックの間隔（秒）")
+    parser.add_argument("--min-alert-checks", type=int, default=1, help="異常区間として数える最小のチェック数")
+    parser.add_argument("--daily", action="store_true", help="日ごとの回数を表示する")
+    parser.add_argument("--json", action="store_true", help="集計結果をJSONで出力する")
+    args = parser.parse_args()
+    
+    paths = find_logs(args.paths)
+    if not paths:
+        print("チェックログが見つかりませんでした")
+        return
+    
+    columns = ["verdict", "reused", "confidence", "white_percentage"] + [f"{stage}_ms" for stage in TIMING_COLUMNS]
+    data = load_columns(paths, columns, since=parse_time(args.since), until=parse_time(args.until),
+                        camera=args.camera)
+    summary = summarize(data, max_gap=args.max_gap, min_alert_checks=args.min_alert_checks)
+    daily = daily_counts(data) if args.daily else None
+    if args.json:
+        if daily is not None:
+            summary["daily"] = daily
+        print(json.dumps(summary, ensure_ascii=False, indent=2))
+    else:
+        print(f"ログファイル: {len(paths)}件")
+        print_summary(summary, daily)
+
+if __name__ == "__main__":
+    main()
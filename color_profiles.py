@@ -0,0 +1,221 @@
+import cv2
+import numpy as np
+import os
+import json
+import time
+import threading
+
+from camera_monitor import DetectionParams, DetectionResult, DEFAULT_PARAMS, HUE_MAX, analyze_mask, record_stage
+
+# H, S, V のチャンネルごとの値の最大値
+CHANNEL_MAX = (HUE_MAX, 255, 255)
+
+class ColorProfile:
+    """
+    監視する物体1つ分の色と判定の条件
+    
+    判定は白い猫のぬいぐるみと同じ（色の割合、大きな塊、形状）で、params の lower_white / upper_white を
+    この物体の色の範囲として使う。結果の details の "white_percentage" はこの色の割合になる。
+    
+    Parameters:
+    - name: プロファイル名（表示やログに使う）
+    - params: 検出パラメータ（DetectionParams）。色相の下限が上限より大きい場合（赤など）は、
+      色相が179から0に折り返す範囲として扱う
+    """
+    def __init__(self, name, params=DEFAULT_PARAMS):
+        self.name = name
+        self.params = params
+        self.channel_ranges = self.get_channel_ranges()
+    
+    def __eq__(self, other):
+        return isinstance(other, ColorProfile) and self.to_dict() == other.to_dict()
+    
+    def __repr__(self):
+        return f"ColorProfile({self.name!r})"
+    
+    def get_channel_ranges(self):
+        """
+        色の範囲をチャンネルごとの閾値に分ける
+        
+        値の範囲全体を許すチャンネル（色相を制限しない白など）は判定を省略する。
+        色相が折り返す範囲は、その外側の範囲を判定して反転する。
+        
+        Returns:
+        - (channel, lower, upper, inverted) のタプルのリスト
+        """
+        ranges = []
+        for channel in range(3):
+            lower = int(self.params.lower_white[channel])
+            upper = int(self.params.upper_white[channel])
+            if channel == 0 and lower > upper:
+                if upper + 1 <= lower - 1:
+                    ranges.append((channel, upper + 1, lower - 1, True))
+            elif lower > 0 or upper < CHANNEL_MAX[channel]:
+                ranges.append((channel, lower, upper, False))
+        return ranges
+    
+    def to_dict(self):
+        """設定ファイルに保存できる形式の辞書を返す"""
+        return {"name": self.name, "params": self.params.to_dict()}
+    
+    @classmethod
+    def from_dict(cls, data, base_dir="."):
+        """
+        辞書からプロファイルを作成する
+        
+        "params" には live_tuning.py などで保存した検出パラメータのJSONファイルのパスも指定できる
+        """
+        if not isinstance(data, dict) or "name" not in data:
+            raise ValueError("プロファイルには name を指定してください")
+        params_data = data.get("params") or {}
+        if isinstance(params_data, str):
+            with open(os.path.join(base_dir, params_data), encoding="utf-8") as f:
+                params_data = json.load(f)
+        try:
+            params = DetectionParams(**params_data)
+        except TypeError as e:
+            raise ValueError(f"プロファイル '{data['name']}' の検出パラメータが正しくありません: {e}")
+        return cls(data["name"], params)
+
+class MultiProfileResult(DetectionResult):
+    """
+    複数のプロファイルの判定結果
+    
+    すべてのプロファイルの物体が映っている場合に is_cat がTrueになる。信頼度・詳細・マスクには
+    最も信頼度の低いプロファイル（映っていない物体があればその物体）のものを使うため、
+    監視ループやチェックログでは DetectionResult と同じように扱える。
+    
+    Attributes:
+    - profiles: プロファイル名 → DetectionResult の辞書（プロファイルの順）
+    - weakest: 全体の信頼度・詳細に使ったプロファイル名
+    """
+    def __init__(self, profiles):
+        self.profiles = profiles
+        if not profiles:
+            super().__init__(False, 0.0, "フレームがありません")
+            self.weakest = None
+            return
+        
+        self.weakest = min(profiles, key=lambda name: (profiles[name].is_cat, profiles[name].confidence))
+        weakest = profiles[self.weakest]
+        details = dict(weakest.details)
+        details["profile"] = self.weakest
+        details["profiles"] = {name: result.details for name, result in profiles.items()}
+        super().__init__(all(result.is_cat for result in profiles.values()), weakest.confidence, details,
+                         hsv_mask=weakest.hsv_mask, clean_mask=weakest.clean_mask,
+                         contours=weakest.contours, regions=weakest.regions, params=weakest.params)
+    
+    @property
+    def missing(self):
+        """映っていないと判断されたプロファイル名のリスト"""
+        return [name for name, result in self.profiles.items() if not result.is_cat]
+
+class MultiProfileDetector:
+    """
+    複数の色のプロファイルを、フレームごとに1回のHSV変換で判定するクラス
+    
+    フレーム全体のHSV変換（検出処理で最も時間のかかる段階）は共有のバッファに1回だけ行う。
+    閾値処理はHSV画像をチャンネルに分けてから、プロファイルが制限しているチャンネルだけを
+    1チャンネルの inRange で判定して論理積をとる（結果は3チャンネルの inRange と一致し、より速い）。
+    同じチャンネルの同じ閾値は複数のプロファイルで共有する。マスク以降の処理は、その色が
+    まったくない場合は省略されるため、プロファイルを増やしたときの所要時間の増加は小さい。
+    
+    色の判定にはHSV変換を共有するため、DetectionParams の color_lut と cascade は使わない。
+    
+    Parameters:
+    - profiles: ColorProfile のリスト（名前は重複しないこと）
+    """
+    def __init__(self, profiles):
+        profiles = list(profiles)
+        if not profiles:
+            raise ValueError("プロファイルを1つ以上指定してください")
+        names = [profile.name for profile in profiles]
+        if len(set(names)) != len(names):
+            raise ValueError(f"プロファイル名が重複しています: {', '.join(names)}")
+        self.profiles = profiles
+        self._local = threading.local()
+    
+    def get_workspace(self, shape):
+        """
+        途中結果を書き込むバッファを返す（フレームの大きさごと、スレッドごとに使い回す）
+        
+        Returns:
+        - hsv: HSV画像
+        - channels: H, S, V のチャンネルごとの画像
+        - channel_masks: チャンネルの閾値 → その閾値で判定したマスクの辞書（必要になったときに追加する）
+        """
+        workspace = getattr(self._local, "workspace", None)
+        if workspace is None or workspace[0].shape != shape:
+            workspace = (np.empty(shape, np.uint8), [np.empty(shape[:2], np.uint8) for _ in range(3)], {})
+            self._local.workspace = workspace
+        return workspace
+    
+    def detect(self, frame, timings=None):
+        """
+        すべてのプロファイルを判定する
+        
+        Parameters:
+        - frame: 分析するフレーム
+        - timings: 処理段階ごとの所要時間を加算する辞書（任意）。"hsv" はフレームごとに1回、
+          "in_range" 以降はプロファイルの合計になる
+        
+        Returns:
+        - MultiProfileResult
+        """
+        if frame is None:
+            return MultiProfileResult({})
+        
+        # 大きなフレームでは途中結果の確保のほうが計算より時間がかかるため、バッファを使い回す
+        # （結果に残すプロファイルごとのマスクだけを新しく確保する）
+        hsv, channels, channel_masks = self.get_workspace(frame.shape)
+        start = time.perf_counter()
+        cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=hsv)
+        record_stage(timings, "hsv", start)
+        
+        start = time.perf_counter()
+        cv2.split(hsv, channels)
+        record_stage(timings, "in_range", start)
+        
+        results = {}
+        computed = set()
+        for profile in self.profiles:
+            start = time.perf_counter()
+            masks = []
+            for key in profile.channel_ranges:
+                channel_mask = channel_masks.get(key)
+                if channel_mask is None:
+                    channel_mask = channel_masks[key] = np.empty(frame.shape[:2], np.uint8)
+                if key not in computed:
+                    channel, lower, upper, inverted = key
+                    cv2.inRange(channels[channel], lower, upper, channel_mask)
+                    if inverted:
+                        cv2.bitwise_not(channel_mask, channel_mask)
+                    computed.add(key)
+                masks.append(channel_mask)
+            if not masks:
+                mask = np.full(frame.shape[:2], 255, np.uint8)
+            elif len(masks) == 1:
+                mask = masks[0].copy()
+            else:
+                mask = cv2.bitwise_and(masks[0], masks[1])
+                for channel_mask in masks[2:]:
+                    cv2.bitwise_and(mask, channel_mask, mask)
+            record_stage(timings, "in_range", start)
+            results[profile.name] = analyze_mask(mask, profile.params, timings)
+        return MultiProfileResult(results)
+
+def detect_profiles(frame, detector, timings=None):
+    """is_white_cat_plush と同じ形で MultiProfileDetector を呼び出す（ベンチマーク用）"""
+    return detector.detect(frame, timings)
+
+def draw_profile_overlay(frame, result, origin=(10, 180)):
+    """プロファイルごとの判定結果をフレームに描画する（英語で表示）"""
+    x, y = origin
+    for name, profile_result in result.profiles.items():
+        details = profile_result.details
+        state = "OK" if profile_result.is_cat else "MISSING"
+        color = (0, 255, 0) if profile_result.is_cat else (0, 0, 255)
+        cv2.putText(frame, f"{name}: {state} ({profile_result.confidence:.2f}) "
+                    f"{details['white_percentage']:.1f}% shape: {details['cat_shape_detected']}", (x, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+        y += 25
@@ -0,0 +1,249 @@
+import cv2
+import numpy as np
+import time
+import json
+import platform
+import subprocess
+import datetime
+import tracemalloc
+import argparse
+import os
+
+from camera_monitor import is_white_cat_plush, make_custom_params, DEFAULT_PARAMS, STAGES
+from frame_sources import SyntheticSource, ImageDirectorySource
+from color_profiles import ColorProfile, MultiProfileDetector, detect_profiles
+
+# ベンチマーク対象の解像度
+RESOLUTIONS = {
+    "360p": (640, 360),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+
+# 合成映像の場面の種類（SyntheticSourceの引数）
+SCENES = {
+    "present": {},
+    "absent": {"absent_every": 1},  # 周期1の前半は空なので常に物体なし
+    "clutter": {"distractors": 300},  # 小さな白い斑点で輪郭数を増やす
+}
+
+def get_detectors():
+    """
+    ベンチマーク対象の検出器（名前 → 検出パラメータ）を返す
+    
+    - default: is_white_cat_plush の標準パラメータ
+    - custom: パラメータ調整モード（custom_is_white_cat_plush相当）のデフォルト値
+    - cascade: 標準パラメータでのカスケード判定
+    - lut: 標準パラメータで、HSV変換の代わりに参照表で白色のマスクを作成する
+    - profiles: 標準パラメータの白に赤と青を加えた3つのプロファイルを、1回のHSV変換で判定する
+      （default との差がプロファイルを増やしたときの所要時間の増加になる）
+    """
+    return {
+        "default": DEFAULT_PARAMS,
+        "custom": make_custom_params((0, 0, 150), (180, 60, 255)),
+        "cascade": DEFAULT_PARAMS.replace(cascade=True),
+        "lut": DEFAULT_PARAMS.replace(color_lut=True),
+        "profiles": MultiProfileDetector([
+            ColorProfile("white", DEFAULT_PARAMS),
+            ColorProfile("red", DEFAULT_PARAMS.replace(lower_white=(170, 120, 70), upper_white=(10, 255, 255))),
+            ColorProfile("blue", DEFAULT_PARAMS.replace(lower_white=(100, 120, 70), upper_white=(130, 255, 255))),
+        ]),
+    }
+
+def build_corpus(resolutions, scenes, frames_per_case=20, frames_dir=None):
+    """
+    ベンチマークに使うフレーム群を作成する
+    
+    合成映像は同じシードから生成するため、実行のたびに同じフレームになる。
+    frames_dirを指定した場合は、その画像も "recorded" として加える。
+    
+    Returns:
+    - (case_name, frames) のリスト
+    """
+    corpus = []
+    for res_name in resolutions:
+        for scene_name in scenes:
+            source = SyntheticSource(resolution=RESOLUTIONS[res_name], seed=0, **SCENES[scene_name])
+            frames = [source.frame_at(i * 7) for i in range(frames_per_case)]
+            corpus.append((f"{scene_name}@{res_name}", frames))
+    
+    if frames_dir:
+        source = ImageDirectorySource(frames_dir)
+        frames = []
+        while len(frames) < frames_per_case:
+            ret, frame = source.read()
+            if not ret:
+                break
+            frames.append(frame)
+        if frames:
+            height, width = frames[0].shape[:2]
+            corpus.append((f"recorded@{width}x{height}", frames))
+        else:
+            print(f"画像が見つかりませんでした: {frames_dir}")
+    
+    return corpus
+
+def percentiles(values):
+    """ミリ秒単位の p50 / p90 / p99 / 平均を返す"""
+    values = np.asarray(values) * 1000.0
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p90_ms": float(np.percentile(values, 90)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+    }
+
+def benchmark_case(frames, params, repeat=3, warmup=2, detect=is_white_cat_plush):
+    """
+    1つのケース（フレーム群 × 検出パラメータ）を計測する
+    
+    Returns:
+    - 段階ごとの所要時間の統計、FPS、ピークメモリ、輪郭数などの辞書
+    """
+    for frame in frames[:warmup]:
+        detect(frame, params)
+    
+    stage_samples = {stage: [] for stage in STAGES}
+    totals = []
+    contour_counts = []
+    for _ in range(repeat):
+        for frame in frames:
+            timings = {}
+            start = time.perf_counter()
+            result = detect(frame, params, timings=timings)
+            totals.append(time.perf_counter() - start)
+            contour_counts.append(len(result.contours))
+            for stage in STAGES:
+                stage_samples[stage].append(timings.get(stage, 0.0))
+    
+    # メモリ計測は計測のオーバーヘッドが時間に影響しないよう別に行う
+    tracemalloc.start()
+    for frame in frames[:3]:
+        detect(frame, params)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    
+    total_time = sum(totals)
+    return {
+        "frames": len(totals),
+        "fps": len(totals) / total_time if total_time > 0 else 0.0,
+        "total": percentiles(totals),
+        "stages": {stage: percentiles(samples) for stage, samples in stage_samples.items()},
+        "peak_memory_mb": peak / (1024 * 1024),
+        "mean_contours": float(np.mean(contour_counts)),
+    }
+
+def get_environment():
+    """計測環境の情報を返す（別のマシンやコミットとの比較用）"""
+    commit = None
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        commit = result.stdout.strip()
+    except Exception:
+        pass
+    
+    return {
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "opencv_threads": cv2.getNumThreads(),
+    }
+
+def run_benchmark(resolutions=tuple(RESOLUTIONS), scenes=tuple(SCENES), detectors=None,
+                  frames_per_case=20, repeat=3, frames_dir=None):
+    """
+    検出器のベンチマークを実行する
+    
+    Parameters:
+    - resolutions: RESOLUTIONS のキーのリスト
+    - scenes: SCENES のキーのリスト
+    - detectors: 名前 → DetectionParams（または MultiProfileDetector）の辞書（Noneの場合は get_detectors()）
+    - frames_per_case: ケースごとのフレーム数
+    - repeat: フレーム群を繰り返し処理する回数
+    - frames_dir: 録画フレームのディレクトリ（任意）
+    
+    Returns:
+    - 結果の辞書（JSONとして保存できる形式）
+    """
+    if detectors is None:
+        detectors = get_detectors()
+    
+    results = {"environment": get_environment(), "cases": []}
+    for case_name, frames in build_corpus(resolutions, scenes, frames_per_case, frames_dir):
+        height, width = frames[0].shape[:2]
+        for detector_name, params in detectors.items():
+            detect = detect_profiles if isinstance(params, MultiProfileDetector) else is_white_cat_plush
+            case = benchmark_case(frames, params, repeat=repeat, detect=detect)
+            case.update({"case": case_name, "detector": detector_name, "resolution": [width, height]})
+            results["cases"].append(case)
+            print(f"{detector_name:>8} {case_name:<20} "
+                  f"{case['fps']:8.1f} FPS  p50 {case['total']['p50_ms']:7.2f}ms  "
+                  f"p99 {case['total']['p99_ms']:7.2f}ms  "
+                  f"輪郭数 {case['mean_contours']:6.1f}  メモリ {case['peak_memory_mb']:6.1f}MB")
+    
+    return results
+
+def print_stage_table(results):
+    """段階ごとの中央値（ミリ秒）を表にして表示する"""
+    print("\n===== 段階ごとの所要時間 (p50, ms) =====")
+    print(f"{'detector':>8} {'case':<20} " + " ".join(f"{stage:>10}" for stage in STAGES))
+    for case in results["cases"]:
+        print(f"{case['detector']:>8} {case['case']:<20} " +
+              " ".join(f"{case['stages'][stage]['p50_ms']:10.3f}" for stage in STAGES))
+
+def compare_results(baseline, current):
+    """
+    2回分の結果を比較して表示する
+    
+    ケースと検出器の組み合わせごとに、FPSの比（current / baseline）を表示する
+    """
+    baseline_cases = {(case["detector"], case["case"]): case for case in baseline["cases"]}
+    print(f"\n===== 比較 ({baseline['environment'].get('commit')} → {current['environment'].get('commit')}) =====")
+    for case in current["cases"]:
+        old = baseline_cases.get((case["detector"], case["case"]))
+        if old is None or old["fps"] == 0:
+            continue
+        ratio = case["fps"] / old["fps"]
+        print(f"{case['detector']:>8} {case['case']:<20} "
+              f"{old['fps']:8.1f} → {case['fps']:8.1f} FPS  (x{ratio:.2f})")
+
+def main():
+    parser = argparse.ArgumentParser(description="白い猫のぬいぐるみ検出のベンチマーク")
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS), choices=list(RESOLUTIONS))
+    parser.add_argument("--scenes", nargs="+", default=list(SCENES), choices=list(SCENES))
+    parser.add_argument("--detectors", nargs="+", default=None, choices=list(get_detectors()),
+                        help="検出器の名前")
+    parser.add_argument("--frames", type=int, default=20, help="ケースごとのフレーム数")
+    parser.add_argument("--repeat", type=int, default=3, help="繰り返し回数")
+    parser.add_argument("--frames-dir", default=None, help="録画フレームのディレクトリ")
+    parser.add_argument("--output", default=None, help="結果を保存するJSONファイル")
+    parser.add_argument("--compare", default=None, help="比較対象の結果JSONファイル")
+    args = parser.parse_args()
+    
+    detectors = get_detectors()
+    if args.detectors:
+        detectors = {name: detectors[name] for name in args.detectors}
+    
+    results = run_benchmark(args.resolutions, args.scenes, detectors,
+                            frames_per_case=args.frames, repeat=args.repeat, frames_dir=args.frames_dir)
+    print_stage_table(results)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n結果を保存しました: {args.output}")
+    
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare_results(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
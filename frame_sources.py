@@ -0,0 +1,334 @@
+import cv2
+import numpy as np
+import os
+import glob
+import platform
+
+# 画像ディレクトリとして読み込む拡張子
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+def default_camera_backend():
+    """OSに合ったOpenCVのカメラのバックエンドを返す（WindowsはDirectShow、LinuxはV4L2）"""
+    system = platform.system()
+    if system == 'Windows':
+        return cv2.CAP_DSHOW
+    if system == 'Linux':
+        return cv2.CAP_V4L2
+    return cv2.CAP_ANY
+
+class FrameSource:
+    """
+    フレームの取得元の基底クラス
+    
+    cv2.VideoCapture と同じ isOpened() / read() / grab() / release() を持つため、
+    monitor_camera や FrameReader からカメラと同じように扱える。
+    
+    Attributes:
+    - is_live: 実時間で映像が進む取得元（カメラ）の場合はTrue
+    - finished: 録画や画像ディレクトリなど有限の取得元を最後まで読んだ場合はTrue
+    - name: 表示用の名前
+    """
+    is_live = False
+    
+    def __init__(self, name):
+        self.name = name
+        self.finished = False
+    
+    def isOpened(self):
+        return True
+    
+    def read(self):
+        raise NotImplementedError
+    
+    def grab(self):
+        ret, _ = self.read()
+        return ret
+    
+    def set(self, prop_id, value):
+        return False
+    
+    def get(self, prop_id):
+        return 0.0
+    
+    def release(self):
+        pass
+
+class CameraSource(FrameSource):
+    """
+    カメラデバイスからフレームを取得する
+    
+    Parameters:
+    - camera_index: カメラデバイス番号
+    - resolution: 解像度（幅, 高さ）
+    - backend: OpenCVのバックエンド（Noneの場合は default_camera_backend()）
+    - fps: 要求するフレームレート
+    - fourcc: 要求するピクセル形式（"MJPG", "YUYV" など。Noneの場合はドライバのデフォルト）
+    - buffer_size: ドライバのバッファに保持するフレーム数
+    """
+    is_live = True
+    
+    def __init__(self, camera_index=0, resolution=(640, 360), backend=None, fps=15, fourcc=None, buffer_size=1):
+        super().__init__(f"camera:{camera_index}")
+        self.camera_index = camera_index
+        self.cap = cv2.VideoCapture(camera_index, default_camera_backend() if backend is None else backend)
+        
+        if self.cap.isOpened():
+            # カメラのプロパティを設定（V4L2では解像度より先にピクセル形式を設定する必要がある）
+            if fourcc:
+                self.cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+            self.cap.set(cv2.CAP_PROP_FPS, fps)
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+    
+    def isOpened(self):
+        return self.cap.isOpened()
+    
+    def read(self):
+        return self.cap.read()
+    
+    def grab(self):
+        return self.cap.grab()
+    
+    def set(self, prop_id, value):
+        return self.cap.set(prop_id, value)
+    
+    def get(self, prop_id):
+        return self.cap.get(prop_id)
+    
+    def release(self):
+        self.cap.release()
+
+class VideoFileSource(FrameSource):
+    """
+    録画ファイルからフレームを取得する
+    
+    Parameters:
+    - path: 動画ファイルのパス
+    - start_frame: 読み込みを開始するフレーム番号
+    """
+    def __init__(self, path, start_frame=0):
+        super().__init__(path)
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if start_frame > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    
+    @property
+    def frame_count(self):
+        return int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    
+    @property
+    def fps(self):
+        return self.cap.get(cv2.CAP_PROP_FPS)
+    
+    def isOpened(self):
+        return self.cap.isOpened()
+    
+    def read(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            self.finished = True
+        return ret, frame
+    
+    def grab(self):
+        ret = self.cap.grab()
+        if not ret:
+            self.finished = True
+        return ret
+    
+    def set(self, prop_id, value):
+        return self.cap.set(prop_id, value)
+    
+    def get(self, prop_id):
+        return self.cap.get(prop_id)
+    
+    def release(self):
+        self.cap.release()
+
+class ImageDirectorySource(FrameSource):
+    """
+    ディレクトリ内の画像をファイル名順にフレームとして取得する
+    
+    Parameters:
+    - directory: 画像ディレクトリ
+    - loop: 最後の画像まで読んだら最初に戻るかどうか
+    """
+    def __init__(self, directory, loop=False):
+        super().__init__(directory)
+        self.directory = directory
+        self.loop = loop
+        self.paths = sorted(path for path in glob.glob(os.path.join(directory, "*"))
+                            if path.lower().endswith(IMAGE_EXTENSIONS))
+        self.position = 0
+    
+    @property
+    def frame_count(self):
+        return len(self.paths)
+    
+    def isOpened(self):
+        return len(self.paths) > 0
+    
+    def read(self):
+        if self.position >= len(self.paths):
+            if not self.loop or not self.paths:
+                self.finished = True
+                return False, None
+            self.position = 0
+        
+        frame = cv2.imread(self.paths[self.position])
+        self.position += 1
+        if frame is None:
+            print(f"画像を読み込めませんでした: {self.paths[self.position - 1]}")
+            return False, None
+        return True, frame
+    
+    def set(self, prop_id, value):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            self.position = int(value)
+            return True
+        return False
+    
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.paths))
+        return 0.0
+
+class SyntheticSource(FrameSource):
+    """
+    白い物体が映った場面を再現性のある形で生成する
+    
+    フレーム番号とシードだけから画像を作るため、同じ設定なら何度でも同じフレーム列になる。
+    カメラのない環境での動作確認やベンチマークに使う。
+    
+    Parameters:
+    - resolution: 解像度（幅, 高さ）
+    - num_frames: 生成するフレーム数（Noneの場合は無限）
+    - seed: 乱数のシード
+    - background: 背景色（BGR）
+    - blob_radius: 白い物体の半径（画像の高さに対する比率）
+    - noise: ガウスノイズの標準偏差
+    - drift: 明るさの変動幅（±の輝度値）
+    - drift_period: 明るさが一巡するフレーム数
+    - absent_every: この周期（フレーム数）の後半で物体を消す（Noneの場合は常に表示）
+    - distractors: 背景に置く小さな白い斑点の数（輪郭数を増やすため）
+    """
+    def __init__(self, resolution=(640, 360), num_frames=None, seed=0, background=(90, 70, 60),
+                 blob_radius=0.3, noise=4.0, drift=20.0, drift_period=300,
+                 absent_every=None, distractors=0):
+        super().__init__(f"synthetic:{seed}")
+        self.resolution = resolution
+        self.num_frames = num_frames
+        self.seed = seed
+        self.background = background
+        self.blob_radius = blob_radius
+        self.noise = noise
+        self.drift = drift
+        self.drift_period = drift_period
+        self.absent_every = absent_every
+        self.distractors = distractors
+        self.position = 0
+        self._noise_field = None
+        
+        # 斑点の位置はシードから一度だけ決める
+        width, height = resolution
+        rng = np.random.default_rng(seed)
+        self._distractor_points = [(int(x), int(y)) for x, y in
+                                   zip(rng.integers(0, width, distractors), rng.integers(0, height, distractors))]
+    
+    @property
+    def frame_count(self):
+        return self.num_frames
+    
+    def is_present(self, index):
+        """index番目のフレームに白い物体が映っているかどうか"""
+        if not self.absent_every:
+            return True
+        return (index % self.absent_every) < self.absent_every // 2
+    
+    def frame_at(self, index):
+        """index番目のフレームを生成する"""
+        width, height = self.resolution
+        frame = np.empty((height, width, 3), np.uint8)
+        frame[:] = self.background
+        
+        if self.is_present(index):
+            # 物体をゆっくり左右に動かす
+            radius = int(min(width, height) * self.blob_radius)
+            center_x = int(width / 2 + width / 8 * np.sin(index / 50.0))
+            cv2.ellipse(frame, (center_x, height // 2), (radius, int(radius * 0.8)), 0, 0, 360,
+                        (235, 235, 235), -1)
+            # 耳
+            cv2.circle(frame, (center_x - radius // 2, height // 2 - int(radius * 0.8)), radius // 4,
+                       (235, 235, 235), -1)
+            cv2.circle(frame, (center_x + radius // 2, height // 2 - int(radius * 0.8)), radius // 4,
+                       (235, 235, 235), -1)
+        
+        for point in self._distractor_points:
+            cv2.circle(frame, point, max(2, height // 90), (240, 240, 240), -1)
+        
+        # 明るさの変動とノイズ
+        # ノイズは最初に1枚だけ生成し、フレームごとに行をずらして使う（毎回生成すると高解像度では遅いため）
+        offset = int(round(self.drift * np.sin(2 * np.pi * index / self.drift_period)))
+        if self.noise > 0 or offset != 0:
+            noisy = frame.astype(np.int16)
+            if offset != 0:
+                noisy += offset
+            if self.noise > 0:
+                if self._noise_field is None:
+                    rng = np.random.default_rng(self.seed)
+                    self._noise_field = np.round(rng.normal(0, self.noise, frame.shape)).astype(np.int16)
+                noisy += np.roll(self._noise_field, (index * 7919) % height, axis=0)
+            frame = np.clip(noisy, 0, 255).astype(np.uint8)
+        
+        return frame
+    
+    def read(self):
+        if self.num_frames is not None and self.position >= self.num_frames:
+            self.finished = True
+            return False, None
+        frame = self.frame_at(self.position)
+        self.position += 1
+        return True, frame
+    
+    def set(self, prop_id, value):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            self.position = int(value)
+            return True
+        return False
+    
+    def get(self, prop_id):
+        if prop_id == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        if prop_id == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.num_frames or 0)
+        return 0.0
+
+def open_frame_source(spec, resolution=(640, 360)):
+    """
+    指定に応じたフレームの取得元を作成する
+    
+    Parameters:
+    - spec: 次のいずれか
+      - int または数字の文字列: カメラデバイス番号
+      - "synthetic" または "synthetic:<seed>": 合成映像
+      - ディレクトリのパス: 画像ディレクトリ
+      - ファイルのパス: 録画ファイル
+      - FrameSource: そのまま返す
+    - resolution: 解像度（幅, 高さ）（カメラと合成映像のみ）
+    
+    Returns:
+    - FrameSource
+    """
+    if isinstance(spec, FrameSource):
+        return spec
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.isdigit()):
+        return CameraSource(int(spec), resolution=resolution)
+    if spec == "synthetic" or spec.startswith("synthetic:"):
+        seed = int(spec.split(":", 1)[1]) if ":" in spec else 0
+        return SyntheticSource(resolution=resolution, seed=seed)
+    if os.path.isdir(spec):
+        return ImageDirectorySource(spec)
+    return VideoFileSource(spec)
@@ -0,0 +1,559 @@
+import cv2
+import time
+import json
+import datetime
+import threading
+import argparse
+
+from camera_monitor import (DetectionParams, DetectionResult, DEFAULT_PARAMS, REFERENCE_RESOLUTION,
+                            FrameReader, compute_white_mask, clean_white_mask, find_white_contours,
+                            classify_regions, evaluate_regions, draw_status_overlay, draw_mask_overlay,
+                            close_camera_app, warm_up_camera)
+from frame_sources import CameraSource, open_frame_source
+from preview_server import PreviewServer
+
+# 調整モードで再計算する処理段階（この順に依存する）
+TUNING_STAGES = ("mask", "morphology", "contours", "shape", "evaluate")
+
+# パラメータごとに、値が変わったときに再計算が必要になる最初の段階
+# （ここにないパラメータは調整モードの判定に影響しない）
+PARAM_STAGES = {
+    "lower_white": "mask",
+    "upper_white": "mask",
+    "color_lut": "mask",
+    "kernel_size": "morphology",
+    "area_threshold": "shape",
+    "area_ratio": "shape",
+    "min_vertices": "shape",
+    "white_threshold": "evaluate",
+    "confidence_scale": "evaluate",
+}
+
+# トラックバーの定義（表示名, パラメータ名, HSVの要素番号, 最大値, 倍率）
+TRACKBARS = (
+    ("H min", "lower_white", 0, 180, 1),
+    ("H max", "upper_white", 0, 180, 1),
+    ("S min", "lower_white", 1, 255, 1),
+    ("S max", "upper_white", 1, 255, 1),
+    ("V min", "lower_white", 2, 255, 1),
+    ("V max", "upper_white", 2, 255, 1),
+    ("White % x10", "white_threshold", None, 1000, 10),
+    ("Area", "area_threshold", None, 50000, 1),
+    ("Kernel", "kernel_size", None, 31, 1),
+    ("Vertices", "min_vertices", None, 20, 1),
+)
+
+TUNING_WINDOW = "Tuning"
+
+# HSVの要素ごとの最大値（色相はトラックバーと同じく180まで受け付ける）
+HSV_MAX = (180, 255, 255)
+
+# /params で受け付けるパラメータの値の種類と範囲（種類, 最小値, 最大値）
+PARAM_RULES = {
+    "lower_white": ("hsv", None, None),
+    "upper_white": ("hsv", None, None),
+    "white_threshold": ("number", 0, 100),
+    "area_threshold": ("number", 0, None),
+    "kernel_size": ("int", 1, None),
+    "min_vertices": ("int", 0, None),
+    "confidence_scale": ("number", 0.1, None),
+    "area_ratio": ("optional_number", 0, 1),
+    "cascade": ("bool", None, None),
+    "cascade_width": ("int", 1, None),
+    "cascade_margin": ("number", 0, None),
+    "color_lut": ("bool", None, None),
+}
+
+def validate_param(key, value):
+    """
+    /params で受け取ったパラメータの値の型と範囲を確認する
+    
+    値が正しくない場合は ValueError を送出する（プレビューサーバーは 400 を返す）
+    """
+    kind, minimum, maximum = PARAM_RULES[key]
+    if kind == "hsv":
+        if (not isinstance(value, (list, tuple)) or len(value) != 3 or
+                not all(isinstance(v, int) and not isinstance(v, bool) for v in value)):
+            raise ValueError(f"{key} は3つの整数 [H, S, V] で指定してください: {value!r}")
+        for name, v, limit in zip("HSV", value, HSV_MAX):
+            if not 0 <= v <= limit:
+                raise ValueError(f"{key} の{name}は0〜{limit}で指定してください: {v}")
+        return
+    if kind == "bool":
+        if not isinstance(value, bool):
+            raise ValueError(f"{key} は true か false で指定してください: {value!r}")
+        return
+    if kind == "optional_number" and value is None:
+        return
+    types = (int,) if kind == "int" else (int, float)
+    if not isinstance(value, types) or isinstance(value, bool):
+        raise ValueError(f"{key} は{'整数' if kind == 'int' else '数値'}で指定してください: {value!r}")
+    if maximum is None and value < minimum:
+        raise ValueError(f"{key} は{minimum}以上で指定してください: {value}")
+    if maximum is not None and not minimum <= value <= maximum:
+        raise ValueError(f"{key} は{minimum}〜{maximum}の範囲で指定してください: {value}")
+
+def changed_stage(old_params, new_params):
+    """
+    2つのパラメータを比べ、再計算が必要になる最初の段階を返す
+    
+    Returns:
+    - TUNING_STAGES のいずれか（再計算が不要な場合はNone）
+    """
+    old_values = old_params.to_dict()
+    new_values = new_params.to_dict()
+    first = None
+    for key, stage in PARAM_STAGES.items():
+        if old_values.get(key) == new_values.get(key):
+            continue
+        if first is None or TUNING_STAGES.index(stage) < TUNING_STAGES.index(first):
+            first = stage
+    return first
+
+class StageCache:
+    """
+    1枚のフレームについて処理段階ごとの途中結果を保持し、必要な段階だけ再計算するクラス
+    
+    パラメータを変更すると、そのパラメータより下流の段階だけを破棄する。
+    例えば面積の閾値だけを変えた場合はマスク・ノイズ除去・輪郭抽出の結果を再利用し、
+    形状の判定と最終判定だけをやり直す。フレームを差し替えるとすべて再計算する。
+    
+    カスケード判定は使わず、常に元の解像度で判定する（結果は analyze_frame と同じ）。
+    
+    Parameters:
+    - params: 検出パラメータ（DetectionParams）
+    """
+    def __init__(self, params=DEFAULT_PARAMS):
+        self.params = params
+        self.frame = None
+        self.last_recomputed = ()
+        self.last_timings = {}
+        self._values = {}
+    
+    def set_frame(self, frame):
+        """判定するフレームを差し替える（すべての段階を破棄する）"""
+        self.frame = frame
+        self._values.clear()
+    
+    def set_params(self, params):
+        """
+        パラメータを変更し、影響を受ける段階以降を破棄する
+        
+        Returns:
+        - 再計算が必要になった最初の段階（不要な場合はNone）
+        """
+        stage = changed_stage(self.params, params)
+        self.params = params
+        if stage is not None:
+            self.invalidate(stage)
+        return stage
+    
+    def is_complete(self):
+        """すべての段階の結果がそろっているかどうかを返す"""
+        return all(stage in self._values for stage in TUNING_STAGES)
+    
+    def invalidate(self, stage):
+        """指定した段階とそれより下流の段階の結果を破棄する"""
+        for name in TUNING_STAGES[TUNING_STAGES.index(stage):]:
+            self._values.pop(name, None)
+    
+    def result(self):
+        """
+        判定結果を返す（破棄された段階だけを再計算する）
+        
+        再計算した段階と所要時間は last_recomputed と last_timings に記録する
+        
+        Returns:
+        - DetectionResult（フレームがない場合はNone）
+        """
+        if self.frame is None:
+            return None
+        
+        params = self.params
+        values = self._values
+        timings = {}
+        recomputed = []
+        
+        if "mask" not in values:
+            values["mask"] = compute_white_mask(self.frame, params, timings)
+            recomputed.append("mask")
+        if "morphology" not in values:
+            clean_mask = clean_white_mask(values["mask"], params, timings)
+            white_percentage = cv2.countNonZero(clean_mask) / (clean_mask.shape[0] * clean_mask.shape[1]) * 100
+            values["morphology"] = (clean_mask, white_percentage)
+            recomputed.append("morphology")
+        clean_mask, white_percentage = values["morphology"]
+        if "contours" not in values:
+            values["contours"] = find_white_contours(clean_mask, timings)
+            recomputed.append("contours")
+        if "shape" not in values:
+            values["shape"] = classify_regions(values["contours"], clean_mask.shape, params, timings)
+            recomputed.append("shape")
+        if "evaluate" not in values:
+            start = time.perf_counter()
+            values["evaluate"] = evaluate_regions(white_percentage, values["shape"], params)
+            timings["evaluate"] = time.perf_counter() - start
+            recomputed.append("evaluate")
+        
+        if recomputed:
+            self.last_recomputed = tuple(recomputed)
+            self.last_timings = timings
+        is_cat, confidence, details = values["evaluate"]
+        return DetectionResult(is_cat, confidence, dict(details), hsv_mask=values["mask"],
+                               clean_mask=clean_mask, contours=values["contours"],
+                               regions=values["shape"], params=params)
+
+class LiveTuner:
+    """
+    ライブ映像または固定したフレームで検出パラメータを調整するクラス
+    
+    ウィンドウを表示する場合はトラックバーで、ヘッドレスの場合はプレビューサーバーの
+    /params（GETで現在の値、POSTでJSONの変更）で閾値を変更する。変更は StageCache により
+    影響を受ける段階だけを再計算するため、高解像度でもすぐに結果が反映される。
+    
+    Parameters:
+    - cap: フレームの取得元（FrameSource）
+    - params: 調整を始めるときの検出パラメータ
+    - show_window: トラックバー付きのウィンドウを表示するかどうか
+    - control_port: 指定した場合、このポートでプレビューと /params を配信する（0の場合は空きポート）
+    - refresh_interval: 固定していない場合に新しいフレームを取り込む最小間隔（秒）
+    - display_width: ウィンドウに表示するフレームの最大幅
+    """
+    def __init__(self, cap, params=DEFAULT_PARAMS, show_window=True, control_port=None,
+                 refresh_interval=0.1, display_width=1280):
+        self.cap = cap
+        self.initial_params = params.replace(cascade=False)
+        self.cache = StageCache(self.initial_params)
+        self.show_window = show_window
+        self.control_port = control_port
+        self.refresh_interval = refresh_interval
+        self.display_width = display_width
+        self.frozen = False
+        self.preview = None
+        self.reader = None
+        
+        self._lock = threading.Lock()
+        self._pending_params = None
+        self._pending_frozen = None
+        self._changed = threading.Event()
+        self._last_frame_timestamp = None
+        self._last_refresh = 0.0
+    
+    @property
+    def params(self):
+        """現在の検出パラメータ"""
+        return self.cache.params
+    
+    def handle_control(self, changes):
+        """
+        /params への要求を処理する（プレビューサーバーのスレッドから呼ばれる）
+        
+        Parameters:
+        - changes: 変更するパラメータの辞書（GETの場合はNone）。"frozen" でフレームの固定も切り替えられる
+        
+        Returns:
+        - 現在の設定の辞書
+        """
+        if changes is not None:
+            changes = dict(changes)
+            frozen = changes.pop("frozen", None)
+            unknown = set(changes) - set(self.params.to_dict())
+            if unknown:
+                raise ValueError(f"不明なパラメータです: {', '.join(sorted(unknown))}")
+            for key, value in changes.items():
+                validate_param(key, value)
+            with self._lock:
+                base = self._pending_params or self.params
+                # 面積閾値を比率で扱っている場合は、トラックバーと同じく基準解像度での面積から比率を求め直す
+                if "area_threshold" in changes and "area_ratio" not in changes and base.area_ratio is not None:
+                    changes["area_ratio"] = changes["area_threshold"] / (REFERENCE_RESOLUTION[0] * REFERENCE_RESOLUTION[1])
+                try:
+                    params = base.replace(**changes)
+                except (TypeError, ValueError) as e:
+                    raise ValueError(f"パラメータが正しくありません: {e}")
+                # 片方だけを変更した場合も、変更後の下限と上限の組み合わせで確認する
+                inverted = [name for name, lower, upper in zip("HSV", params.lower_white, params.upper_white)
+                            if lower > upper]
+                if inverted:
+                    raise ValueError(f"lower_white が upper_white より大きい要素があります: {', '.join(inverted)}")
+                self._pending_params = params
+                if frozen is not None:
+                    self._pending_frozen = bool(frozen)
+            self._changed.set()
+        
+        with self._lock:
+            params = self._pending_params or self.params
+            return {
+                "params": params.to_dict(),
+                "frozen": self.frozen if self._pending_frozen is None else self._pending_frozen,
+                "last_recomputed": list(self.cache.last_recomputed),
+                "last_timings_ms": {stage: value * 1000 for stage, value in self.cache.last_timings.items()},
+            }
+    
+    def create_trackbars(self):
+        """調整用のウィンドウとトラックバーを作成する"""
+        cv2.namedWindow(TUNING_WINDOW)
+        values = self.params.to_dict()
+        for label, key, index, maximum, scale in TRACKBARS:
+            value = values[key] if index is None else values[key][index]
+            cv2.createTrackbar(label, TUNING_WINDOW, int(round(value * scale)), maximum, lambda _: None)
+    
+    def sync_trackbars(self):
+        """トラックバーの位置を現在のパラメータに合わせる（/params で変更した場合）"""
+        values = self.params.to_dict()
+        for label, key, index, maximum, scale in TRACKBARS:
+            value = values[key] if index is None else values[key][index]
+            cv2.setTrackbarPos(label, TUNING_WINDOW, min(maximum, int(round(value * scale))))
+    
+    def read_trackbars(self):
+        """トラックバーの位置から検出パラメータを作成する（変更がない場合は現在のパラメータ）"""
+        values = self.params.to_dict()
+        changes = {}
+        for label, key, index, maximum, scale in TRACKBARS:
+            position = cv2.getTrackbarPos(label, TUNING_WINDOW)
+            value = position / scale if scale != 1 else position
+            if index is None:
+                if value != values[key]:
+                    changes[key] = value
+            else:
+                current = list(changes.get(key, values[key]))
+                if current[index] != value:
+                    current[index] = value
+                    changes[key] = tuple(current)
+        if not changes:
+            return self.params
+        
+        changes["kernel_size"] = max(1, int(changes.get("kernel_size", values["kernel_size"])))
+        # 面積閾値を比率で扱っている場合は、基準解像度での面積から比率を求め直す
+        if "area_threshold" in changes and values["area_ratio"] is not None:
+            changes["area_ratio"] = changes["area_threshold"] / (REFERENCE_RESOLUTION[0] * REFERENCE_RESOLUTION[1])
+        return self.params.replace(**changes)
+    
+    def refresh_frame(self):
+        """
+        固定していない場合に新しいフレームを取り込む
+        
+        Returns:
+        - フレームを差し替えた場合はTrue
+        """
+        if self.frozen or time.time() - self._last_refresh < self.refresh_interval:
+            return False
+        
+        if self.reader is not None:
+            ret, frame, timestamp = self.reader.read()
+            if not ret or timestamp == self._last_frame_timestamp:
+                return False
+            self._last_frame_timestamp = timestamp
+        else:
+            ret, frame = self.cap.read()
+            if not ret:
+                if self.cap.finished and self.cache.frame is not None:
+                    print("取得元の最後のフレームに達したため、最後のフレームで固定します")
+                    self.frozen = True
+                return False
+        
+        self._last_refresh = time.time()
+        self.cache.set_frame(frame)
+        return True
+    
+    def apply_pending(self):
+        """/params で受け取った変更を反映する"""
+        with self._lock:
+            params, self._pending_params = self._pending_params, None
+            frozen, self._pending_frozen = self._pending_frozen, None
+        if frozen is not None:
+            self.frozen = frozen
+        if params is not None:
+            self.cache.set_params(params)
+            if self.show_window:
+                self.sync_trackbars()
+    
+    def render(self, result):
+        """判定結果と再計算した段階をフレームに描画して返す"""
+        frame = self.cache.frame.copy()
+        if result.is_cat:
+            status, status_color = "Normal", (0, 255, 0)
+        else:
+            status, status_color = "Alert", (0, 0, 255)
+        draw_status_overlay(frame, result, status, status_color,
+                            datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        try:
+            draw_mask_overlay(frame, result)
+        except Exception as e:
+            print(f"マスク画像の表示中にエラーが発生しました: {e}")
+        
+        total_ms = sum(self.cache.last_timings.values()) * 1000
+        recomputed = ",".join(self.cache.last_recomputed) or "none"
+        mode = "FROZEN" if self.frozen else "LIVE"
+        cv2.putText(frame, f"{mode}  Recomputed: {recomputed} ({total_ms:.1f} ms)", (10, 180),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+        
+        height, width = frame.shape[:2]
+        if self.show_window and width > self.display_width:
+            frame = cv2.resize(frame, (self.display_width, int(height * self.display_width / width)),
+                               interpolation=cv2.INTER_AREA)
+        return frame, status
+    
+    def save_params(self, path):
+        """現在のパラメータをJSONに保存する（offline_analysis.py の --params などで使える形式）"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.params.to_dict(), f, indent=2, ensure_ascii=False)
+        print(f"パラメータを保存しました: {path}")
+    
+    def run(self, save_path=None, stop_event=None):
+        """
+        調整を開始する（ESCキー、Ctrl+C、またはstop_eventで終了）
+        
+        ウィンドウのキー操作:
+        - スペース: フレームの固定・解除
+        - r: 調整前のパラメータに戻す
+        - s: パラメータを保存する（save_pathを指定した場合）
+        
+        Returns:
+        - 調整後の検出パラメータ
+        """
+        if self.cap.is_live:
+            self.reader = FrameReader(self.cap).start()
+        if self.control_port is not None:
+            self.preview = PreviewServer(port=self.control_port, control_handler=self.handle_control).start()
+            print(f"パラメータの変更: curl -X POST -d '{{\"area_threshold\": 4000}}' "
+                  f"http://{self.preview.host}:{self.preview.port}/params")
+        if self.show_window:
+            self.create_trackbars()
+            print("トラックバーで閾値を調整してください（スペース: フレームの固定・解除、r: 元に戻す、"
+                  "s: 保存、ESC: 終了）")
+        
+        last_rendered = None
+        try:
+            while stop_event is None or not stop_event.is_set():
+                self.apply_pending()
+                if self.show_window:
+                    self.cache.set_params(self.read_trackbars())
+                self.refresh_frame()
+                
+                changed = not self.cache.is_complete()
+                result = self.cache.result()
+                if result is not None and (changed or last_rendered is None):
+                    last_rendered, status = self.render(result)
+                    if self.preview is not None:
+                        self.preview.publish(last_rendered, copy=False, status={
+                            "status": status,
+                            "confidence": result.confidence,
+                            "white_percentage": result.details["white_percentage"],
+                            "large_white_regions": result.details["large_white_regions"],
+                            "cat_shape_detected": result.details["cat_shape_detected"],
+                            "frozen": self.frozen,
+                            "recomputed": list(self.cache.last_recomputed),
+                        })
+                    if self.show_window:
+                        cv2.imshow(TUNING_WINDOW, last_rendered)
+                elif self.preview is not None and last_rendered is not None:
+                    # 変化がなくても新しく接続した閲覧者に最新のフレームを送る
+                    self.preview.publish(last_rendered, copy=False)
+                
+                if self.show_window:
+                    key = cv2.waitKey(15) & 0xFF
+                    if key == 27:
+                        break
+                    elif key == ord(" "):
+                        self.frozen = not self.frozen
+                        print("フレームを固定しました" if self.frozen else "フレームの固定を解除しました")
+                    elif key == ord("r"):
+                        cv2.destroyWindow(TUNING_WINDOW)
+                        self.cache.set_params(self.initial_params)
+                        self.create_trackbars()
+                        last_rendered = None
+                    elif key == ord("s") and save_path:
+                        self.save_params(save_path)
+                else:
+                    # 変更があるか、次のフレームを取り込む時刻まで待つ
+                    self._changed.wait(self.refresh_interval if not self.frozen else 0.2)
+                    self._changed.clear()
+        
+        except KeyboardInterrupt:
+            print("\n調整を終了します")
+        
+        finally:
+            if self.reader is not None:
+                self.reader.stop()
+            if self.preview is not None:
+                self.preview.stop()
+            if self.show_window:
+                cv2.destroyAllWindows()
+        
+        self.apply_pending()
+        if save_path:
+            self.save_params(save_path)
+        print("調整後のパラメータ:")
+        print(json.dumps(self.params.to_dict(), ensure_ascii=False))
+        return self.params
+
+def tune_live(source=None, camera_index=0, resolution=(640, 360), params=DEFAULT_PARAMS, show_window=True,
+              control_port=None, save_path=None, refresh_interval=0.1, stop_event=None):
+    """
+    検出パラメータをライブで調整する
+    
+    カメラを開き直さずに閾値を変更できるため、カメラアプリの終了待ちやウォームアップは最初の1回だけで済む。
+    
+    Parameters:
+    - source: カメラの代わりに使うフレームの取得元（録画ファイル、画像ディレクトリ、"synthetic"、FrameSource）
+    - camera_index: カメラデバイス番号（sourceを指定しない場合）
+    - resolution: 解像度（幅, 高さ）
+    - params: 調整を始めるときの検出パラメータ
+    - show_window: トラックバー付きのウィンドウを表示するかどうか
+    - control_port: 指定した場合、このポートでプレビューと /params を配信する（ヘッドレスでの調整用）
+    - save_path: 終了時にパラメータを保存するJSONファイル（任意）
+    - refresh_interval: 固定していない場合に新しいフレームを取り込む最小間隔（秒）
+    - stop_event: is_set() がTrueになったら調整を終了するイベント（任意）
+    
+    Returns:
+    - 調整後の検出パラメータ（取得元を開けなかった場合はNone）
+    """
+    if source is not None:
+        cap = open_frame_source(source, resolution=resolution)
+    else:
+        close_camera_app()
+        cap = CameraSource(camera_index, resolution=resolution)
+    
+    if not cap.isOpened():
+        print(f"エラー: カメラを開くことができませんでした")
+        return None
+    
+    try:
+        if cap.is_live:
+            print("カメラウォームアップ中...")
+            frames, stable = warm_up_camera(cap)
+            if not stable:
+                print(f"  警告: 映像が安定しないまま開始します（{frames}フレーム）")
+        tuner = LiveTuner(cap, params=params, show_window=show_window, control_port=control_port,
+                          refresh_interval=refresh_interval)
+        return tuner.run(save_path=save_path, stop_event=stop_event)
+    finally:
+        cap.release()
+
+def main():
+    parser = argparse.ArgumentParser(description="白色検出パラメータのライブ調整")
+    parser.add_argument("source", nargs="?", default="0",
+                        help="カメラデバイス番号、録画ファイル、画像ディレクトリ、または synthetic")
+    parser.add_argument("--resolution", type=int, nargs=2, default=(640, 360), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--params", default=None, help="調整を始めるときの検出パラメータのJSONファイル")
+    parser.add_argument("--save", default=None, help="調整後のパラメータを保存するJSONファイル")
+    parser.add_argument("--headless", action="store_true", help="ウィンドウを表示せず、--port の /params で調整する")
+    parser.add_argument("--port", type=int, default=None, help="プレビューと /params を配信するポート")
+    args = parser.parse_args()
+    
+    params = DEFAULT_PARAMS
+    if args.params:
+        with open(args.params, encoding="utf-8") as f:
+            params = DetectionParams(**json.load(f))
+    port = args.port
+    if args.headless and port is None:
+        port = 8080
+    
+    source = None if args.source.isdigit() else args.source
+    tune_live(source=source, camera_index=int(args.source) if args.source.isdigit() else 0,
+              resolution=tuple(args.resolution), params=params, show_window=not args.headless,
+              control_port=port, save_path=args.save)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import inspect
+import argparse
+
+from camera_monitor import monitor_camera, DetectionParams, DEFAULT_PARAMS
+from monitor_options import OPTION_GROUPS
+from color_profiles import ColorProfile
+from zones import Zone
+
+# 監視中に反映できる設定（次のチェックから適用する）
+LIVE_OPTIONS = ("interval", "schedule", "duration", "max_frame_age", "profiles", "zones")
+
+# 反映するためにカメラを開き直す設定
+REOPEN_OPTIONS = ("camera_index", "camera_name", "resolution", "capture")
+
+# 設定ファイルでは指定できない monitor_camera の引数
+EXCLUDED_OPTIONS = ("params", "stop_event", "on_check", "config_watcher")
+
+# 設定ファイルのひな形に含める監視の設定
+TEMPLATE_OPTIONS = ("interval", "duration", "camera_index", "camera_name", "resolution", "log_dir", "save_alerts",
+                    "show_window", "preview_port", "schedule", "alerts")
+
+def monitor_options():
+    """設定ファイルで指定できる monitor_camera の引数名 → デフォルト値の辞書を返す"""
+    return {name: parameter.default for name, parameter in inspect.signature(monitor_camera).parameters.items()
+            if name not in EXCLUDED_OPTIONS}
+
+def parse_config(data, base_dir="."):
+    """
+    設定の辞書を検証し、monitor_camera の引数と検出パラメータに分ける
+    
+    設定は {"monitor": {monitor_camera の引数}, "params": {DetectionParams の引数}} の形式で、
+    "params" には live_tuning.py や threshold_sweep.py で保存したJSONファイルのパスも指定できる
+    （相対パスは設定ファイルのディレクトリから探す）。複数の物体を監視する場合は "monitor" の "profiles" に
+    {"name": プロファイル名, "params": 検出パラメータまたはJSONファイルのパス} のリストを、
+    領域の規則は "zones" に {"name", "rect" または "polygon", "rule", "threshold", "profile"} のリストを指定する。
+    "capture" や "clips" などのまとめた設定は、monitor_options.py のクラスの引数の辞書で指定する
+    （true はデフォルト値で有効にする）。
+    
+    Returns:
+    - options: monitor_camera の引数の辞書
+    - params: DetectionParams
+    """
+    if not isinstance(data, dict):
+        raise ValueError("設定はJSONのオブジェクトで指定してください")
+    unknown = set(data) - {"monitor", "params"}
+    if unknown:
+        raise ValueError(f"不明な項目があります: {', '.join(sorted(unknown))}")
+    
+    options = dict(data.get("monitor") or {})
+    unknown = set(options) - set(monitor_options())
+    if unknown:
+        raise ValueError(f"不明な監視の設定があります: {', '.join(sorted(unknown))}")
+    if options.get("resolution") is not None:
+        options["resolution"] = tuple(options["resolution"])
+    if options.get("profiles") is not None:
+        options["profiles"] = [ColorProfile.from_dict(profile, base_dir) for profile in options["profiles"]]
+    if options.get("zones") is not None:
+        options["zones"] = [Zone.from_dict(zone) for zone in options["zones"]]
+    for name, group in OPTION_GROUPS.items():
+        if name in options:
+            options[name] = group.from_dict(options[name])
+    
+    params_data = data.get("params") or {}
+    if isinstance(params_data, str):
+        with open(os.path.join(base_dir, params_data), encoding="utf-8") as f:
+            params_data = json.load(f)
+    try:
+        params = DetectionParams(**params_data)
+    except TypeError as e:
+        raise ValueError(f"検出パラメータが正しくありません: {e}")
+    return options, params
+
+def load_config(path):
+    """設定ファイルを読み込み、(monitor_camera の引数, DetectionParams) を返す"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return parse_config(data, os.path.dirname(os.path.abspath(path)))
+
+def write_template(path):
+    """設定ファイルのひな形を書き出す"""
+    defaults = monitor_options()
+    data = {
+        # まとめた設定はデフォルト値の辞書で書き出す
+        "monitor": {name: OPTION_GROUPS[name]().to_dict() if name in OPTION_GROUPS else defaults[name]
+                    for name in TEMPLATE_OPTIONS},
+        "params": DEFAULT_PARAMS.to_dict(),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    print(f"設定ファイルのひな形を保存しました: {path}")
+
+class ConfigWatcher:
+    """
+    設定ファイルの変更を監視し、監視中の monitor_camera に反映する変更を求めるクラス
+    
+    poll() はファイルの更新時刻と大きさだけを調べるため、チェックごとに呼び出してもよい。
+    変更を読み込めなかった場合（書きかけのJSONなど）はエラーを表示し、以前の設定を使い続ける。
+    
+    Parameters:
+    - path: 設定ファイルのパス
+    - overrides: 設定ファイルより優先する monitor_camera の引数（コマンドラインの指定など）
+    - poll_interval: ファイルを調べる最小の間隔（秒）
+    """
+    def __init__(self, path, overrides=None, poll_interval=1.0):
+        self.path = path
+        self.overrides = dict(overrides or {})
+        self.poll_interval = poll_interval
+        self.reload_count = 0
+        self.error_count = 0
+        self._last_poll = 0.0
+        self._signature = self._stat()
+        self.options, self.params = self.load()
+    
+    def _stat(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+    
+    def load(self):
+        """設定ファイルを読み込み、コマンドラインの指定を反映した (引数, DetectionParams) を返す"""
+        options, params = load_config(self.path)
+        options.update(self.overrides)
+        return options, params
+    
+    def poll(self):
+        """
+        設定ファイルが変更されていれば読み込み、前回との差分を返す
+        
+        Returns:
+        - 変更がない場合はNone。ある場合は次の辞書
+          - params: 新しい DetectionParams（検出パラメータが変わっていない場合はNone）
+          - live: 監視中に反映できる設定の変更（名前 → 値）
+          - reopen: カメラを開き直す必要がある設定の変更（名前 → 値）
+          - restart: 反映するには監視の再起動が必要な設定の名前のリスト
+        """
+        now = time.monotonic()
+        if now - self._last_poll < self.poll_interval:
+            return None
+        self._last_poll = now
+        
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return None
+        self._signature = signature
+        try:
+            options, params = self.load()
+        except (OSError, ValueError) as e:
+            self.error_count += 1
+            print(f"設定ファイルを読み込めませんでした（以前の設定を使い続けます）: {e}")
+            return None
+        
+        defaults = monitor_options()
+        changed = {name: options.get(name, defaults[name]) for name in set(options) | set(self.options)
+                   if options.get(name, defaults[name]) != self.options.get(name, defaults[name])}
+        change = {
+            "params": params if params.to_dict() != self.params.to_dict() else None,
+            "live": {name: value for name, value in changed.items() if name in LIVE_OPTIONS},
+            "reopen": {name: value for name, value in changed.items() if name in REOPEN_OPTIONS},
+            "restart": sorted(name for name in changed if name not in LIVE_OPTIONS and name not in REOPEN_OPTIONS),
+        }
+        self.options, self.params = options, params
+        self.reload_count += 1
+        return change
+
+def main():
+    parser = argparse.ArgumentParser(description="設定ファイルによる白い猫のぬいぐるみの監視")
+    parser.add_argument("config", nargs="?", default=None, help="設定ファイル（JSON）")
+    parser.add_argument("--no-watch", action="store_true", help="設定ファイルの変更を監視しない")
+    parser.add_argument("--write-template", metavar="PATH", default=None, help="設定ファイルのひな形を書き出して終了する")
+    parser.add_argument("--interval", type=float, default=None, help="チェック間隔（秒）")
+    parser.add_argument("--duration", type=float, default=None, help="監視時間（秒）")
+    parser.add_argument("--camera", default=None, help="カメラデバイス番号またはカメラ名")
+    parser.add_argument("--source", default=None, help="カメラの代わりに使う録画ファイル・画像ディレクトリ・synthetic")
+    parser.add_argument("--resolution", type=int, nargs=2, default=None, metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--log-dir", default=None, help="ログを保存するディレクトリ")
+    parser.add_argument("--headless", action="store_true", help="ウィンドウを表示しない")
+    parser.add_argument("--preview-port", type=int, default=None, help="プレビュー配信のポート")
+    args = parser.parse_args()
+    
+    if args.write_template:
+        write_template(args.write_template)
+        return
+    
+    # コマンドラインの指定は設定ファイルより優先する
+    overrides = {}
+    if args.interval is not None:
+        overrides["interval"] = args.interval
+    if args.duration is not None:
+        overrides["duration"] = args.duration
+    if args.camera is not None:
+        if args.camera.isdigit():
+            overrides["camera_index"] = int(args.camera)
+        else:
+            overrides["camera_name"] = args.camera
+    if args.source is not None:
+        overrides["source"] = args.source
+    if args.resolution is not None:
+        overrides["resolution"] = tuple(args.resolution)
+    if args.log_dir is not None:
+        overrides["log_dir"] = args.log_dir
+    if args.headless:
+        overrides["show_window"] = False
+    if args.preview_port is not None:
+        overrides["preview_port"] = args.preview_port
+    
+    watcher = None
+    if args.config is None:
+        options, params = overrides, DEFAULT_PARAMS
+    elif args.no_watch:
+        options, params = load_config(args.config)
+        options.update(overrides)
+    else:
+        watcher = ConfigWatcher(args.config, overrides=overrides)
+        options, params = watcher.options, watcher.params
+        print(f"設定ファイルの変更を監視します: {args.config}")
+    
+    monitor_camera(params=params, config_watcher=watcher, **options)
+
+if __name__ == "__main__":
+    main()
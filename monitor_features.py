@@ -0,0 +1,264 @@
+import os
+import time
+import datetime
+
+from alert_writer import AlertWriter, AlertDeduplicator, FrameRing, ClipRecorder
+from notifier import Notifier, make_targets
+from preview_server import PreviewServer
+from monitor_metrics import MonitorMetrics
+from check_log import CheckLogWriter, VERDICT_ALERT, VERDICT_NORMAL, VERDICT_CAPTURE_FAILURE
+
+class MonitorFeatures:
+    """
+    監視ループとは別に動く機能（異常検知画像・動画・常時記録・通知・プレビュー・計測・チェックログ）をまとめるクラス
+    
+    start_*() で有効にした機能だけを作成し、無効な機能の属性はNoneのままにする。
+    close() はすべての機能を止め、保存待ちの画像・動画・通知を書き出してから戻る。
+    
+    Parameters:
+    - log_dir: ログを保存するディレクトリ
+    - camera: 記録と計測に使うカメラ名
+    """
+    def __init__(self, log_dir, camera):
+        self.log_dir = log_dir
+        self.camera = camera
+        self.alert_writer = None
+        self.alert_dedup = None
+        self.clip_ring = None
+        self.clip_recorder = None
+        self.black_box = None
+        self.notifier = None
+        self.preview = None
+        self.metrics = None
+        self.metrics_server = None
+        self.check_writer = None
+        self.last_alert_path = None
+        self._frame_sinks = []
+    
+    def start_alerts(self, options):
+        """異常検知画像をバックグラウンドで保存し、同じ場面の画像が大量に保存されないようにする"""
+        self.alert_writer = AlertWriter(image_format=options.image_format, quality=options.quality,
+                                        max_queue=options.max_queue, drop_policy=options.drop_policy)
+        if options.dedup_distance is not None:
+            self.alert_dedup = AlertDeduplicator(max_distance=options.dedup_distance,
+                                                 keyframe_interval=options.keyframe_interval)
+    
+    def start_clips(self, options):
+        """異常検知の前後の動画用に、直近のフレームを保持する（読み込みの遅れを見込んで2秒分多く確保する）"""
+        self.clip_ring = FrameRing(options.pre_roll + 2.0, fps=options.fps, resolution=options.resolution,
+                                   max_bytes=options.max_memory_mb * 1024 * 1024)
+        self.clip_recorder = ClipRecorder(self.clip_ring, pre_roll=options.pre_roll, post_roll=options.post_roll)
+        self._frame_sinks.append(self.clip_ring.push)
+        print(f"異常検知動画: 前 {options.pre_roll}秒 / 後 {options.post_roll}秒 "
+              f"({options.resolution[0]}x{options.resolution[1]}, {options.fps}fps, "
+              f"{self.clip_ring.nbytes / 1024 / 1024:.0f}MB)")
+    
+    def start_black_box(self, options, source_resolution):
+        """縮小したフレームの常時記録（ファイルは最大の大きさで確保し、古いフレームから上書きする）"""
+        from black_box import BlackBoxRecorder
+        self.black_box = BlackBoxRecorder(
+            os.path.join(self.log_dir, "blackbox"), seconds=options.seconds, fps=options.fps,
+            resolution=options.resolution, source_resolution=source_resolution, camera=self.camera,
+            max_bytes=options.max_mb * 1024 * 1024 if options.max_mb is not None else None)
+        self._frame_sinks.append(self.black_box.push)
+        print(f"常時記録: {self.black_box.slots / options.fps / 60:.0f}分 "
+              f"({self.black_box.nbytes / 1024 / 1024:.0f}MB, {self.black_box.directory})")
+    
+    def start_notifier(self, options):
+        """状態の変化の通知はバックグラウンドで送る（通知先が止まっていても監視を待たせない）"""
+        targets = make_targets(options.webhooks, options.commands)
+        if not targets:
+            return
+        self.notifier = Notifier(targets, outbox_dir=os.path.join(self.log_dir, "notify_outbox"),
+                                 batch_window=options.batch_window, max_retries=options.max_retries).start()
+        print(f"通知先: {', '.join(target.name for target in targets)}")
+    
+    def start_preview(self, port, max_fps):
+        """注釈付きフレームの配信を開始する"""
+        self.preview = PreviewServer(port=port, max_fps=max_fps).start()
+    
+    def start_metrics(self, options, preview_port=None):
+        """段階ごとの所要時間とカウンターの計測を開始する（プレビューと同じポートならそのサーバーで配信する）"""
+        self.metrics = MonitorMetrics(camera=self.camera, metrics_file=options.metrics_file,
+                                      trace_file=options.trace_file, export_interval=options.export_interval)
+        if self.preview is not None:
+            self.preview.metrics_provider = self.metrics.render
+        if options.port is not None and (self.preview is None or options.port != preview_port):
+            self.metrics_server = PreviewServer(port=options.port, metrics_provider=self.metrics.render).start()
+    
+    def start_check_log(self, session, max_records, zone_names=()):
+        """チェックごとの判定結果の記録を開始する"""
+        self.check_writer = CheckLogWriter(os.path.join(self.log_dir, "checks"), camera=self.camera,
+                                           session=session, max_records=max_records, zone_names=zone_names)
+    
+    @property
+    def records_frames(self):
+        """取得したフレームを渡す先（動画用のリングバッファと常時記録）があるかどうか"""
+        return bool(self._frame_sinks)
+    
+    def push_frame(self, frame, timestamp):
+        """取得したフレームを動画用のリングバッファと常時記録に渡す"""
+        for push in self._frame_sinks:
+            push(frame, timestamp)
+    
+    def submit_alert(self, path, frame, metadata):
+        """
+        異常検知画像の保存を依頼する
+        
+        Returns:
+        - 保存先のパス（保存待ちが上限のため破棄した場合はNone）
+        """
+        filepath = self.alert_writer.submit(path, frame, metadata=metadata)
+        if filepath is not None:
+            self.last_alert_path = filepath
+        return filepath
+    
+    def end_alert(self, current_time):
+        """
+        異常状態が終わったら、次の異常の最初のフレームは必ず保存する
+        
+        最後の保存以降に省略したフレーム数は、最後の異常検知画像の記録として残す
+        """
+        if self.alert_dedup is None:
+            return
+        suppressed_after = self.alert_dedup.reset()
+        if suppressed_after and self.last_alert_path is not None:
+            self.alert_writer.submit_record(self.last_alert_path, {"time": current_time, "event": "alert_end",
+                                                                   "suppressed_after": suppressed_after})
+        self.last_alert_path = None
+    
+    def publish_preview(self, frame, result, status, current_time, normal_count, alert_count):
+        """判定結果と注釈付きフレームをプレビューに配信する（frame がNoneの場合は判定結果だけ更新する）"""
+        details = result.details
+        preview_status = {
+            "time": current_time,
+            "status": status,
+            "confidence": result.confidence,
+            "white_percentage": details["white_percentage"],
+            "large_white_regions": details["large_white_regions"],
+            "cat_shape_detected": details["cat_shape_detected"],
+            "reused": result.reused,
+            "frame_age_ms": result.frame_age * 1000,
+            "normal_count": normal_count,
+            "alert_count": alert_count,
+        }
+        # 複数の物体と領域の規則を判定した場合は、その結果も含める
+        if hasattr(result, "profiles"):
+            preview_status["profiles"] = {name: {"detected": profile_result.is_cat,
+                                                 "confidence": profile_result.confidence}
+                                          for name, profile_result in result.profiles.items()}
+        if "zones" in details:
+            preview_status["zones"] = result.zones
+        self.preview.publish(frame, status=preview_status)
+    
+    def record_check(self, timings, result, status, submitted=0, suppressed=0, overrun=0.0, check_interval=None,
+                     first_verdict=None):
+        """
+        1回のチェックの判定結果をチェックログに、所要時間とカウンターをメトリクスに記録する
+        
+        Parameters:
+        - timings: 段階名 → 所要時間（秒）の辞書
+        - result: 判定結果（DetectionResult）
+        - status: 表示した状態（"Normal" または "Alert"）
+        - submitted: 保存を依頼した異常検知画像の数
+        - suppressed: 類似フレームのため保存を省略した異常検知画像の数
+        - overrun: チェックの締め切りを過ぎた時間（秒）
+        - check_interval: 現在のチェック間隔（秒、間隔を守らない場合はNone）
+        - first_verdict: 最初の判定までの時間（秒）
+        """
+        details = result.details
+        if self.check_writer is not None:
+            self.check_writer.append(result.frame_timestamp, VERDICT_NORMAL if result.is_cat else VERDICT_ALERT,
+                                     result, timings)
+        if self.metrics is None:
+            return
+        self.metrics.observe(timings, counts={
+            "frames_captured": 1,
+            "frames_analysed": 0 if result.reused else 1,
+            "frames_reused": 1 if result.reused else 0,
+            "checks": 1,
+            "alerts": 0 if result.is_cat else 1,
+            "alert_images_submitted": submitted,
+            "alert_images_suppressed": suppressed,
+            "schedule_overruns": 1 if overrun > 0 else 0,
+            "zone_violations": 1 if details.get("zone_violations") else 0,
+        }, gauges={
+            "frame_age_seconds": result.frame_age,
+            "white_percentage": details["white_percentage"],
+            "confidence": result.confidence,
+            "alert_queue_depth": self.alert_writer.queue_depth if self.alert_writer is not None else None,
+            "check_interval_seconds": check_interval,
+            "time_to_first_verdict_seconds": first_verdict,
+        }, trace={
+            "status": status,
+            "confidence": round(result.confidence, 4),
+            "white_percentage": round(details["white_percentage"], 3),
+            "reused": result.reused,
+            "frame_age_ms": round(result.frame_age * 1000, 3),
+            "overrun_ms": round(overrun * 1000, 3),
+            "zones": {name: round(percentage, 3) for name, percentage in details["zones"].items()}
+                     if "zones" in details else None,
+        })
+    
+    def record_capture_failure(self, timings):
+        """フレームの取得の失敗をチェックログとメトリクスに記録する"""
+        if self.metrics is not None:
+            self.metrics.observe(timings, {"capture_failures": 1})
+        if self.check_writer is not None:
+            self.check_writer.append(time.time(), VERDICT_CAPTURE_FAILURE, timings=timings)
+    
+    def close(self):
+        """すべての機能を止め、保存待ちの異常検知画像と動画、届いている通知を書き出す"""
+        if self.preview is not None:
+            self.preview.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        if self.check_writer is not None:
+            self.check_writer.close()
+        self.end_alert(datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+        if self.alert_writer is not None:
+            self.alert_writer.close()
+        if self.clip_recorder is not None:
+            self.clip_recorder.close()
+        if self.black_box is not None:
+            self.black_box.close()
+        # 送れなかった通知は次回の起動時に送り直す
+        if self.notifier is not None:
+            self.notifier.close()
+        if self.metrics is not None:
+            self.metrics.close()
+    
+    def print_summary(self, session_dir, alert_count):
+        """機能ごとの結果を表示する（close() のあとに呼び出す）"""
+        if self.clip_recorder is not None and self.clip_recorder.clips_written > 0:
+            clips = self.clip_recorder.metrics()
+            print(f"異常検知動画: {clips['clips_written']}本 / {clips['frames_written']}フレーム "
+                  f"(間に合わず欠けたフレーム: {clips['frames_lost']} / 破棄した依頼: {clips['dropped']})")
+        if self.notifier is not None:
+            notifications = self.notifier.metrics()
+            print(f"通知: {notifications['sent']}件 / まとめたイベント: {notifications['coalesced']}件 / "
+                  f"送信エラー: {notifications['errors']}回 / 送信待ち: {notifications['pending_batches']}件")
+        if self.check_writer is not None and self.check_writer.record_count > 0:
+            print(f"チェックログ: {self.check_writer.record_count}件 ({os.path.dirname(self.check_writer.paths[0])})")
+        if self.metrics is not None:
+            print("段階ごとの平均所要時間: " + ", ".join(
+                f"{stage} {ms:.2f}ms" for stage, ms in self.metrics.stage_averages().items()))
+        
+        if alert_count > 0 and self.alert_writer is not None:
+            print(f"異常検知画像の保存先: {session_dir}")
+            writer_metrics = self.alert_writer.metrics()
+            if self.alert_dedup is not None:
+                print(f"類似フレームのため保存を省略: {self.alert_dedup.suppressed_total}枚")
+            print(f"保存: {writer_metrics['written']}枚 / 破棄: {writer_metrics['dropped']}枚 / "
+                  f"エラー: {writer_metrics['errors']}件 / 最大待ち数: {writer_metrics['max_queue_depth']}")
+            print(f"エンコード: 平均 {writer_metrics['encode_time_avg_ms']:.1f}ms / "
+                  f"書き込み: 平均 {writer_metrics['write_time_avg_ms']:.1f}ms")
+    
+    def summary(self):
+        """監視結果の辞書に含める機能ごとの結果を返す"""
+        return {
+            "stage_timings_ms": self.metrics.stage_averages() if self.metrics is not None else None,
+            "check_log_files": self.check_writer.paths if self.check_writer is not None else [],
+            "clips": self.clip_recorder.metrics() if self.clip_recorder is not None else None,
+            "notifications": self.notifier.metrics() if self.notifier is not None else None,
+        }
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import threading
+
+# 記録するカウンターの名前と説明
+COUNTERS = {
+    "frames_captured": "Frames read from the source",
+    "capture_failures": "Failed frame reads",
+    "frames_analysed": "Frames run through the detector",
+    "frames_reused": "Checks that reused the previous result",
+    "checks": "Completed checks",
+    "alerts": "Checks that ended in Alert",
+    "alert_images_submitted": "Alert images queued for saving",
+    "alert_images_suppressed": "Alert images skipped as near duplicates",
+    "schedule_overruns": "Checks that finished after the next deadline",
+    "config_reloads": "Configuration file changes applied",
+    "zone_violations": "Checks where a zone occupancy rule was not met",
+}
+
+METRIC_PREFIX = "camera_monitor"
+
+class MonitorMetrics:
+    """
+    監視ループの段階ごとの所要時間とカウンターを集計し、外部に出力するクラス
+    
+    observe() に1回のチェック分の所要時間（record_stage で記録した辞書）とカウンターの増分を渡す。
+    集計した値は Prometheus のテキスト形式で、ファイル（node_exporter の textfile collector 用）
+    またはプレビューサーバーの /metrics から取得できる。trace_file を指定した場合は
+    チェックごとの所要時間をJSONLで記録する。
+    
+    monitor_camera では計測を有効にした場合だけ作成し、無効な場合は所要時間の辞書も作らない。
+    
+    Parameters:
+    - camera: メトリクスのラベルに使うカメラ名
+    - metrics_file: Prometheusのテキスト形式で書き出すファイル（任意）
+    - trace_file: チェックごとの所要時間を追記するJSONLファイル（任意）
+    - export_interval: ファイルに書き出す間隔（秒）
+    """
+    def __init__(self, camera="camera", metrics_file=None, trace_file=None, export_interval=5.0):
+        self.camera = camera
+        self.metrics_file = metrics_file
+        self.trace_file = trace_file
+        self.export_interval = export_interval
+        self.start_time = time.time()
+        
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.gauges = {}
+        self.stage_count = {}
+        self.stage_sum = {}
+        self.stage_max = {}
+        
+        self._lock = threading.Lock()
+        self._last_export = time.time()
+        self._trace = None
+        if trace_file:
+            directory = os.path.dirname(trace_file)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory, exist_ok=True)
+            self._trace = open(trace_file, "a", encoding="utf-8")
+    
+    def observe(self, timings, counts=None, gauges=None, trace=None):
+        """
+        1回のチェック分の計測結果を加える
+        
+        Parameters:
+        - timings: 段階名 → 所要時間（秒）の辞書
+        - counts: カウンター名 → 増分の辞書（任意）
+        - gauges: 現在値を記録する値の辞書（任意）
+        - trace: JSONLの1行に加える値の辞書（任意）
+        """
+        with self._lock:
+            for stage, seconds in timings.items():
+                self.stage_count[stage] = self.stage_count.get(stage, 0) + 1
+                self.stage_sum[stage] = self.stage_sum.get(stage, 0.0) + seconds
+                if seconds > self.stage_max.get(stage, 0.0):
+                    self.stage_max[stage] = seconds
+            if counts:
+                for name, value in counts.items():
+                    self.counters[name] = self.counters.get(name, 0) + value
+            if gauges:
+                self.gauges.update(gauges)
+        
+        if self._trace is not None:
+            record = {"time": round(time.time(), 3)}
+            if trace:
+                record.update(trace)
+            record["stages_ms"] = {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+            self._trace.write(json.dumps(record, ensure_ascii=False) + "\n")
+        
+        if time.time() - self._last_export >= self.export_interval:
+            self.export()
+    
+    def stage_averages(self):
+        """段階名 → 平均所要時間（ミリ秒）の辞書を返す"""
+        with self._lock:
+            return {stage: self.stage_sum[stage] / self.stage_count[stage] * 1000 for stage in self.stage_sum}
+    
+    def render(self):
+        """Prometheusのテキスト形式の文字列を返す"""
+        label = self.camera.replace("\\", "\\\\").replace('"', '\\"')
+        lines = []
+        with self._lock:
+            name = f"{METRIC_PREFIX}_stage_seconds"
+            lines.append(f"# HELP {name} Time spent in each stage of the monitoring loop")
+            lines.append(f"# TYPE {name} summary")
+            for stage in sorted(self.stage_sum):
+                lines.append(f'{name}_sum{{camera="{label}",stage="{stage}"}} {self.stage_sum[stage]:.6f}')
+                lines.append(f'{name}_count{{camera="{label}",stage="{stage}"}} {self.stage_count[stage]}')
+            lines.append(f"# HELP {name}_max Longest time spent in each stage")
+            lines.append(f"# TYPE {name}_max gauge")
+            for stage in sorted(self.stage_max):
+                lines.append(f'{name}_max{{camera="{label}",stage="{stage}"}} {self.stage_max[stage]:.6f}')
+            
+            for counter, value in self.counters.items():
+                name = f"{METRIC_PREFIX}_{counter}_total"
+                lines.append(f"# HELP {name} {COUNTERS.get(counter, counter)}")
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f'{name}{{camera="{label}"}} {value}')
+            
+            for gauge, value in sorted(self.gauges.items()):
+                if value is None:
+                    continue
+                name = f"{METRIC_PREFIX}_{gauge}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f'{name}{{camera="{label}"}} {float(value):.6f}')
+            
+            name = f"{METRIC_PREFIX}_uptime_seconds"
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f'{name}{{camera="{label}"}} {time.time() - self.start_time:.3f}')
+        return "\n".join(lines) + "\n"
+    
+    def export(self):
+        """メトリクスファイルを書き出し、トレースをフラッシュする"""
+        self._last_export = time.time()
+        if self._trace is not None:
+            self._trace.flush()
+        if not self.metrics_file:
+            return
+        # 読み取り側が書きかけのファイルを読まないよう、一時ファイルに書いてから置き換える
+        temporary = self.metrics_file + ".tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(temporary, self.metrics_file)
+        except OSError as e:
+            print(f"メトリクスの書き出し中にエラーが発生しました: {e}")
+    
+    def close(self):
+        """最後のメトリクスを書き出し、トレースファイルを閉じる"""
+        self.export()
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
@@ -0,0 +1,212 @@
+class OptionGroup:
+    """
+    monitor_camera の関連する引数をまとめた設定の基底クラス
+    
+    FIELDS に属性名を並べ、設定ファイルの辞書との変換と比較を共通にする
+    （ConfigWatcher は比較した結果で変更された設定を調べる）。
+    """
+    FIELDS = ()
+    
+    def __eq__(self, other):
+        return type(other) is type(self) and self.to_dict() == other.to_dict()
+    
+    def __repr__(self):
+        values = ", ".join(f"{name}={value!r}" for name, value in self.to_dict().items())
+        return f"{type(self).__name__}({values})"
+    
+    def to_dict(self):
+        """コンストラクタに渡せる形式の辞書を返す"""
+        return {name: getattr(self, name) for name in self.FIELDS}
+    
+    def replace(self, **changes):
+        """一部の値を変更した新しい設定を返す"""
+        values = self.to_dict()
+        values.update(changes)
+        return type(self)(**values)
+    
+    @classmethod
+    def from_dict(cls, data):
+        """
+        設定ファイルの値から作成する
+        
+        true はデフォルト値の設定として、false と null は指定なし（None）として扱う
+        """
+        if data is True:
+            return cls()
+        if data is False or data is None:
+            return None
+        if not isinstance(data, dict):
+            raise ValueError(f"{cls.__name__} はJSONのオブジェクトで指定してください")
+        unknown = set(data) - set(cls.FIELDS)
+        if unknown:
+            raise ValueError(f"{cls.__name__} に不明な項目があります: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+class CaptureOptions(OptionGroup):
+    """
+    フレームの取得の設定
+    
+    Parameters:
+    - threaded: バックグラウンドスレッドでフレームを読み続け、最新フレームを判定に使うかどうか（カメラのみ）
+    - reader_buffer_size: バックグラウンド読み込み時に保持するフレーム数
+    - backend: カメラを開くOpenCVのバックエンド（Noneの場合はOSに合ったもの）
+    - fourcc: カメラに要求するピクセル形式（"MJPG", "YUYV" など）
+    - buffer_size: カメラのドライバのバッファに保持するフレーム数
+    （backend などの最適な組み合わせは webcam_diagnostic.py --benchmark で調べられる）
+    """
+    FIELDS = ("threaded", "reader_buffer_size", "backend", "fourcc", "buffer_size")
+    
+    def __init__(self, threaded=True, reader_buffer_size=1, backend=None, fourcc=None, buffer_size=1):
+        self.threaded = threaded
+        self.reader_buffer_size = reader_buffer_size
+        self.backend = backend
+        self.fourcc = fourcc
+        self.buffer_size = buffer_size
+
+class ScheduleOptions(OptionGroup):
+    """
+    判定に合わせてチェック間隔を変える設定（CheckScheduler に渡す）
+    
+    Parameters:
+    - min_interval: 判定が変わった直後や確信の低い判定のあとのチェック間隔（秒）。Noneの場合は interval
+    - max_interval: 同じ判定が続いているときの最大のチェック間隔（秒）。Noneの場合は interval
+    - backoff: 同じ判定が続いたときにチェック間隔を延ばす倍率
+    - uncertain_confidence: 信頼度がこの範囲 (下限, 上限) に入る判定は確信が低いとみなし、min_interval でチェックする
+    """
+    FIELDS = ("min_interval", "max_interval", "backoff", "uncertain_confidence")
+    
+    def __init__(self, min_interval=None, max_interval=None, backoff=1.5, uncertain_confidence=(0.4, 0.7)):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.uncertain_confidence = tuple(uncertain_confidence) if uncertain_confidence is not None else None
+    
+    @property
+    def adaptive(self):
+        """判定に合わせてチェック間隔を変えるかどうか"""
+        return self.min_interval is not None or self.max_interval is not None
+
+class MotionOptions(OptionGroup):
+    """
+    場面に変化がない間は解析を省略する設定（MotionGate に渡す）
+    
+    Parameters:
+    - threshold: 前回解析したフレームとの平均輝度差がこの値以下なら解析を省略して前回の判定を再利用する
+    - max_staleness: 解析を省略し続けられる最大時間（秒）
+    """
+    FIELDS = ("threshold", "max_staleness")
+    
+    def __init__(self, threshold=3.0, max_staleness=30.0):
+        self.threshold = threshold
+        self.max_staleness = max_staleness
+
+class AlertOptions(OptionGroup):
+    """
+    異常検知画像の保存の設定
+    
+    Parameters:
+    - image_format: 保存形式（"jpg", "png", "webp"）
+    - quality: 画質（jpg/webpは0〜100、pngは圧縮レベル0〜9）
+    - max_queue: 保存待ちの画像の上限
+    - drop_policy: 保存待ちが上限に達した場合の動作（"drop_oldest" または "drop_newest"）
+    - dedup_distance: 最後に保存した画像とのハッシュ距離がこの値以下なら保存しない（Noneの場合はすべて保存）
+    - keyframe_interval: 場面に変化がなくても画像を保存する間隔（秒）
+    """
+    FIELDS = ("image_format", "quality", "max_queue", "drop_policy", "dedup_distance", "keyframe_interval")
+    
+    def __init__(self, image_format="jpg", quality=95, max_queue=32, drop_policy="drop_oldest",
+                 dedup_distance=12, keyframe_interval=60.0):
+        self.image_format = image_format
+        self.quality = quality
+        self.max_queue = max_queue
+        self.drop_policy = drop_policy
+        self.dedup_distance = dedup_distance
+        self.keyframe_interval = keyframe_interval
+
+class ClipOptions(OptionGroup):
+    """
+    正常から異常に変わったときに前後のフレームを動画（mp4）として保存する設定
+    
+    Parameters:
+    - pre_roll: 動画に含める異常検知より前の時間（秒）
+    - post_roll: 動画に含める異常検知より後の時間（秒）
+    - fps: 動画用に保持するフレームレート
+    - resolution: 動画用に保持するフレームの解像度（幅, 高さ）
+    - max_memory_mb: 動画用に保持するフレームのメモリの上限（MB）
+    """
+    FIELDS = ("pre_roll", "post_roll", "fps", "resolution", "max_memory_mb")
+    
+    def __init__(self, pre_roll=5.0, post_roll=5.0, fps=10.0, resolution=(640, 360), max_memory_mb=256):
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.fps = fps
+        self.resolution = tuple(resolution)
+        self.max_memory_mb = max_memory_mb
+
+class BlackBoxOptions(OptionGroup):
+    """
+    縮小したフレームを log_dir/blackbox に常時記録する設定（black_box.py で確認・再生できる）
+    
+    Parameters:
+    - seconds: 保持する時間（秒）。古いフレームから上書きする
+    - fps: 記録のフレームレート
+    - resolution: 記録の解像度（幅, 高さ）
+    - max_mb: 記録のファイルの大きさの上限（MB、指定した場合は seconds より優先）
+    """
+    FIELDS = ("seconds", "fps", "resolution", "max_mb")
+    
+    def __init__(self, seconds=3600.0, fps=1.0, resolution=(320, 180), max_mb=None):
+        self.seconds = seconds
+        self.fps = fps
+        self.resolution = tuple(resolution)
+        self.max_mb = max_mb
+
+class NotifyOptions(OptionGroup):
+    """
+    正常と異常の切り替わりとフレームの取得の失敗を通知する設定
+    
+    Parameters:
+    - webhooks: 通知先のWebhookのURL（または {"url", "headers", "timeout"} の辞書）のリスト
+    - commands: 同じイベントを標準入力のJSONで受け取るローカルのコマンドのリスト
+    - batch_window: 続けて起きたイベントをまとめて通知する時間（秒）
+    - max_retries: 通知に失敗した場合に送り直す回数（送れなかったイベントは log_dir/notify_outbox に残し、
+      あとで送り直す）
+    """
+    FIELDS = ("webhooks", "commands", "batch_window", "max_retries")
+    
+    def __init__(self, webhooks=None, commands=None, batch_window=2.0, max_retries=5):
+        self.webhooks = webhooks
+        self.commands = commands
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+
+class MetricsOptions(OptionGroup):
+    """
+    段階ごとの所要時間とカウンターの計測の設定
+    
+    Parameters:
+    - metrics_file: Prometheusのテキスト形式で書き出すファイル（任意）
+    - port: 指定した場合、localhostのこのポートの /metrics で配信する
+      （preview_port と同じ場合はプレビューと同じサーバーで配信する）
+    - trace_file: チェックごとの段階別の所要時間を追記するJSONLファイル（任意）
+    - export_interval: メトリクスファイルを書き出す間隔（秒）
+    """
+    FIELDS = ("metrics_file", "port", "trace_file", "export_interval")
+    
+    def __init__(self, metrics_file=None, port=None, trace_file=None, export_interval=5.0):
+        self.metrics_file = metrics_file
+        self.port = port
+        self.trace_file = trace_file
+        self.export_interval = export_interval
+
+# monitor_camera の引数名 → 設定のクラス（設定ファイルの変換に使う）
+OPTION_GROUPS = {
+    "capture": CaptureOptions,
+    "schedule": ScheduleOptions,
+    "motion": MotionOptions,
+    "alerts": AlertOptions,
+    "clips": ClipOptions,
+    "black_box": BlackBoxOptions,
+    "notify": NotifyOptions,
+    "metrics": MetricsOptions,
+}
@@ -0,0 +1,241 @@
+import cv2
+import multiprocessing
+import queue
+import time
+import datetime
+import os
+import json
+import argparse
+
+from camera_monitor import monitor_camera, get_camera_devices, close_camera_app, ensure_dir, DetectionParams
+from monitor_options import ScheduleOptions
+
+def camera_worker(job, status_queue, stop_event):
+    """
+    1台のカメラを監視するワーカープロセスの処理
+    
+    monitor_camera をウィンドウなしで実行し、チェックごとの状態と終了時の監視結果を
+    status_queue に送る。
+    
+    Parameters:
+    - job: build_jobs() が作成した設定の辞書
+    - status_queue: 監視状態を送る multiprocessing.Queue
+    - stop_event: 停止要求を受け取る multiprocessing.Event
+    """
+    name = job["name"]
+    
+    def on_check(result, status):
+        status_queue.put({
+            "type": "check",
+            "camera": name,
+            "time": time.time(),
+            "status": status,
+            "confidence": result.confidence,
+            "white_percentage": result.details["white_percentage"],
+            "reused": result.reused,
+            "frame_age": result.frame_age,
+        })
+    
+    # カメラごとに1プロセスで並列化するため、OpenCV内部のスレッドは使わない
+    cv2.setNumThreads(1)
+    
+    summary = None
+    try:
+        params = DetectionParams(**job["params"]) if job.get("params") else DetectionParams()
+        summary = monitor_camera(source=job["source"], params=params, show_window=False,
+                                 stop_event=stop_event, on_check=on_check, **job["options"])
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        print(f"[{name}] エラーが発生しました: {e}")
+    finally:
+        status_queue.put({"type": "summary", "camera": name, "summary": summary})
+
+def build_jobs(sources, log_dir="camera_logs", camera_params=None, **options):
+    """
+    カメラごとのワーカー設定を作成する
+    
+    Parameters:
+    - sources: カメラデバイス番号（または録画ファイルなどの取得元）のリスト
+    - log_dir: ログを保存するディレクトリ（カメラごとにサブディレクトリを作成する）
+    - camera_params: カメラ名 → DetectionParams のコンストラクタ引数の辞書（任意）
+    - options: すべてのカメラに共通の monitor_camera の引数
+    
+    Returns:
+    - 設定の辞書のリスト
+    """
+    camera_params = camera_params or {}
+    jobs = []
+    for source in sources:
+        if isinstance(source, int) or str(source).isdigit():
+            name = f"camera{source}"
+        else:
+            name = os.path.basename(str(source).rstrip("/\\")).replace(":", "_")
+        job_options = dict(options)
+        job_options["log_dir"] = os.path.join(log_dir, name)
+        jobs.append({
+            "name": name,
+            "source": source,
+            "params": camera_params.get(name),
+            "options": job_options,
+        })
+    return jobs
+
+def supervise(jobs, status_interval=10.0, duration=None):
+    """
+    カメラごとにワーカープロセスを起動し、監視状態を集約して表示する
+    
+    Parameters:
+    - jobs: build_jobs() が作成した設定のリスト
+    - status_interval: 全カメラの状態をまとめて表示する間隔（秒）
+    - duration: 監視時間（秒）、Noneの場合はCtrl+Cまで監視
+    
+    Returns:
+    - カメラ名 → 監視結果の辞書
+    """
+    status_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    
+    # 複数のワーカーで同じアプリを閉じないよう、ここで一度だけ閉じる
+    close_camera_app()
+    
+    processes = {}
+    for job in jobs:
+        process = multiprocessing.Process(target=camera_worker, args=(job, status_queue, stop_event),
+                                          name=f"CameraWorker-{job['name']}", daemon=True)
+        process.start()
+        processes[job["name"]] = process
+        print(f"ワーカーを起動しました: {job['name']} (取得元: {job['source']}, PID: {process.pid})")
+    
+    latest = {}
+    counts = {job["name"]: {"Normal": 0, "Alert": 0} for job in jobs}
+    summaries = {}
+    start_time = time.time()
+    last_report = start_time
+    
+    try:
+        while len(summaries) < len(jobs):
+            if duration and time.time() - start_time >= duration and not stop_event.is_set():
+                print(f"指定された監視時間 {duration}秒 が経過しました")
+                stop_event.set()
+            
+            try:
+                event = status_queue.get(timeout=0.5)
+            except queue.Empty:
+                event = None
+            
+            if event is not None:
+                name = event["camera"]
+                if event["type"] == "check":
+                    # 状態が変わったときだけ表示する
+                    previous = latest.get(name)
+                    if previous is None or previous["status"] != event["status"]:
+                        timestamp = datetime.datetime.fromtimestamp(event["time"]).strftime("%H:%M:%S")
+                        print(f"[{timestamp}] {name}: {event['status']} (信頼度: {event['confidence']:.2f})")
+                    latest[name] = event
+                    counts[name][event["status"]] += 1
+                elif event["type"] == "summary":
+                    summaries[name] = event["summary"]
+            
+            # 終了したのに監視結果を送らなかったワーカーを検出
+            for name, process in processes.items():
+                if name not in summaries and not process.is_alive() and status_queue.empty():
+                    summaries[name] = None
+            
+            if time.time() - last_report >= status_interval:
+                last_report = time.time()
+                print_status(latest, counts)
+    
+    except KeyboardInterrupt:
+        print("\n監視が中断されました（Ctrl+C）")
+        stop_event.set()
+        # ワーカーからの監視結果を待つ
+        deadline = time.time() + 15.0
+        while len(summaries) < len(jobs) and time.time() < deadline:
+            try:
+                event = status_queue.get(timeout=0.5)
+            except (queue.Empty, KeyboardInterrupt):
+                continue
+            if event["type"] == "summary":
+                summaries[event["camera"]] = event["summary"]
+    
+    finally:
+        stop_event.set()
+        for process in processes.values():
+            process.join(timeout=5.0)
+            if process.is_alive():
+                process.terminate()
+    
+    print_combined_summary(summaries, counts)
+    return summaries
+
+def print_status(latest, counts):
+    """全カメラの最新の状態を表示する"""
+    print("----- 全カメラの状態 -----")
+    for name, count in counts.items():
+        event = latest.get(name)
+        if event is None:
+            print(f"  {name}: 未取得")
+            continue
+        age = time.time() - event["time"]
+        print(f"  {name}: {event['status']} (信頼度: {event['confidence']:.2f}, "
+              f"白色率: {event['white_percentage']:.1f}%, {age:.0f}秒前) "
+              f"正常 {count['Normal']}回 / 異常 {count['Alert']}回")
+
+def print_combined_summary(summaries, counts):
+    """全カメラの監視結果をまとめて表示する"""
+    print("\n===== 全カメラの監視結果 =====")
+    total_normal = 0
+    total_alert = 0
+    for name in counts:
+        summary = summaries.get(name)
+        if summary is None:
+            print(f"{name}: 監視結果なし（カメラを開けなかったか、異常終了しました）")
+            continue
+        total_normal += summary["normal_count"]
+        total_alert += summary["alert_count"]
+        print(f"{name}: チェック {summary['total_checks']}回 / 正常 {summary['normal_count']}回 / "
+              f"異常 {summary['alert_count']}回 / 監視時間 {summary['elapsed_time']:.1f}秒")
+        if summary.get("session_dir"):
+            print(f"  異常検知画像の保存先: {summary['session_dir']}")
+    total = total_normal + total_alert
+    if total > 0:
+        print(f"合計: チェック {total}回 / 正常 {total_normal}回 ({total_normal/total*100:.1f}%) / "
+              f"異常 {total_alert}回 ({total_alert/total*100:.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="複数カメラの同時監視")
+    parser.add_argument("sources", nargs="*", help="カメラデバイス番号または録画ファイル（省略時は検出されたすべてのカメラ）")
+    parser.add_argument("--interval", type=float, default=2.0, help="チェック間隔（秒）")
+    parser.add_argument("--min-interval", type=float, default=None, help="判定が変わった直後のチェック間隔（秒）")
+    parser.add_argument("--max-interval", type=float, default=None, help="状態が安定しているときの最大のチェック間隔（秒）")
+    parser.add_argument("--duration", type=float, default=None, help="監視時間（秒）")
+    parser.add_argument("--resolution", type=int, nargs=2, default=(640, 360), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--log-dir", default="camera_logs", help="ログを保存するディレクトリ")
+    parser.add_argument("--no-save-alerts", action="store_true", help="異常検知画像を保存しない")
+    parser.add_argument("--camera-params", default=None,
+                        help="カメラ名 → 検出パラメータのJSONファイル（例: {\"camera0\": {\"white_threshold\": 8}}）")
+    parser.add_argument("--status-interval", type=float, default=10.0, help="全カメラの状態を表示する間隔（秒）")
+    args = parser.parse_args()
+    
+    sources = [int(source) if source.isdigit() else source for source in args.sources]
+    if not sources:
+        sources = [index for index, _, _ in get_camera_devices()]
+    if not sources:
+        print("監視するカメラがありません")
+        return
+    
+    camera_params = None
+    if args.camera_params:
+        with open(args.camera_params, encoding="utf-8") as f:
+            camera_params = json.load(f)
+    
+    jobs = build_jobs(sources, log_dir=ensure_dir(args.log_dir), camera_params=camera_params,
+                      interval=args.interval,
+                      schedule=ScheduleOptions(min_interval=args.min_interval, max_interval=args.max_interval),
+                      resolution=tuple(args.resolution),
+                      save_alerts=not args.no_save_alerts)
+    supervise(jobs, status_interval=args.status_interval, duration=args.duration)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,670 @@
+import os
+import ssl
+import json
+import time
+import uuid
+import shlex
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+import collections
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 通知するイベントの種類
+EVENT_ALERT = "alert"  # 正常 → 異常
+EVENT_NORMAL = "normal"  # 異常 → 正常
+EVENT_CAPTURE_FAILURE = "capture_failure"  # フレームを取得できなくなった
+EVENT_CAPTURE_RECOVERED = "capture_recovered"  # フレームを再び取得できるようになった
+EVENT_TEST = "test"  # 動作確認用
+
+class NotificationError(Exception):
+    """通知先が失敗を返した場合の例外"""
+
+class HttpConnectionPool:
+    """
+    asyncio のストリームで HTTP/1.1 の接続を保持し、同じ宛先への要求で使い回すクライアント
+    
+    宛先（スキーム, ホスト, ポート）ごとに待機中の接続を max_idle まで保持する。
+    使い回した接続がサーバー側で閉じられていた場合は、新しい接続で1回だけ送り直す。
+    
+    Parameters:
+    - max_idle: 宛先ごとに保持する待機中の接続の数
+    - timeout: 接続と応答を待つ時間（秒）
+    """
+    def __init__(self, max_idle=4, timeout=10.0):
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.connections_opened = 0
+        self.requests_sent = 0
+        self._idle = {}
+    
+    async def _connect(self, key):
+        scheme, host, port = key
+        context = ssl.create_default_context() if scheme == "https" else None
+        connection = await asyncio.open_connection(host, port, ssl=context)
+        self.connections_opened += 1
+        return connection
+    
+    @staticmethod
+    def _close(connection):
+        connection[1].close()
+    
+    async def _exchange(self, connection, request):
+        """要求を送り、(ステータスコード, 本文, 接続を使い回せるかどうか) を返す"""
+        reader, writer = connection
+        writer.write(request)
+        await writer.drain()
+        
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("接続が閉じられました")
+        parts = status_line.split()
+        if len(parts) < 2 or not parts[0].startswith(b"HTTP/") or not parts[1].isdigit():
+            raise NotificationError(f"応答のステータス行が正しくありません: {status_line[:80]!r}")
+        version, status = parts[0], int(parts[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        
+        keep_alive = version == b"HTTP/1.1" and headers.get("connection", "").lower() != "close"
+        if status in (204, 304) or 100 <= status < 200:
+            body = b""
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            body = bytearray()
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    while await reader.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                body += await reader.readexactly(size)
+                await reader.readexactly(2)
+            body = bytes(body)
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            # 長さの指定がない応答は接続が閉じられるまで読む
+            body = await reader.read()
+            keep_alive = False
+        return status, body, keep_alive
+    
+    async def request(self, method, url, body=b"", headers=None, timeout=None):
+        """
+        HTTPの要求を送る
+        
+        Returns:
+        - (ステータスコード, 応答の本文)
+        """
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ValueError(f"対応していないURLです: {url}")
+        key = (parsed.scheme, parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80))
+        path = (parsed.path or "/") + (f"?{parsed.query}" if parsed.query else "")
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {parsed.netloc}", f"Content-Length: {len(body)}",
+                 "Connection: keep-alive"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+        timeout = timeout or self.timeout
+        
+        for attempt in range(2):
+            idle = self._idle.get(key)
+            reused = attempt == 0 and bool(idle)
+            connection = idle.pop() if reused else await asyncio.wait_for(self._connect(key), timeout)
+            try:
+                status, response, keep_alive = await asyncio.wait_for(self._exchange(connection, request), timeout)
+            except (ConnectionError, EOFError):
+                self._close(connection)
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                self._close(connection)
+                raise
+            self.requests_sent += 1
+            if keep_alive and len(self._idle.setdefault(key, [])) < self.max_idle:
+                self._idle[key].append(connection)
+            else:
+                self._close(connection)
+            return status, response
+    
+    async def close(self):
+        """待機中の接続をすべて閉じる"""
+        for connections in self._idle.values():
+            for connection in connections:
+                self._close(connection)
+        self._idle.clear()
+
+class WebhookTarget:
+    """
+    イベントをJSONでPOSTする通知先
+    
+    本文は {"source": "camera_monitor", "events": [イベント, ...]} で、応答が2xxの場合を成功とする。
+    送り直した場合も各イベントの id は変わらないため、受け取る側で重複を除ける。
+    
+    Parameters:
+    - url: 送信先のURL（http または https）
+    - headers: 追加するHTTPヘッダー（認証トークンなど）
+    - timeout: 応答を待つ時間（秒）
+    - name: 表示や保存先に使う名前（Noneの場合はURL）
+    """
+    def __init__(self, url, headers=None, timeout=10.0, name=None):
+        self.url = url
+        self.headers = dict(headers or {})
+        self.timeout = timeout
+        self.name = name or url
+    
+    async def send(self, events, pool):
+        body = json.dumps({"source": "camera_monitor", "events": events}, ensure_ascii=False).encode("utf-8")
+        headers = {"Content-Type": "application/json; charset=utf-8"}
+        headers.update(self.headers)
+        status, _ = await pool.request("POST", self.url, body, headers, self.timeout)
+        if not 200 <= status < 300:
+            raise NotificationError(f"HTTP {status}")
+
+class CommandTarget:
+    """
+    イベントをローカルのコマンドに渡す通知先
+    
+    コマンドの標準入力にWebhookと同じJSONを渡し、環境変数 CAMERA_MONITOR_EVENT に最後のイベントの種類、
+    CAMERA_MONITOR_EVENT_COUNT にイベントの数を設定する。終了コードが0の場合を成功とする。
+    
+    Parameters:
+    - command: 実行するコマンド（文字列の場合は shlex で分割する。シェルは経由しない）
+    - timeout: コマンドの終了を待つ時間（秒）
+    - name: 表示や保存先に使う名前（Noneの場合はコマンド）
+    """
+    def __init__(self, command, timeout=30.0, name=None):
+        self.args = shlex.split(command) if isinstance(command, str) else list(command)
+        if not self.args:
+            raise ValueError("コマンドを指定してください")
+        self.timeout = timeout
+        self.name = name or " ".join(self.args)
+    
+    async def send(self, events, pool):
+        body = json.dumps({"source": "camera_monitor", "events": events}, ensure_ascii=False).encode("utf-8")
+        env = dict(os.environ, CAMERA_MONITOR_EVENT=events[-1]["type"], CAMERA_MONITOR_EVENT_COUNT=str(len(events)))
+        process = await asyncio.create_subprocess_exec(*self.args, stdin=asyncio.subprocess.PIPE,
+                                                       stdout=asyncio.subprocess.DEVNULL,
+                                                       stderr=asyncio.subprocess.PIPE, env=env)
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(body), self.timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise NotificationError(f"{self.timeout}秒以内に終了しませんでした")
+        if process.returncode != 0:
+            message = stderr.decode("utf-8", "replace").strip()[-200:]
+            raise NotificationError(f"終了コード {process.returncode}: {message}")
+
+def make_targets(webhooks=None, commands=None):
+    """
+    設定から通知先のリストを作成する
+    
+    Parameters:
+    - webhooks: URL、または {"url", "headers", "timeout", "name"} の辞書のリスト
+    - commands: コマンド（文字列または引数のリスト）、または {"command", "timeout", "name"} の辞書のリスト
+    """
+    targets = []
+    for webhook in webhooks or ():
+        targets.append(WebhookTarget(**webhook) if isinstance(webhook, dict) else WebhookTarget(webhook))
+    for command in commands or ():
+        targets.append(CommandTarget(**command) if isinstance(command, dict) else CommandTarget(command))
+    return targets
+
+def coalesce_events(events):
+    """
+    短時間に続いたイベントを、カメラとイベントの種類ごとに最後の1件にまとめる
+    
+    まとめたイベントには count（まとめた件数）と first_time（最初の発生時刻）を加える。
+    結果は最後の発生時刻の順に並ぶため、カメラごとの最後のイベントがそのカメラの現在の状態になる。
+    """
+    merged = {}
+    for event in events:
+        key = (event.get("camera"), event["type"])
+        previous = merged.pop(key, None)
+        if previous is not None:
+            event = dict(event, count=previous.get("count", 1) + event.get("count", 1),
+                         first_time=previous.get("first_time", previous["time"]))
+        merged[key] = event
+    return list(merged.values())
+
+class Outbox:
+    """
+    送信待ちのイベントのまとまりを古い順に保持するクラス
+    
+    directory を指定した場合は1つのまとまりを1つのJSONファイルに保存するため、
+    通知先が止まっている間や監視を再起動した後も送り直せる。
+    
+    Parameters:
+    - directory: 保存するディレクトリ（Noneの場合はメモリに保持する）
+    - max_batches: 保持するまとまりの数の上限（超えた場合は古いものから破棄する）
+    """
+    def __init__(self, directory=None, max_batches=1000):
+        self.directory = directory
+        self.max_batches = max_batches
+        self._memory = collections.deque()
+        self._sequence = 0
+        if directory is not None and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+    
+    def _files(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(".json"))
+    
+    def __len__(self):
+        return len(self._files()) if self.directory is not None else len(self._memory)
+    
+    def put(self, events):
+        """
+        まとまりを追加する
+        
+        Returns:
+        - 上限を超えたため破棄したイベントの数
+        """
+        self._sequence += 1
+        if self.directory is None:
+            self._memory.append((self._sequence, events))
+        else:
+            name = f"{time.time_ns():020d}_{self._sequence:06d}.json"
+            temporary = os.path.join(self.directory, name + ".tmp")
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump({"events": events}, f, ensure_ascii=False)
+            os.replace(temporary, os.path.join(self.directory, name))
+        
+        dropped = 0
+        while len(self) > self.max_batches:
+            handle, oldest = self.peek()
+            dropped += len(oldest)
+            self.remove(handle)
+        return dropped
+    
+    def peek(self):
+        """最も古いまとまりを (識別子, イベントのリスト) で返す（ない場合はNone）"""
+        if self.directory is None:
+            return self._memory[0] if self._memory else None
+        for name in self._files():
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    return path, json.load(f)["events"]
+            except (OSError, ValueError, KeyError) as e:
+                # 壊れたファイルは送り直しの対象から外す
+                print(f"通知の送信待ちファイルを読み込めませんでした: {path} ({e})")
+                os.replace(path, path + ".bad")
+        return None
+    
+    def remove(self, handle):
+        """送信できたまとまりを削除する"""
+        if self.directory is None:
+            if self._memory and self._memory[0][0] == handle:
+                self._memory.popleft()
+        elif os.path.exists(handle):
+            os.remove(handle)
+
+class Notifier:
+    """
+    状態の変化のイベントを、Webhookやローカルのコマンドにバックグラウンドで通知するクラス
+    
+    専用のスレッドで asyncio のイベントループを動かし、notify() はイベントをそのループに渡すだけで
+    すぐに戻るため、監視ループを待たせない。通知先ごとにワーカーがあり、次のように送る。
+    
+    - 最初のイベントから batch_window 秒の間に届いたイベントをまとめ、同じカメラの同じ種類の
+      イベントは1件にまとめて（coalesce_events）、1回の要求で送る
+    - 失敗した場合は retry_base 秒から2倍ずつ（retry_max 秒まで、ゆらぎを加えて）間隔を空けて
+      max_retries 回まで送り直す
+    - それでも送れないまとまりは送信待ち（Outbox）に残し、次のイベントが届いたときか
+      outbox_retry_interval 秒ごとに古い順に送り直す。outbox_dir を指定した場合は送る前に
+      ファイルに保存するため、監視を再起動しても失われない
+    - HTTPの接続は同じ宛先への要求で使い回す（HttpConnectionPool）
+    
+    Parameters:
+    - targets: 通知先（WebhookTarget / CommandTarget）のリスト
+    - outbox_dir: 送信待ちのイベントを保存するディレクトリ（通知先ごとにサブディレクトリを作る。Noneの場合はメモリ）
+    - batch_window: イベントをまとめる時間（秒）
+    - max_batch: 1回の要求で送るイベント数の上限
+    - max_retries: 1回の送信で送り直す回数
+    - retry_base: 最初に送り直すまでの間隔（秒）
+    - retry_max: 送り直す間隔の上限（秒）
+    - outbox_retry_interval: 送信待ちのイベントを送り直す間隔（秒）
+    - max_pending: 通知先ごとにメモリで待たせるイベント数の上限（超えた場合は古いものから破棄する）
+    - max_outbox_batches: 通知先ごとの送信待ちのまとまりの数の上限
+    """
+    def __init__(self, targets, outbox_dir=None, batch_window=2.0, max_batch=100, max_retries=5,
+                 retry_base=1.0, retry_max=60.0, outbox_retry_interval=60.0, max_pending=1000,
+                 max_outbox_batches=1000):
+        targets = list(targets)
+        if not targets:
+            raise ValueError("通知先を1つ以上指定してください")
+        names = [target.name for target in targets]
+        if len(set(names)) != len(names):
+            raise ValueError(f"通知先の名前が重複しています: {', '.join(names)}")
+        self.targets = targets
+        self.outbox_dir = outbox_dir
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.outbox_retry_interval = outbox_retry_interval
+        self.max_pending = max_pending
+        self.outboxes = {target.name: Outbox(self._outbox_directory(target), max_outbox_batches)
+                         for target in targets}
+        
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._closing = False
+        self._busy = set()
+        self._queues = {}
+        self._workers = []
+        self.pool = None
+        
+        # メトリクス
+        self.submitted_count = 0
+        self.sent_count = 0
+        self.batch_count = 0
+        self.coalesced_count = 0
+        self.error_count = 0
+        self.dropped_count = 0
+        self.last_error = None
+    
+    def _outbox_directory(self, target):
+        if self.outbox_dir is None:
+            return None
+        # 通知先の名前（URLやコマンド）をそのままディレクトリ名に使えないため、ハッシュにする
+        digest = hashlib.sha1(target.name.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.outbox_dir, f"{type(target).__name__.lower()}_{digest}")
+    
+    def start(self):
+        """イベントループのスレッドを開始し、前回の送信待ちがあれば送り直す"""
+        self._thread.start()
+        self._ready.wait()
+        return self
+    
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self.pool = HttpConnectionPool()
+        for target in self.targets:
+            queue = asyncio.Queue()
+            self._queues[target.name] = queue
+            self._workers.append(self._loop.create_task(self._worker(target, queue, self.outboxes[target.name])))
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            for worker in self._workers:
+                worker.cancel()
+            self._loop.run_until_complete(asyncio.gather(*self._workers, return_exceptions=True))
+            self._loop.run_until_complete(self.pool.close())
+            self._loop.close()
+    
+    def notify(self, event_type, camera="camera", **fields):
+        """
+        イベントを通知する（送信を待たずにすぐに戻る）
+        
+        Parameters:
+        - event_type: イベントの種類（EVENT_ALERT / EVENT_NORMAL / EVENT_CAPTURE_FAILURE など）
+        - camera: カメラ名
+        - fields: イベントに加える値（信頼度、画像のパスなど。JSONにできる値）
+        
+        Returns:
+        - 作成したイベントの辞書（閉じた後はNone）
+        """
+        event = {"id": uuid.uuid4().hex, "type": event_type, "camera": camera, "time": time.time()}
+        event.update(fields)
+        with self._lock:
+            if self._closed:
+                return None
+            self.submitted_count += 1
+            self._loop.call_soon_threadsafe(self._enqueue, event)
+        return event
+    
+    def _enqueue(self, event):
+        for queue in self._queues.values():
+            if queue.qsize() >= self.max_pending:
+                queue.get_nowait()
+                self.dropped_count += 1
+            queue.put_nowait(event)
+    
+    async def _collect(self, name, queue, timeout):
+        """最初のイベントを待ち、batch_window 秒の間に届いたイベントをまとめて返す（届かない場合は空のリスト）"""
+        try:
+            events = [await asyncio.wait_for(queue.get(), timeout)]
+        except asyncio.TimeoutError:
+            return []
+        # まとめている間も送信中とみなし、終了時に送り終わるまで待つ
+        self._busy.add(name)
+        deadline = self._loop.time() + self.batch_window
+        while len(events) < self.max_batch:
+            if self._closing:
+                # 終了時は待たずに、届いているイベントだけをまとめる
+                if queue.empty():
+                    break
+                events.append(queue.get_nowait())
+                continue
+            remaining = deadline - self._loop.time()
+            if remaining <= 0:
+                break
+            try:
+                events.append(await asyncio.wait_for(queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return events
+    
+    async def _worker(self, target, queue, outbox):
+        # 前回の実行で送れなかったまとまりは、イベントを待たずにすぐに送り直す
+        first = True
+        while True:
+            try:
+                events = []
+                if not first:
+                    # 送信待ちがある間は、イベントが届かなくても一定間隔で送り直す
+                    timeout = self.outbox_retry_interval if len(outbox) else None
+                    events = await self._collect(target.name, queue, timeout)
+                first = False
+                self._busy.add(target.name)
+                if events:
+                    batch = coalesce_events(events)
+                    self.coalesced_count += len(events) - len(batch)
+                    self.dropped_count += outbox.put(batch)
+                await self._deliver(target, outbox)
+            except Exception as e:
+                # 想定外のエラーでワーカーが止まると、以降の通知がすべて送られなくなるため続ける
+                self.error_count += 1
+                self.last_error = f"{target.name}: {str(e) or type(e).__name__}"
+                print(f"通知の処理中にエラーが発生しました: {self.last_error}")
+            finally:
+                self._busy.discard(target.name)
+    
+    async def _deliver(self, target, outbox):
+        """送信待ちのまとまりを古い順に送る（送れないまとまりがあればそこで止める）"""
+        while True:
+            item = outbox.peek()
+            if item is None:
+                return True
+            handle, events = item
+            if not await self._send(target, events):
+                return False
+            outbox.remove(handle)
+    
+    async def _send(self, target, events):
+        """1つのまとまりを、失敗した場合は間隔を空けて送り直しながら送る"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                await target.send(events, self.pool)
+            except Exception as e:
+                # 不正な応答（途中で切れた本文など）も送信の失敗として送り直す
+                self.error_count += 1
+                self.last_error = f"{target.name}: {str(e) or type(e).__name__}"
+                if attempt == self.max_retries:
+                    print(f"通知を送れませんでした（送信待ちに残します）: {self.last_error}")
+                    return False
+                delay = min(self.retry_max, self.retry_base * 2 ** attempt)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                continue
+            self.batch_count += 1
+            self.sent_count += len(events)
+            return True
+    
+    async def _drain(self, timeout):
+        self._closing = True
+        deadline = self._loop.time() + timeout
+        while self._loop.time() < deadline:
+            if not self._busy and all(queue.empty() for queue in self._queues.values()):
+                return
+            await asyncio.sleep(0.05)
+    
+    def close(self, timeout=5.0):
+        """
+        届いているイベントを送ってからイベントループを止める
+        
+        終了時はイベントをまとめる時間を待たずに送る。timeout 秒以内に送れなかったイベントは、
+        outbox_dir を指定した場合は次回の起動時に送る。
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._thread.is_alive():
+            future = asyncio.run_coroutine_threadsafe(self._drain(timeout), self._loop)
+            try:
+                future.result(timeout + 1.0)
+            except Exception:
+                pass
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5.0)
+    
+    def metrics(self):
+        """通知の件数などを辞書で返す"""
+        return {
+            "submitted": self.submitted_count,
+            "sent": self.sent_count,
+            "batches": self.batch_count,
+            "coalesced": self.coalesced_count,
+            "errors": self.error_count,
+            "dropped": self.dropped_count,
+            "pending_batches": sum(len(outbox) for outbox in self.outboxes.values()),
+            "connections_opened": self.pool.connections_opened if self.pool is not None else 0,
+            "requests_sent": self.pool.requests_sent if self.pool is not None else 0,
+            "last_error": self.last_error,
+        }
+
+class StubWebhookServer:
+    """
+    Webhookの動作確認用のローカルHTTPサーバー
+    
+    受け取ったJSONを received に保存する。fail_count を指定した場合は、その回数までの要求に
+    fail_status を返して通知先の障害を再現する。接続の使い回しは connection_count で確認できる。
+    
+    Parameters:
+    - host: 待ち受けるアドレス
+    - port: 待ち受けるポート（0の場合は空いているポート）
+    - fail_count: 失敗を返す要求の数
+    - fail_status: 失敗のときに返すステータスコード
+    - verbose: 受け取ったイベントを表示するかどうか
+    """
+    def __init__(self, host="127.0.0.1", port=0, fail_count=0, fail_status=503, verbose=False):
+        self.host = host
+        self.port = port
+        self.fail_count = fail_count
+        self.fail_status = fail_status
+        self.verbose = verbose
+        self.received = []
+        self.request_count = 0
+        self.connection_count = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+    
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}/notify"
+    
+    def start(self):
+        stub = self
+        
+        class Handler(StubWebhookHandler):
+            server_state = stub
+        
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+class StubWebhookHandler(BaseHTTPRequestHandler):
+    """StubWebhookServer の要求を処理するハンドラー（接続を使い回せるよう HTTP/1.1 で応答する）"""
+    protocol_version = "HTTP/1.1"
+    server_state = None
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def setup(self):
+        super().setup()
+        with self.server_state._lock:
+            self.server_state.connection_count += 1
+    
+    def do_POST(self):
+        stub = self.server_state
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with stub._lock:
+            stub.request_count += 1
+            failing = stub.request_count <= stub.fail_count
+            if not failing:
+                stub.received.append(json.loads(body.decode("utf-8")))
+        status = stub.fail_status if failing else 200
+        if stub.verbose:
+            print(f"{'失敗を返しました' if failing else '受信しました'}: {body.decode('utf-8')}")
+        response = json.dumps({"ok": not failing}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+def main():
+    parser = argparse.ArgumentParser(description="異常検知の通知の動作確認")
+    parser.add_argument("--stub-server", action="store_true", help="受け取った通知を表示するWebhookサーバーを起動する")
+    parser.add_argument("--port", type=int, default=8099, help="--stub-server で待ち受けるポート")
+    parser.add_argument("--fail", type=int, default=0, help="--stub-server で失敗を返す要求の数")
+    parser.add_argument("--webhook", nargs="+", default=[], help="テストイベントを送るURL")
+    parser.add_argument("--command", nargs="+", default=[], help="テストイベントを渡すコマンド")
+    parser.add_argument("--outbox", default=None, help="送信待ちのイベントを保存するディレクトリ")
+    args = parser.parse_args()
+    
+    if args.stub_server:
+        server = StubWebhookServer(port=args.port, fail_count=args.fail, verbose=True).start()
+        print(f"Webhookのテスト用サーバーを起動しました: {server.url}（Ctrl+Cで終了）")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            server.stop()
+        return
+    
+    targets = make_targets(args.webhook, args.command)
+    if not targets:
+        parser.error("--stub-server、--webhook、--command のいずれかを指定してください")
+    notifier = Notifier(targets, outbox_dir=args.outbox, batch_window=0.1, max_retries=2).start()
+    notifier.notify(EVENT_TEST, camera="test", message="通知のテスト")
+    notifier.close(timeout=15.0)
+    print(json.dumps(notifier.metrics(), ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
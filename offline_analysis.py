@@ -0,0 +1,254 @@
+import cv2
+import os
+import csv
+import json
+import time
+import argparse
+import multiprocessing
+
+from camera_monitor import is_white_cat_plush, DetectionParams, DEFAULT_PARAMS
+from frame_sources import VideoFileSource, ImageDirectorySource
+
+# 出力する表の列
+COLUMNS = ("frame", "time_sec", "is_cat", "confidence", "white_percentage",
+           "large_white_regions", "largest_area", "cat_shape_detected")
+
+# 読み込めなかったフレームの is_cat の値
+READ_FAILED = -1
+
+# この回数続けて読み込めなかった場合は、録画の終わりとみなして区間の解析をやめる
+MAX_CONSECUTIVE_FAILURES = 5
+
+def open_offline_source(path):
+    """動画ファイルまたは画像ディレクトリを開く"""
+    if os.path.isdir(path):
+        return ImageDirectorySource(path)
+    return VideoFileSource(path)
+
+def count_frames(path):
+    """
+    フレーム数とフレームレートを返す
+    
+    Returns:
+    - frame_count: フレーム数
+    - fps: フレームレート（画像ディレクトリの場合はNone）
+    """
+    source = open_offline_source(path)
+    try:
+        if not source.isOpened():
+            raise ValueError(f"開くことができませんでした: {path}")
+        fps = source.fps if isinstance(source, VideoFileSource) else None
+        return source.frame_count, fps or None
+    finally:
+        source.release()
+
+def make_chunks(frame_count, chunk_size):
+    """[start, end) のフレーム範囲のリストを返す"""
+    return [(start, min(start + chunk_size, frame_count)) for start in range(0, frame_count, chunk_size)]
+
+def analyze_chunk(task):
+    """
+    フレーム範囲を解析するワーカーの処理
+    
+    読み込めなかったフレームは is_cat が READ_FAILED（-1）の行として残し、次のフレームに進む。
+    MAX_CONSECUTIVE_FAILURES 回続けて読み込めなかった場合は録画の終わりとみなし、
+    続けて失敗したフレームの行は出力せず、残りのフレーム数を読まなかったフレーム数として返す。
+    
+    Parameters:
+    - task: (path, start, end, step, params_dict, fps) の組
+    
+    Returns:
+    - (start, 行のリスト, 読み込めなかったフレーム数, 録画の終わりとみなして読まなかったフレーム数)
+    """
+    path, start, end, step, params_dict, fps = task
+    cv2.setNumThreads(1)  # プロセスごとに1コアを使う
+    params = DetectionParams(**params_dict)
+    
+    source = open_offline_source(path)
+    rows = []
+    failures = 0
+    unread = 0
+    consecutive = 0
+    pending = []  # 続けて読み込めなかったフレームの行（次に読み込めたときに出力する）
+    try:
+        if start > 0:
+            source.set(cv2.CAP_PROP_POS_FRAMES, start)
+        for index in range(start, end):
+            # 解析しないフレームはデコードせずに読み飛ばす
+            analyse = index % step == 0
+            if analyse:
+                ret, frame = source.read()
+            else:
+                ret = source.grab()
+            
+            if not ret:
+                consecutive += 1
+                if analyse:
+                    pending.append((index, round(index / fps, 3) if fps else None, READ_FAILED,
+                                    None, None, None, None, None))
+                if consecutive >= MAX_CONSECUTIVE_FAILURES:
+                    unread = end - index - 1 + consecutive
+                    pending = []
+                    break
+                continue
+            failures += consecutive
+            consecutive = 0
+            rows.extend(pending)
+            pending = []
+            if not analyse:
+                continue
+            
+            is_cat, confidence, details = is_white_cat_plush(frame, params)
+            rows.append((
+                index,
+                round(index / fps, 3) if fps else None,
+                int(is_cat),
+                round(confidence, 4),
+                round(details["white_percentage"], 3),
+                details["large_white_regions"],
+                details["largest_area"],
+                int(details["cat_shape_detected"]),
+            ))
+        # 区間の最後で失敗が続いていた場合（録画の終わりとはみなさない）
+        if unread == 0:
+            failures += consecutive
+            rows.extend(pending)
+    finally:
+        source.release()
+    return start, rows, failures, unread
+
+def analyze_offline(path, params=DEFAULT_PARAMS, workers=None, chunk_size=500, step=1):
+    """
+    録画を区間に分けてプロセスプールで解析し、フレーム順の判定結果を返す
+    
+    Parameters:
+    - path: 動画ファイルまたは画像ディレクトリ
+    - params: 検出パラメータ（ライブ監視と同じ DetectionParams を渡す）
+    - workers: ワーカープロセス数（Noneの場合はCPUコア数）
+    - chunk_size: 1つのタスクで処理するフレーム数
+    - step: 何フレームごとに解析するか
+    
+    Returns:
+    - 行（COLUMNS の順のタプル）のリスト
+    """
+    frame_count, fps = count_frames(path)
+    if not frame_count:
+        raise ValueError(f"フレームがありません: {path}")
+    
+    workers = workers or os.cpu_count() or 1
+    chunks = make_chunks(frame_count, chunk_size)
+    tasks = [(path, start, end, step, params.to_dict(), fps) for start, end in chunks]
+    print(f"解析を開始します: {path} ({frame_count}フレーム, {len(chunks)}区間, {workers}プロセス)")
+    
+    rows = []
+    chunk_failures = []  # 読み込めなかったフレームがあった区間の (開始, 終了, 読み込めなかった数, 読まなかった数)
+    start_time = time.time()
+    if workers == 1:
+        results = map(analyze_chunk, tasks)
+    else:
+        pool = multiprocessing.Pool(workers)
+        # imap は区間の順番どおりに結果を返すため、そのまま連結すればフレーム順になる
+        results = pool.imap(analyze_chunk, tasks)
+    try:
+        for i, ((_, end), (chunk_start, chunk_rows, failures, unread)) in enumerate(zip(chunks, results)):
+            rows.extend(chunk_rows)
+            if failures or unread:
+                chunk_failures.append((chunk_start, end, failures, unread))
+            if workers != 1:
+                print(f"  {i + 1}/{len(tasks)} 区間完了" + (f"（読み込めなかったフレーム: {failures}）" if failures else ""))
+    finally:
+        if workers != 1:
+            pool.terminate()
+    
+    elapsed = time.time() - start_time
+    print(f"解析が完了しました: {len(rows)}フレーム / {elapsed:.1f}秒 ({len(rows) / max(elapsed, 1e-9):.1f} FPS)")
+    if chunk_failures:
+        print("読み込めなかったフレームがある区間:")
+        for chunk_start, end, failures, unread in chunk_failures:
+            line = f"  フレーム {chunk_start}〜{end - 1}: 読み込めなかったフレーム {failures}"
+            if unread:
+                line += f" / 録画の終わりとみなして読まなかったフレーム {unread}"
+            print(line)
+    return rows
+
+def find_alert_intervals(rows):
+    """
+    判定が「映っていない」だった連続区間を (開始フレーム, 終了フレーム, 開始秒, 終了秒) のリストで返す
+    """
+    intervals = []
+    current = None
+    for row in rows:
+        frame_index, time_sec, is_cat = row[0], row[1], row[2]
+        # 読み込めなかったフレームは区間を区切らない
+        if is_cat == READ_FAILED:
+            continue
+        if not is_cat:
+            if current is None:
+                current = [frame_index, frame_index, time_sec, time_sec]
+            else:
+                current[1], current[3] = frame_index, time_sec
+        elif current is not None:
+            intervals.append(tuple(current))
+            current = None
+    if current is not None:
+        intervals.append(tuple(current))
+    return intervals
+
+def write_table(rows, output_path):
+    """判定結果をCSVに保存する"""
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(rows)
+    print(f"判定結果を保存しました: {output_path}")
+
+def print_summary(rows):
+    """解析結果の概要を表示する"""
+    total = len(rows)
+    if total == 0:
+        print("解析したフレームがありません")
+        return
+    normal = sum(1 for row in rows if row[2] == 1)
+    failed = sum(1 for row in rows if row[2] == READ_FAILED)
+    alert = total - normal - failed
+    print("\n===== 解析結果 =====")
+    print(f"フレーム数: {total}")
+    print(f"正常: {normal}フレーム ({normal/total*100:.1f}%)")
+    print(f"異常: {alert}フレーム ({alert/total*100:.1f}%)")
+    if failed:
+        print(f"読み込めなかったフレーム: {failed}フレーム ({failed/total*100:.1f}%)")
+    
+    intervals = find_alert_intervals(rows)
+    print(f"異常区間: {len(intervals)}件")
+    for start, end, start_sec, end_sec in intervals[:20]:
+        if start_sec is not None:
+            print(f"  フレーム {start}〜{end} ({start_sec:.1f}秒〜{end_sec:.1f}秒)")
+        else:
+            print(f"  フレーム {start}〜{end}")
+    if len(intervals) > 20:
+        print(f"  ... 他 {len(intervals) - 20}件")
+
+def main():
+    parser = argparse.ArgumentParser(description="録画の白い猫のぬいぐるみ検出（並列解析）")
+    parser.add_argument("path", help="動画ファイルまたは画像ディレクトリ")
+    parser.add_argument("--output", default=None, help="判定結果のCSVファイル（デフォルトは <入力名>_analysis.csv）")
+    parser.add_argument("--workers", type=int, default=None, help="ワーカープロセス数（デフォルトはCPUコア数）")
+    parser.add_argument("--chunk-size", type=int, default=500, help="1区間のフレーム数")
+    parser.add_argument("--step", type=int, default=1, help="何フレームごとに解析するか")
+    parser.add_argument("--params", default=None,
+                        help="検出パラメータのJSONファイル（DetectionParams の引数。ライブ監視と同じ設定を使う）")
+    args = parser.parse_args()
+    
+    params = DEFAULT_PARAMS
+    if args.params:
+        with open(args.params, encoding="utf-8") as f:
+            params = DetectionParams(**json.load(f))
+    
+    rows = analyze_offline(args.path, params=params, workers=args.workers,
+                           chunk_size=args.chunk_size, step=args.step)
+    output = args.output or os.path.splitext(os.path.basename(os.path.normpath(args.path)))[0] + "_analysis.csv"
+    write_table(rows, output)
+    print_summary(rows)
+
+if __name__ == "__main__":
+    main()
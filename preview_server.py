@@ -0,0 +1,279 @@
+import cv2
+import time
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# MJPEGストリームの区切り文字列
+BOUNDARY = "frame"
+
+INDEX_HTML = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>カメラ監視プレビュー</title></head>
+<body style="background:#222;color:#eee;font-family:sans-serif">
+<h3>カメラ監視プレビュー</h3>
+<img src="/stream.mjpg" style="max-width:100%">
+<pre id="status"></pre>
+<script>
+setInterval(function() {
+  fetch("/status").then(function(r) { return r.json(); }).then(function(s) {
+    document.getElementById("status").textContent = JSON.stringify(s, null, 2);
+  });
+}, 1000);
+</script>
+</body>
+</html>
+"""
+
+class PreviewServer:
+    """
+    注釈付きのフレームをMJPEGストリームとして配信するローカルHTTPサーバー
+    
+    publish() で渡されたフレームはエンコード用スレッドで1回だけJPEGに変換し、
+    接続しているすべての閲覧者に同じデータを送る。配信のフレームレートは
+    max_fps で検出のチェック間隔とは別に制限する。
+    
+    エンドポイント:
+    - /: プレビュー用のHTMLページ
+    - /stream.mjpg: MJPEGストリーム
+    - /snapshot.jpg: 最新のフレーム（JPEG）
+    - /status: 最新の判定結果（JSON）
+    - /params: control_handler を指定した場合のみ。GETで現在の設定、POST（JSON）で設定の変更
+    - /metrics: metrics_provider を指定した場合のみ。Prometheusのテキスト形式のメトリクス
+    
+    Parameters:
+    - host: 待ち受けるアドレス（デフォルトはローカルのみ）
+    - port: 待ち受けるポート
+    - max_fps: 配信する最大フレームレート
+    - quality: JPEGの画質（0〜100）
+    - control_handler: /params への要求を処理する関数（任意）。GETでは None、POSTでは受け取った辞書を
+      引数に呼び出し、応答する辞書を返す。ValueError を送出した場合は 400 を返す
+    - metrics_provider: /metrics で返す文字列を作成する関数（任意）
+    """
+    def __init__(self, host="127.0.0.1", port=8080, max_fps=5.0, quality=80, control_handler=None,
+                 metrics_provider=None):
+        self.host = host
+        self.port = port
+        self.max_fps = max_fps
+        self.quality = quality
+        self.control_handler = control_handler
+        self.metrics_provider = metrics_provider
+        self.viewer_count = 0
+        self.encoded_count = 0
+        
+        self._condition = threading.Condition()
+        self._pending_frame = None
+        self._jpeg = None
+        self._sequence = 0
+        self._status = {}
+        self._last_publish = 0.0
+        self._snapshot_requested = False
+        self._running = False
+        self._httpd = None
+        self._threads = []
+    
+    def start(self):
+        """HTTPサーバーとエンコード用スレッドを開始する"""
+        server = self
+        
+        class Handler(PreviewRequestHandler):
+            preview = server
+        
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._running = True
+        
+        for target, name in ((self._httpd.serve_forever, "PreviewHTTP"), (self._encode_loop, "PreviewEncoder")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        
+        print(f"プレビューを配信しています: http://{self.host}:{self.port}/")
+        return self
+    
+    def wants_frame(self):
+        """
+        新しいフレームを受け付けるかどうかを返す
+        
+        閲覧者（またはスナップショットの要求）がない場合や、前回の配信から 1/max_fps 秒が経過していない場合はFalse。
+        Falseの間は呼び出し側でオーバーレイの描画も省略できる。
+        """
+        if self.viewer_count == 0 and not self._snapshot_requested:
+            return False
+        return time.time() - self._last_publish >= 1.0 / self.max_fps
+    
+    def request_snapshot(self):
+        """閲覧者がいなくても次のフレームを1枚だけエンコードさせる"""
+        with self._condition:
+            self._snapshot_requested = True
+            return self._sequence
+    
+    def publish(self, frame, status=None, copy=True):
+        """
+        配信するフレームと判定結果を更新する
+        
+        Parameters:
+        - frame: 注釈付きのフレーム（Noneの場合は判定結果だけを更新する）
+        - status: /status で返す辞書
+        - copy: フレームをコピーしてから渡すかどうか
+        
+        Returns:
+        - フレームを受け付けた場合はTrue
+        """
+        with self._condition:
+            if status is not None:
+                self._status = status
+            if frame is None or not self.wants_frame():
+                return False
+            self._last_publish = time.time()
+            self._snapshot_requested = False
+            self._pending_frame = frame.copy() if copy else frame
+            self._condition.notify_all()
+        return True
+    
+    def _encode_loop(self):
+        while self._running:
+            with self._condition:
+                while self._pending_frame is None and self._running:
+                    self._condition.wait(0.5)
+                frame = self._pending_frame
+                self._pending_frame = None
+            if frame is None:
+                continue
+            
+            # エンコードは1フレームにつき1回だけ行い、全閲覧者で共有する
+            ret, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+            if not ret:
+                continue
+            with self._condition:
+                self._jpeg = buffer.tobytes()
+                self._sequence += 1
+                self.encoded_count += 1
+                self._condition.notify_all()
+    
+    def wait_for_jpeg(self, last_sequence, timeout=1.0):
+        """
+        last_sequence より新しいJPEGが用意されるまで待つ
+        
+        Returns:
+        - (sequence, jpeg) の組（新しいJPEGがない場合は jpeg がNone）
+        """
+        deadline = time.time() + timeout
+        with self._condition:
+            while self._sequence <= last_sequence and self._running:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return last_sequence, None
+                self._condition.wait(remaining)
+            if self._sequence <= last_sequence:
+                return last_sequence, None
+            return self._sequence, self._jpeg
+    
+    def latest_jpeg(self):
+        """最新のJPEGを返す（まだない場合はNone）"""
+        with self._condition:
+            return self._jpeg
+    
+    def status(self):
+        """最新の判定結果を返す"""
+        with self._condition:
+            return dict(self._status)
+    
+    def stop(self):
+        """サーバーを停止する"""
+        self._running = False
+        with self._condition:
+            self._condition.notify_all()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+        self._threads = []
+
+class PreviewRequestHandler(BaseHTTPRequestHandler):
+    """PreviewServer のリクエストを処理する"""
+    preview = None
+    
+    def log_message(self, format, *args):
+        # アクセスごとのログは表示しない
+        pass
+    
+    def send_json(self, value, status=200):
+        self.send_body(json.dumps(value, ensure_ascii=False).encode("utf-8"),
+                       "application/json; charset=utf-8", status=status)
+    
+    def send_body(self, body, content_type, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/":
+            self.send_body(INDEX_HTML.encode("utf-8"), "text/html; charset=utf-8")
+        elif path == "/status":
+            self.send_json(self.preview.status())
+        elif path == "/params" and self.preview.control_handler is not None:
+            self.send_json(self.preview.control_handler(None))
+        elif path == "/metrics" and self.preview.metrics_provider is not None:
+            self.send_body(self.preview.metrics_provider().encode("utf-8"), "text/plain; version=0.0.4; charset=utf-8")
+        elif path == "/snapshot.jpg":
+            sequence = self.preview.request_snapshot()
+            _, jpeg = self.preview.wait_for_jpeg(sequence, timeout=3.0)
+            if jpeg is None:
+                jpeg = self.preview.latest_jpeg()
+            if jpeg is None:
+                self.send_body(b"no frame yet", "text/plain", status=503)
+            else:
+                self.send_body(jpeg, "image/jpeg")
+        elif path == "/stream.mjpg":
+            self.stream()
+        else:
+            self.send_body(b"not found", "text/plain", status=404)
+    
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        if path != "/params" or self.preview.control_handler is None:
+            self.send_body(b"not found", "text/plain", status=404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            changes = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(changes, dict):
+                raise ValueError("JSONのオブジェクトを指定してください")
+            self.send_json(self.preview.control_handler(changes))
+        except ValueError as e:
+            self.send_json({"error": str(e)}, status=400)
+    
+    def stream(self):
+        """MJPEGストリームを送り続ける"""
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        
+        preview = self.preview
+        with preview._condition:
+            preview.viewer_count += 1
+        try:
+            sequence = 0
+            while preview._running:
+                sequence, jpeg = preview.wait_for_jpeg(sequence)
+                if jpeg is None:
+                    continue
+                self.wfile.write(f"--{BOUNDARY}\r\n".encode("ascii"))
+                self.wfile.write(b"Content-Type: image/jpeg\r\n")
+                self.wfile.write(f"Content-Length: {len(jpeg)}\r\n\r\n".encode("ascii"))
+                self.wfile.write(jpeg)
+                self.wfile.write(b"\r\n")
+        except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+            pass
+        finally:
+            with preview._condition:
+                preview.viewer_count -= 1
@@ -0,0 +1,330 @@
+import cv2
+import numpy as np
+import os
+import csv
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+
+from camera_monitor import (DetectionParams, DEFAULT_PARAMS, is_white_cat_plush, clean_white_mask,
+                            find_white_contours, classify_regions)
+from frame_sources import ImageDirectorySource
+
+# コーパスのサブディレクトリ名と正解ラベル（白い猫のぬいぐるみが映っているかどうか）
+LABELS = {"present": True, "absent": False}
+
+# 出力する表の列
+COLUMNS = ("lower_white", "upper_white", "kernel_size", "min_vertices", "area_threshold", "white_threshold",
+           "precision", "recall", "f1", "accuracy", "tp", "fp", "fn", "tn")
+
+def load_corpus(directory):
+    """
+    ラベル付きのフレームのコーパスを読み込む
+    
+    directory/present/ と directory/absent/ の画像をそれぞれ「映っている」「映っていない」とする
+    
+    Returns:
+    - (画像のパス, ラベル) のリスト
+    """
+    corpus = []
+    for name, label in LABELS.items():
+        subdirectory = os.path.join(directory, name)
+        if not os.path.isdir(subdirectory):
+            print(f"警告: {subdirectory} がありません")
+            continue
+        corpus.extend((path, label) for path in ImageDirectorySource(subdirectory).paths)
+    return corpus
+
+def build_grid(h_min=(0,), h_max=(180,), s_min=(0,), s_max=(40, 50, 60, 70, 80, 90, 100),
+               v_min=(120, 130, 140, 150, 160, 170, 180, 190, 200), v_max=(255,), kernel_sizes=(3, 5, 7),
+               white_thresholds=tuple(range(2, 21)), area_thresholds=tuple(range(1000, 10001, 1000)),
+               min_vertices=(3, 4, 5, 6)):
+    """
+    探索するパラメータの格子を作成する
+    
+    HSVの閾値とカーネルサイズ（マスクの作成に影響する値）と、面積・頂点数・白色率の閾値
+    （マスクから求めた特徴量だけで判定できる値）を分けて保持する
+    
+    Returns:
+    - 格子の辞書
+    """
+    bounds = [((h0, s0, v0), (h1, s1, v1))
+              for h0, h1, s0, s1, v0, v1 in itertools.product(h_min, h_max, s_min, s_max, v_min, v_max)
+              if h0 <= h1 and s0 <= s1 and v0 <= v1]
+    return {
+        "bounds": bounds,
+        "kernel_sizes": list(kernel_sizes),
+        "min_vertices": list(min_vertices),
+        "area_thresholds": list(area_thresholds),
+        "white_thresholds": list(white_thresholds),
+    }
+
+def grid_size(grid):
+    """格子に含まれる設定の数を返す"""
+    return (len(grid["bounds"]) * len(grid["kernel_sizes"]) * len(grid["min_vertices"]) *
+            len(grid["area_thresholds"]) * len(grid["white_thresholds"]))
+
+def init_worker():
+    # フレームごとに1プロセスで並列化するため、OpenCV内部のスレッドは使わない
+    cv2.setNumThreads(1)
+
+def load_frame(path, resolution=None):
+    """画像を読み込み、指定があれば監視時の解像度に縮小する"""
+    frame = cv2.imread(path)
+    if frame is not None and resolution is not None and (frame.shape[1], frame.shape[0]) != tuple(resolution):
+        frame = cv2.resize(frame, tuple(resolution), interpolation=cv2.INTER_AREA)
+    return frame
+
+def frame_features(task):
+    """
+    1枚のフレームについて、マスクの作成に影響する設定ごとの特徴量を求める
+    
+    HSV変換はフレームごとに1回だけ行い、HSVの閾値ごとのマスク、カーネルサイズごとのノイズ除去と
+    輪郭抽出を1回ずつ行う。面積・頂点数・白色率の閾値は特徴量だけで判定できるため、ここでは扱わない。
+    
+    Parameters:
+    - task: (path, grid, resolution) の組
+    
+    Returns:
+    - white_percentage: 白色率（HSVの閾値 × カーネルサイズ）
+    - best_area: 頂点数の閾値ごとに、頂点数がそれより多い輪郭の最大面積（なければ-1）
+      （HSVの閾値 × カーネルサイズ × 頂点数の閾値）
+    （画像を読み込めなかった場合はNone）
+    """
+    path, grid, resolution = task
+    frame = load_frame(path, resolution)
+    if frame is None:
+        return None
+    
+    bounds, kernel_sizes, min_vertices = grid["bounds"], grid["kernel_sizes"], grid["min_vertices"]
+    white_percentage = np.zeros((len(bounds), len(kernel_sizes)), np.float64)
+    best_area = np.full((len(bounds), len(kernel_sizes), len(min_vertices)), -1.0)
+    vertex_thresholds = np.asarray(min_vertices)
+    
+    # すべての輪郭について頂点数を求めるため、面積の閾値を無効にしたパラメータを使う
+    kernel_params = [DetectionParams(kernel_size=k, area_threshold=-1) for k in kernel_sizes]
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    pixels = frame.shape[0] * frame.shape[1]
+    for i, (lower, upper) in enumerate(bounds):
+        mask = cv2.inRange(hsv, np.array(lower), np.array(upper))
+        for j, params in enumerate(kernel_params):
+            clean_mask = clean_white_mask(mask, params)
+            white_percentage[i, j] = cv2.countNonZero(clean_mask) / pixels * 100
+            contours = find_white_contours(clean_mask)
+            for region in classify_regions(contours, clean_mask.shape, params):
+                shaped = region["vertices"] > vertex_thresholds
+                best_area[i, j, shaped] = np.maximum(best_area[i, j, shaped], region["area"])
+    return white_percentage, best_area
+
+def compute_features(corpus, grid, workers=None, resolution=None):
+    """
+    コーパスのすべてのフレームの特徴量をプロセスプールで求める
+    
+    Returns:
+    - white_percentage: (フレーム, HSVの閾値, カーネルサイズ) の配列
+    - best_area: (フレーム, HSVの閾値, カーネルサイズ, 頂点数の閾値) の配列
+    - labels: 正解ラベルの配列
+    """
+    tasks = [(path, grid, resolution) for path, _ in corpus]
+    workers = workers or os.cpu_count() or 1
+    features = []
+    labels = []
+    start_time = time.time()
+    with multiprocessing.Pool(workers, initializer=init_worker) as pool:
+        # imap は入力の順番どおりに結果を返すため、ラベルとそのまま対応づけられる
+        for i, result in enumerate(pool.imap(frame_features, tasks, chunksize=4)):
+            path, label = corpus[i]
+            if result is None:
+                print(f"画像を読み込めませんでした: {path}")
+                continue
+            features.append(result)
+            labels.append(label)
+            if (i + 1) % 50 == 0:
+                print(f"  特徴量の計算: {i + 1}/{len(tasks)}フレーム")
+    print(f"特徴量の計算が完了しました: {len(features)}フレーム / {time.time() - start_time:.1f}秒")
+    
+    white_percentage = np.stack([wp for wp, _ in features])
+    best_area = np.stack([area for _, area in features])
+    return white_percentage, best_area, np.array(labels, dtype=bool)
+
+def evaluate_grid(white_percentage, best_area, labels, grid):
+    """
+    特徴量からすべての設定の混同行列を求める
+    
+    is_white_cat_plush の判定（白色率 > 閾値、かつ面積が閾値を超え頂点数が閾値より多い輪郭がある）を
+    格子全体についてまとめて計算する
+    
+    Returns:
+    - (tp, fp, fn, tn) の組。それぞれ (HSVの閾値, カーネルサイズ, 頂点数, 面積, 白色率) の配列
+    """
+    white_thresholds = np.asarray(grid["white_thresholds"], np.float64)
+    area_thresholds = np.asarray(grid["area_thresholds"], np.float64)
+    shape = (len(grid["bounds"]), len(grid["kernel_sizes"]), len(grid["min_vertices"]),
+             len(area_thresholds), len(white_thresholds))
+    tp = np.zeros(shape, np.int32)
+    fp = np.zeros(shape, np.int32)
+    positives = int(labels.sum())
+    negatives = len(labels) - positives
+    
+    # HSVの閾値ごとに、全フレーム × 残りの設定の判定を一度に計算する
+    for i in range(len(grid["bounds"])):
+        white_ok = white_percentage[:, i, :, None, None, None] > white_thresholds
+        area_ok = best_area[:, i, :, :, None, None] > area_thresholds[:, None]
+        predicted = white_ok & area_ok
+        tp[i] = predicted[labels].sum(axis=0)
+        fp[i] = predicted[~labels].sum(axis=0)
+    
+    fn = positives - tp
+    tn = negatives - fp
+    return tp, fp, fn, tn
+
+def config_params(grid, index):
+    """格子の添字に対応する検出パラメータを返す"""
+    i, j, k, a, w = index
+    lower, upper = grid["bounds"][i]
+    return DetectionParams(lower_white=lower, upper_white=upper, kernel_size=grid["kernel_sizes"][j],
+                           min_vertices=grid["min_vertices"][k], area_threshold=grid["area_thresholds"][a],
+                           white_threshold=grid["white_thresholds"][w])
+
+def summarize(tp, fp, fn, tn):
+    """混同行列から適合率・再現率・F1・正解率の配列を求める"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), 0.0)
+        recall = np.where(tp + fn > 0, tp / (tp + fn), 0.0)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    accuracy = (tp + tn) / (tp + fp + fn + tn)
+    return precision, recall, f1, accuracy
+
+def ranked_configs(grid, tp, fp, fn, tn, min_precision=None, min_recall=None):
+    """
+    設定をF1の高い順（同じ場合は正解率、適合率の高い順）に並べた添字のリストを返す
+    
+    min_precision / min_recall を指定した場合は、それを満たす設定だけを返す
+    """
+    precision, recall, f1, accuracy = summarize(tp, fp, fn, tn)
+    valid = np.ones(f1.shape, bool)
+    if min_precision is not None:
+        valid &= precision >= min_precision
+    if min_recall is not None:
+        valid &= recall >= min_recall
+    flat = np.flatnonzero(valid)
+    order = np.lexsort((-precision.ravel()[flat], -accuracy.ravel()[flat], -f1.ravel()[flat]))
+    return [np.unravel_index(index, f1.shape) for index in flat[order]]
+
+def config_row(grid, index, tp, fp, fn, tn):
+    """表の1行（COLUMNS の順のタプル）を返す"""
+    params = config_params(grid, index)
+    precision, recall, f1, accuracy = (float(v) for v in summarize(tp[index], fp[index], fn[index], tn[index]))
+    return (
+        "/".join(str(int(v)) for v in params.lower_white),
+        "/".join(str(int(v)) for v in params.upper_white),
+        params.kernel_size, params.min_vertices, params.area_threshold, params.white_threshold,
+        round(precision, 4), round(recall, 4), round(f1, 4), round(accuracy, 4),
+        int(tp[index]), int(fp[index]), int(fn[index]), int(tn[index]),
+    )
+
+def write_table(grid, tp, fp, fn, tn, output_path):
+    """すべての設定の結果をCSVに保存する"""
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for index in np.ndindex(tp.shape):
+            writer.writerow(config_row(grid, index, tp, fp, fn, tn))
+    print(f"すべての設定の結果を保存しました: {output_path}")
+
+def verify_config(corpus, params, resolution=None):
+    """
+    実際の判定処理（is_white_cat_plush）で設定を評価し直す（特徴量による評価との一致の確認用）
+    
+    Returns:
+    - (tp, fp, fn, tn) の組
+    """
+    counts = {"tp": 0, "fp": 0, "fn": 0, "tn": 0}
+    for path, label in corpus:
+        frame = load_frame(path, resolution)
+        if frame is None:
+            continue
+        predicted = bool(is_white_cat_plush(frame, params).is_cat)
+        key = ("t" if predicted == label else "f") + ("p" if predicted else "n")
+        counts[key] += 1
+    return counts["tp"], counts["fp"], counts["fn"], counts["tn"]
+
+def print_metrics(title, tp, fp, fn, tn):
+    """混同行列と適合率・再現率を表示する"""
+    precision, recall, f1, accuracy = (float(v) for v in summarize(np.array(tp), np.array(fp),
+                                                                   np.array(fn), np.array(tn)))
+    print(f"{title}: 適合率 {precision:.3f} / 再現率 {recall:.3f} / F1 {f1:.3f} / 正解率 {accuracy:.3f} "
+          f"(TP {tp}, FP {fp}, FN {fn}, TN {tn})")
+
+def main():
+    parser = argparse.ArgumentParser(description="ラベル付きフレームでの検出パラメータの探索")
+    parser.add_argument("corpus", help="present/ と absent/ のサブディレクトリを持つディレクトリ")
+    parser.add_argument("--h-min", type=int, nargs="+", default=[0])
+    parser.add_argument("--h-max", type=int, nargs="+", default=[180])
+    parser.add_argument("--s-min", type=int, nargs="+", default=[0])
+    parser.add_argument("--s-max", type=int, nargs="+", default=[40, 50, 60, 70, 80, 90, 100])
+    parser.add_argument("--v-min", type=int, nargs="+", default=[120, 130, 140, 150, 160, 170, 180, 190, 200])
+    parser.add_argument("--v-max", type=int, nargs="+", default=[255])
+    parser.add_argument("--kernel-sizes", type=int, nargs="+", default=[3, 5, 7])
+    parser.add_argument("--min-vertices", type=int, nargs="+", default=[3, 4, 5, 6])
+    parser.add_argument("--area-thresholds", type=int, nargs="+", default=list(range(1000, 10001, 1000)))
+    parser.add_argument("--white-thresholds", type=float, nargs="+", default=[float(v) for v in range(2, 21)])
+    parser.add_argument("--resolution", type=int, nargs=2, default=None, metavar=("WIDTH", "HEIGHT"),
+                        help="監視時の解像度に縮小してから評価する")
+    parser.add_argument("--workers", type=int, default=None, help="ワーカープロセス数（デフォルトはCPUコア数）")
+    parser.add_argument("--min-precision", type=float, default=None, help="最良の設定に求める適合率の下限")
+    parser.add_argument("--min-recall", type=float, default=None, help="最良の設定に求める再現率の下限")
+    parser.add_argument("--top", type=int, default=10, help="表示する上位の設定の数")
+    parser.add_argument("--output", default=None, help="すべての設定の結果を保存するCSVファイル")
+    parser.add_argument("--save-best", default=None, help="最良の設定を保存するJSONファイル（--params で使える形式）")
+    parser.add_argument("--no-verify", action="store_true", help="最良の設定を実際の判定処理で確認しない")
+    args = parser.parse_args()
+    
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        print("評価するフレームがありません")
+        return
+    grid = build_grid(args.h_min, args.h_max, args.s_min, args.s_max, args.v_min, args.v_max,
+                      args.kernel_sizes, args.white_thresholds, args.area_thresholds, args.min_vertices)
+    present = sum(1 for _, label in corpus if label)
+    print(f"コーパス: {len(corpus)}フレーム（映っている {present} / 映っていない {len(corpus) - present}）")
+    print(f"探索する設定: {grid_size(grid)}通り（マスクの作成 {len(grid['bounds']) * len(grid['kernel_sizes'])}通り/フレーム）")
+    
+    white_percentage, best_area, labels = compute_features(corpus, grid, args.workers, args.resolution)
+    start_time = time.time()
+    tp, fp, fn, tn = evaluate_grid(white_percentage, best_area, labels, grid)
+    print(f"全設定の評価が完了しました: {time.time() - start_time:.2f}秒")
+    
+    if args.output:
+        write_table(grid, tp, fp, fn, tn, args.output)
+    
+    print(f"\n===== 上位{args.top}件（F1順） =====")
+    print(" ".join(f"{column:>14}" for column in COLUMNS[:10]))
+    ranked = ranked_configs(grid, tp, fp, fn, tn, args.min_precision, args.min_recall)
+    for index in ranked[:args.top]:
+        print(" ".join(f"{str(value):>14}" for value in config_row(grid, index, tp, fp, fn, tn)[:10]))
+    if not ranked:
+        print("条件を満たす設定がありません")
+        return
+    
+    print()
+    resolution = tuple(args.resolution) if args.resolution else None
+    print_metrics("現在のデフォルト", *verify_config(corpus, DEFAULT_PARAMS, resolution))
+    best = ranked[0]
+    best_params = config_params(grid, best)
+    print_metrics("最良の設定", int(tp[best]), int(fp[best]), int(fn[best]), int(tn[best]))
+    print(json.dumps(best_params.to_dict(), ensure_ascii=False))
+    if not args.no_verify:
+        verified = verify_config(corpus, best_params, resolution)
+        expected = (int(tp[best]), int(fp[best]), int(fn[best]), int(tn[best]))
+        print("実際の判定処理での確認: " + ("一致" if verified == expected else f"不一致 {verified}"))
+    
+    if args.save_best:
+        with open(args.save_best, "w", encoding="utf-8") as f:
+            json.dump(best_params.to_dict(), f, indent=2, ensure_ascii=False)
+        print(f"最良の設定を保存しました: {args.save_best}")
+
+if __name__ == "__main__":
+    main()
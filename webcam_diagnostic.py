@@ -1,8 +1,13 @@
 import cv2
+import numpy as np
 import time
 import subprocess
 import os
 import sys
+import csv
+import json
+import argparse
+import itertools
 
 def check_camera_privacy_settings():
     """
@@ -70,7 +75,7 @@ def test_different_backends():
                 cap.release()
             else:
                 print(f"❌ {backend_name}: 接続失敗")
-                
+        
         except Exception as e:
             print(f"❌ {backend_name}: エラー - {e}")
     
@@ -163,6 +168,270 @@ def advanced_troubleshooting():
     print("   - スクリプトを再実行")
     print()
 
+# ベンチマークで試すバックエンド（利用できるものだけを使う）
+BENCHMARK_BACKENDS = {
+    "dshow": (cv2.CAP_DSHOW, "DirectShow"),
+    "msmf": (cv2.CAP_MSMF, "Microsoft Media Foundation"),
+    "v4l2": (cv2.CAP_V4L2, "Video4Linux2"),
+    "gstreamer": (cv2.CAP_GSTREAMER, "GStreamer"),
+    "ffmpeg": (cv2.CAP_FFMPEG, "FFmpeg"),
+    "any": (cv2.CAP_ANY, "Auto"),
+}
+
+# ベンチマークのデフォルトの組み合わせ
+BENCHMARK_RESOLUTIONS = ((640, 360), (1280, 720), (1920, 1080))
+BENCHMARK_FOURCCS = ("MJPG", "YUYV")
+BENCHMARK_BUFFER_SIZES = (1, 4)
+
+# 動画ファイルで試すバックエンド（解像度とピクセル形式の指定は反映されない）
+FILE_BACKENDS = ("ffmpeg", "any")
+
+# 出力する表の列
+BENCHMARK_COLUMNS = ("backend", "resolution", "fourcc", "buffer_size", "working", "fps", "jitter_ms",
+                     "interval_p95_ms", "first_frame_ms", "cpu_percent", "cpu_ms_per_frame", "failures",
+                     "actual_resolution", "actual_fourcc")
+
+def decode_fourcc(value):
+    """CAP_PROP_FOURCC の値を文字列に変換する"""
+    value = int(value)
+    if value <= 0:
+        return ""
+    return "".join(chr((value >> (8 * i)) & 0xFF) for i in range(4)).strip("\x00 ")
+
+def available_backends(names=None, file_source=False):
+    """
+    ベンチマークで試すバックエンドを (名前, ID, 表示名) のリストで返す
+    
+    file_source がTrueの場合は動画ファイルを読めるバックエンド、それ以外はカメラのバックエンドから選ぶ
+    """
+    registry = cv2.videoio_registry
+    available = set(registry.getStreamBackends() if file_source else registry.getCameraBackends())
+    backends = []
+    for name, (backend_id, label) in BENCHMARK_BACKENDS.items():
+        if names is not None and name not in names:
+            continue
+        if file_source and name not in FILE_BACKENDS:
+            continue
+        if backend_id == cv2.CAP_ANY or backend_id in available:
+            backends.append((name, backend_id, label))
+    return backends
+
+def open_capture(source, backend_id, resolution, fourcc, buffer_size):
+    """設定を指定してキャプチャを開く（V4L2では解像度より先にピクセル形式を設定する）"""
+    cap = cv2.VideoCapture(source, backend_id)
+    if cap.isOpened():
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fourcc))
+        cap.set(cv2.CAP_PROP_FRAME_WIDTH, resolution[0])
+        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, resolution[1])
+        cap.set(cv2.CAP_PROP_FPS, 30)
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, buffer_size)
+    return cap
+
+def benchmark_capture(source, backend_id, resolution, fourcc, buffer_size, duration=3.0):
+    """
+    1つの組み合わせで、待ち時間を入れずにフレームを読み続けて性能を測定する
+    
+    Parameters:
+    - source: カメラデバイス番号または動画ファイルのパス（動画は最後まで読んだら先頭に戻る）
+    - backend_id: OpenCVのバックエンド
+    - resolution: 要求する解像度（幅, 高さ）
+    - fourcc: 要求するピクセル形式
+    - buffer_size: ドライバのバッファに保持するフレーム数
+    - duration: 測定時間（秒）
+    
+    Returns:
+    - 測定結果の辞書（開けなかった場合やフレームを取得できなかった場合は working がFalse）
+    """
+    result = {"resolution": f"{resolution[0]}x{resolution[1]}", "fourcc": fourcc, "buffer_size": buffer_size,
+              "working": False, "fps": 0.0, "jitter_ms": None, "interval_p95_ms": None, "first_frame_ms": None,
+              "cpu_percent": None, "cpu_ms_per_frame": None, "failures": 0,
+              "actual_resolution": None, "actual_fourcc": None}
+    is_file = isinstance(source, str)
+    
+    # 開いてから最初のフレームを取得するまでの時間
+    start = time.perf_counter()
+    cap = open_capture(source, backend_id, resolution, fourcc, buffer_size)
+    try:
+        if not cap.isOpened():
+            return result
+        ret, frame = cap.read()
+        if not ret:
+            return result
+        result["first_frame_ms"] = (time.perf_counter() - start) * 1000
+        result["actual_resolution"] = f"{frame.shape[1]}x{frame.shape[0]}"
+        result["actual_fourcc"] = decode_fourcc(cap.get(cv2.CAP_PROP_FOURCC))
+        
+        # 一定時間読み続け、フレームの間隔とCPU時間を記録する
+        intervals = []
+        frames = 0
+        failures = 0
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        previous = wall_start
+        while time.perf_counter() - wall_start < duration:
+            ret, frame = cap.read()
+            now = time.perf_counter()
+            if not ret:
+                if is_file:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    previous = now
+                    continue
+                failures += 1
+                if failures > 10 and frames == 0:
+                    break
+                continue
+            intervals.append(now - previous)
+            previous = now
+            frames += 1
+        elapsed = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+    finally:
+        cap.release()
+    
+    if frames == 0:
+        return result
+    intervals = np.array(intervals) * 1000
+    result.update({
+        "working": failures <= frames * 0.05,
+        "fps": frames / elapsed,
+        "jitter_ms": float(intervals.std()),
+        "interval_p95_ms": float(np.percentile(intervals, 95)),
+        "cpu_percent": cpu / elapsed * 100,
+        "cpu_ms_per_frame": cpu / frames * 1000,
+        "failures": failures,
+    })
+    return result
+
+def run_benchmark_matrix(source=0, backends=None, resolutions=BENCHMARK_RESOLUTIONS, fourccs=BENCHMARK_FOURCCS,
+                         buffer_sizes=BENCHMARK_BUFFER_SIZES, duration=3.0):
+    """
+    バックエンド × 解像度 × ピクセル形式 × バッファサイズのすべての組み合わせを測定する
+    
+    Parameters:
+    - source: カメラデバイス番号または動画ファイルのパス（ハードウェアなしでの確認用）
+    - backends: 試すバックエンドの名前のリスト（Noneの場合は利用できるすべて）
+    
+    Returns:
+    - 測定結果の辞書のリスト
+    """
+    backends = available_backends(backends, file_source=isinstance(source, str))
+    combinations = list(itertools.product(backends, resolutions, fourccs, buffer_sizes))
+    print(f"=== キャプチャのベンチマーク（{len(combinations)}通り × {duration}秒）===")
+    results = []
+    for (name, backend_id, label), resolution, fourcc, buffer_size in combinations:
+        print(f"{label} / {resolution[0]}x{resolution[1]} / {fourcc} / バッファ {buffer_size} ... ", end="", flush=True)
+        try:
+            result = benchmark_capture(source, backend_id, resolution, fourcc, buffer_size, duration)
+        except Exception as e:
+            print(f"❌ エラー - {e}")
+            continue
+        result["backend"] = name
+        results.append(result)
+        if result["working"]:
+            print(f"✅ {result['fps']:.1f} FPS (ゆらぎ {result['jitter_ms']:.1f}ms, CPU {result['cpu_percent']:.0f}%)")
+        else:
+            print("❌ フレーム取得失敗")
+    return results
+
+def settings_applied(result):
+    """要求した解像度とピクセル形式で取得できたかどうかを返す"""
+    return result["actual_resolution"] == result["resolution"] and result["actual_fourcc"] == result["fourcc"]
+
+def rank_results(results):
+    """
+    動作した組み合わせを速い順に並べる
+    
+    フレームレートが同程度（1 FPS未満の差）の場合は、1フレームあたりのCPU時間、ゆらぎの小さい順にする。
+    要求した解像度・ピクセル形式で取得できなかった組み合わせは後ろに回す
+    """
+    working = [result for result in results if result["working"]]
+    return sorted(working, key=lambda r: (r["actual_resolution"] != r["resolution"], not settings_applied(r),
+                                          -round(r["fps"]), r["cpu_ms_per_frame"], r["jitter_ms"]))
+
+def recommend(results, resolution=None):
+    """
+    monitor_camera に使う組み合わせを選ぶ
+    
+    Parameters:
+    - resolution: 使いたい解像度（幅, 高さ）。指定した場合はその解像度で取得できたものから選ぶ
+    
+    Returns:
+    - 最も速い組み合わせの結果（ない場合はNone）
+    """
+    ranked = rank_results(results)
+    if resolution is not None:
+        wanted = f"{resolution[0]}x{resolution[1]}"
+        ranked = [r for r in ranked if r["resolution"] == wanted and r["actual_resolution"] == wanted]
+    return ranked[0] if ranked else None
+
+def print_benchmark_table(results):
+    """動作した組み合わせを順位付きで表示する"""
+    ranked = rank_results(results)
+    print(f"\n=== ベンチマーク結果（動作: {len(ranked)}/{len(results)}通り）===")
+    print(f"{'順位':<4} {'バックエンド':<10} {'解像度':<10} {'形式':<5} {'バッファ':>4} {'FPS':>6} "
+          f"{'ゆらぎms':>8} {'p95ms':>7} {'初回ms':>7} {'CPU%':>5} {'CPUms/枚':>8} {'実際の解像度/形式'}")
+    for rank, r in enumerate(ranked, 1):
+        print(f"{rank:<4} {r['backend']:<10} {r['resolution']:<10} {r['fourcc']:<5} {r['buffer_size']:>4} "
+              f"{r['fps']:>6.1f} {r['jitter_ms']:>8.2f} {r['interval_p95_ms']:>7.1f} {r['first_frame_ms']:>7.0f} "
+              f"{r['cpu_percent']:>5.0f} {r['cpu_ms_per_frame']:>8.2f} {r['actual_resolution']}/{r['actual_fourcc']}")
+
+def print_recommendation(result):
+    """推奨する monitor_camera の設定を表示する"""
+    if result is None:
+        print("\n❌ 動作する組み合わせがありませんでした")
+        return
+    backend_id, label = BENCHMARK_BACKENDS[result["backend"]]
+    width, height = (int(v) for v in result["resolution"].split("x"))
+    if not settings_applied(result):
+        print(f"\n⚠️ 要求した設定が反映されていません（実際: {result['actual_resolution']} / {result['actual_fourcc']}）")
+    print(f"\n📋 推奨設定: {label} / {result['resolution']} / {result['fourcc']} / バッファ {result['buffer_size']} "
+          f"({result['fps']:.1f} FPS)")
+    print(f"monitor_camera(resolution=({width}, {height}), capture=CaptureOptions(backend={backend_id}, "
+          f"fourcc=\"{result['fourcc']}\", buffer_size={result['buffer_size']}))")
+    print("設定ファイルの場合: " + json.dumps({"monitor": {
+        "resolution": [width, height],
+        "capture": {"backend": backend_id, "fourcc": result["fourcc"], "buffer_size": result["buffer_size"]}}}))
+
+def write_benchmark_table(results, output_path):
+    """測定結果をCSVに保存する"""
+    with open(output_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(BENCHMARK_COLUMNS)
+        for result in results:
+            writer.writerow([result.get(column) for column in BENCHMARK_COLUMNS])
+    print(f"測定結果を保存しました: {output_path}")
+
+def parse_resolution(value):
+    """'1280x720' を (1280, 720) に変換する"""
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+def benchmark_main(argv=None):
+    """ベンチマークモードのコマンドライン"""
+    parser = argparse.ArgumentParser(description="カメラのキャプチャ設定のベンチマーク")
+    parser.add_argument("--benchmark", action="store_true", help="ベンチマークモードで実行する")
+    parser.add_argument("--source", default="0", help="カメラデバイス番号または動画ファイル（ハードウェアなしでの確認用）")
+    parser.add_argument("--backends", nargs="+", default=None, choices=sorted(BENCHMARK_BACKENDS),
+                        help="試すバックエンド（デフォルトは利用できるすべて）")
+    parser.add_argument("--resolutions", nargs="+", type=parse_resolution,
+                        default=list(BENCHMARK_RESOLUTIONS), help="試す解像度（例: 640x360 1280x720）")
+    parser.add_argument("--fourccs", nargs="+", default=list(BENCHMARK_FOURCCS), help="試すピクセル形式")
+    parser.add_argument("--buffer-sizes", nargs="+", type=int, default=list(BENCHMARK_BUFFER_SIZES),
+                        help="試すドライバのバッファサイズ")
+    parser.add_argument("--duration", type=float, default=3.0, help="1つの組み合わせの測定時間（秒）")
+    parser.add_argument("--target-resolution", type=parse_resolution, default=None,
+                        help="推奨設定を選ぶ解像度（例: 640x360）")
+    parser.add_argument("--output", default=None, help="測定結果のCSVファイル")
+    args = parser.parse_args(argv)
+    
+    source = int(args.source) if args.source.isdigit() else args.source
+    results = run_benchmark_matrix(source, args.backends, args.resolutions, args.fourccs,
+                                   args.buffer_sizes, args.duration)
+    print_benchmark_table(results)
+    print_recommendation(recommend(results, args.target_resolution))
+    if args.output:
+        write_benchmark_table(results, args.output)
+
 def main():
     """
     メイン診断フロー
@@ -210,7 +479,10 @@ def main():
 
 if __name__ == "__main__":
     try:
-        main()
+        if "--benchmark" in sys.argv[1:]:
+            benchmark_main()
+        else:
+            main()
     except KeyboardInterrupt:
         print("\n診断が中断されました")
     except Exception as e:
@@ -40,11 +40,13 @@ def test_webcam():
     print("\nフレーム取得テスト開始...")
     frame_count = 0
     success_count = 0
-    start_time = time.time()
+    read_time = 0.0
     
     # 10フレーム取得を試行
     for i in range(10):
+        read_start = time.perf_counter()
         ret, frame = cap.read()
+        read_time += time.perf_counter() - read_start
         frame_count += 1
         
         if ret:
@@ -55,15 +57,13 @@ def test_webcam():
         
         time.sleep(0.1)  # 100ms待機
     
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    
     # 結果表示
     print(f"\n=== テスト結果 ===")
     print(f"総フレーム数: {frame_count}")
     print(f"成功フレーム数: {success_count}")
     print(f"成功率: {(success_count/frame_count)*100:.1f}%")
-    print(f"実測FPS: {frame_count/elapsed_time:.1f}")
+    # 取得の間に待機しているためFPSは測れない。連続取得の性能は webcam_diagnostic.py --benchmark で測定する
+    print(f"平均取得時間: {read_time/frame_count*1000:.1f}ms")
     
     # カメラリソースを解放
     cap.release()
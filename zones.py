@@ -0,0 +1,292 @@
+import cv2
+import numpy as np
+import time
+
+from camera_monitor import record_stage
+
+# 占有率の規則
+RULE_REQUIRED = "required"
+RULE_FORBIDDEN = "forbidden"
+
+# 規則ごとのデフォルトの閾値（%）
+DEFAULT_THRESHOLDS = {RULE_REQUIRED: 20.0, RULE_FORBIDDEN: 5.0}
+
+class Zone:
+    """
+    占有率を調べる画面内の領域と、その領域に対する規則
+    
+    座標はフレームの幅・高さに対する比率（0〜1）で指定するため、解像度が変わっても同じ設定を使える。
+    占有率はノイズ除去後のマスクで、領域内の画素のうち物体の色の画素の割合（%）とする。
+    
+    Parameters:
+    - name: 領域名（表示やログに使う）
+    - rect: 矩形 (x1, y1, x2, y2)
+    - polygon: 多角形の頂点 [(x, y), ...]（rect の代わりに指定する）
+    - rule: "required"（占有率が threshold% 以上であること）または "forbidden"（threshold% 以下であること）
+    - threshold: 占有率の閾値（%）。Noneの場合は required で20%、forbidden で5%
+    - profile: 占有率を調べる色のプロファイル名（Noneの場合は白色のマスク、
+      複数のプロファイルを監視している場合は最初のプロファイル）
+    """
+    def __init__(self, name, rect=None, polygon=None, rule=RULE_REQUIRED, threshold=None, profile=None):
+        if (rect is None) == (polygon is None):
+            raise ValueError(f"領域 '{name}' には rect と polygon のどちらか一方を指定してください")
+        if rule not in DEFAULT_THRESHOLDS:
+            raise ValueError(f"領域 '{name}' の規則が正しくありません: {rule}（required または forbidden）")
+        if polygon is not None and len(polygon) < 3:
+            raise ValueError(f"領域 '{name}' の多角形には3つ以上の頂点を指定してください")
+        self.name = name
+        self.rect = tuple(float(v) for v in rect) if rect is not None else None
+        self.polygon = [tuple(float(v) for v in point) for point in polygon] if polygon is not None else None
+        self.rule = rule
+        self.threshold = DEFAULT_THRESHOLDS[rule] if threshold is None else float(threshold)
+        self.profile = profile
+    
+    def __eq__(self, other):
+        return isinstance(other, Zone) and self.to_dict() == other.to_dict()
+    
+    def __repr__(self):
+        return f"Zone({self.name!r}, {self.rule})"
+    
+    def is_satisfied(self, percentage):
+        """占有率が規則を満たしているかどうかを返す"""
+        if self.rule == RULE_REQUIRED:
+            return percentage >= self.threshold
+        return percentage <= self.threshold
+    
+    def violation(self, percentage):
+        """
+        規則からどれだけ外れているかを返す
+        
+        Returns:
+        - 0（閾値ちょうど、または規則を満たす）〜1（required で占有率0%、forbidden で100%）
+        """
+        if self.rule == RULE_REQUIRED:
+            shortfall = self.threshold - percentage
+            return min(1.0, max(0.0, shortfall / self.threshold)) if self.threshold > 0 else 0.0
+        excess = percentage - self.threshold
+        return min(1.0, max(0.0, excess / (100 - self.threshold))) if self.threshold < 100 else 0.0
+    
+    def to_pixels(self, shape):
+        """領域の頂点を、大きさが shape の画像のピクセル座標（int32 の配列）で返す"""
+        height, width = shape[:2]
+        if self.rect is not None:
+            x1, y1, x2, y2 = self.rect
+            points = [(x1, y1), (x2, y1), (x2, y2), (x1, y2)]
+        else:
+            points = self.polygon
+        return np.round(np.array(points) * (width, height)).astype(np.int32)
+    
+    def rectangles(self, shape):
+        """
+        領域を、大きさが shape の画像上の重ならない矩形に分ける
+        
+        矩形はそのまま、多角形は塗りつぶした画像の行ごとの区間を、同じ区間が続く行でまとめる。
+        積分画像での合計は矩形ごとに4点の参照で求まるため、占有率の計算は領域の形だけで決まり、
+        マスクの内容によらない。
+        
+        Returns:
+        - (y1, x1, y2, x2) の int64 の配列（終端は含まない）
+        """
+        height, width = shape[:2]
+        if self.rect is not None:
+            x1, y1, x2, y2 = self.rect
+            x1, x2 = sorted((int(round(x1 * width)), int(round(x2 * width))))
+            y1, y2 = sorted((int(round(y1 * height)), int(round(y2 * height))))
+            x1, x2 = np.clip((x1, x2), 0, width)
+            y1, y2 = np.clip((y1, y2), 0, height)
+            if x1 >= x2 or y1 >= y2:
+                return np.zeros((0, 4), np.int64)
+            return np.array([[y1, x1, y2, x2]], np.int64)
+        
+        raster = np.zeros((height, width), np.uint8)
+        cv2.fillPoly(raster, [self.to_pixels(shape)], 1)
+        rectangles = []
+        open_runs = {}
+        for y in range(height + 1):
+            runs = set()
+            if y < height:
+                edges = np.flatnonzero(np.diff(np.r_[0, raster[y], 0].astype(np.int8)))
+                runs = set(zip(edges[::2].tolist(), edges[1::2].tolist()))
+            for run in [run for run in open_runs if run not in runs]:
+                rectangles.append((open_runs.pop(run), run[0], y, run[1]))
+            for run in runs:
+                open_runs.setdefault(run, y)
+        return np.array(rectangles, np.int64).reshape(-1, 4)
+    
+    def to_dict(self):
+        """設定ファイルに保存できる形式の辞書を返す"""
+        data = {"name": self.name, "rule": self.rule, "threshold": self.threshold, "profile": self.profile}
+        if self.rect is not None:
+            data["rect"] = list(self.rect)
+        else:
+            data["polygon"] = [list(point) for point in self.polygon]
+        return data
+    
+    @classmethod
+    def from_dict(cls, data):
+        """辞書から領域を作成する"""
+        if not isinstance(data, dict) or "name" not in data:
+            raise ValueError("領域には name を指定してください")
+        unknown = set(data) - {"name", "rect", "polygon", "rule", "threshold", "profile"}
+        if unknown:
+            raise ValueError(f"領域 '{data['name']}' に不明な項目があります: {', '.join(sorted(unknown))}")
+        return cls(**data)
+
+class ZoneMonitor:
+    """
+    検出結果のマスクから領域ごとの占有率を求め、規則を判定に加えるクラス
+    
+    マスクごとに積分画像を1回だけ作成し、各領域の画素数は領域を分けた矩形の4隅の参照で求める。
+    領域をいくつ増やしても、追加の費用は矩形ごとの定数回の参照だけになる。
+    領域の矩形への分割はマスクの大きさごとに1回だけ行う（カスケード判定の縮小画像にも対応する）。
+    
+    Parameters:
+    - zones: Zone のリスト（名前は重複しないこと）
+    """
+    def __init__(self, zones):
+        zones = list(zones)
+        if not zones:
+            raise ValueError("領域を1つ以上指定してください")
+        names = [zone.name for zone in zones]
+        if len(set(names)) != len(names):
+            raise ValueError(f"領域名が重複しています: {', '.join(names)}")
+        self.zones = zones
+        self._profiles = list(dict.fromkeys(zone.profile for zone in zones))
+        self._layouts = {}
+    
+    @property
+    def names(self):
+        """領域名のリスト"""
+        return [zone.name for zone in self.zones]
+    
+    def validate(self, profile_names=()):
+        """
+        領域のプロファイル名が監視しているプロファイルにあるかどうかを確認する
+        
+        Parameters:
+        - profile_names: 監視しているプロファイル名のリスト（白色だけを監視している場合は空）
+        """
+        if not profile_names:
+            unknown = [zone.name for zone in self.zones if zone.profile is not None]
+            if unknown:
+                raise ValueError(f"プロファイルを監視していないため、次の領域のプロファイルは使えません: {', '.join(unknown)}")
+            return
+        unknown = [zone.profile for zone in self.zones if zone.profile is not None and zone.profile not in profile_names]
+        if unknown:
+            raise ValueError(f"領域のプロファイルが見つかりません: {', '.join(unknown)}")
+    
+    def layout(self, shape):
+        """
+        大きさが shape のマスクでの領域の配置を返す（マスクの大きさごとにキャッシュする）
+        
+        Returns:
+        - プロファイル名 → (領域の番号の配列, 矩形の配列, 矩形ごとの領域の位置, 領域ごとの画素数) の辞書
+        """
+        layout = self._layouts.get(shape)
+        if layout is not None:
+            return layout
+        
+        grouped = {}
+        for index, zone in enumerate(self.zones):
+            grouped.setdefault(zone.profile, []).append((index, zone.rectangles(shape)))
+        layout = {}
+        for profile, entries in grouped.items():
+            rectangles = np.concatenate([rectangles for _, rectangles in entries])
+            owners = np.concatenate([np.full(len(rectangles), position, np.int64)
+                                     for position, (_, rectangles) in enumerate(entries)])
+            areas = (rectangles[:, 2] - rectangles[:, 0]) * (rectangles[:, 3] - rectangles[:, 1])
+            zone_areas = np.bincount(owners, weights=areas, minlength=len(entries))
+            layout[profile] = (np.array([index for index, _ in entries]), rectangles, owners, zone_areas)
+        self._layouts[shape] = layout
+        return layout
+    
+    def get_mask_result(self, result, profile):
+        """領域のプロファイルに対応する検出結果を返す"""
+        profiles = getattr(result, "profiles", None)
+        if not profiles:
+            return result
+        if profile is None:
+            return next(iter(profiles.values()))
+        return profiles[profile]
+    
+    def occupancy(self, result, timings=None):
+        """
+        領域ごとの占有率（%）を求める
+        
+        Returns:
+        - 領域名 → 占有率の辞書
+        """
+        start = time.perf_counter()
+        percentages = np.zeros(len(self.zones))
+        for profile in self._profiles:
+            mask_result = self.get_mask_result(result, profile)
+            mask = mask_result.clean_mask
+            indices, rectangles, owners, zone_areas = self.layout(mask.shape[:2])[profile]
+            # 物体の色がまったくないマスクでは積分画像を作るまでもなく占有率は0
+            if mask_result.details["white_percentage"] == 0 or len(rectangles) == 0:
+                continue
+            
+            # マスクの値は0か255なので、4Kでも32ビットの合計に収まるよう必要な場合だけ64ビットにする
+            depth = cv2.CV_32S if mask.size * 255 < 2 ** 31 else cv2.CV_64F
+            integral = cv2.integral(mask, sdepth=depth)
+            y1, x1, y2, x2 = rectangles.T
+            sums = (integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]).astype(np.float64)
+            zone_sums = np.bincount(owners, weights=sums, minlength=len(indices))
+            # 画素を含まない領域（画面外など）は占有率0とする
+            percentages[indices] = np.divide(zone_sums / 255 * 100, zone_areas, out=np.zeros(len(indices)),
+                                             where=zone_areas > 0)
+        record_stage(timings, "zones", start)
+        return {zone.name: float(percentage) for zone, percentage in zip(self.zones, percentages)}
+    
+    def apply(self, result, timings=None):
+        """
+        検出結果に領域ごとの占有率と規則の判定を加える
+        
+        result.zones に領域名 → {"percentage", "satisfied"} の辞書を、details に "zones"（占有率）と
+        "zone_violations"（規則を満たさない領域名のリスト）を加え、規則を満たさない領域がある場合は
+        is_cat をFalseにする。マスクがない結果（フレームがない場合など）でも、空の辞書とリストを加える。
+        
+        規則を満たさない場合の信頼度は、最も外れている領域の度合い（Zone.violation）から
+        0.5 * (1 - 度合い) を上限とする。閾値の近くで外れた場合は確信の低い判定（0.5付近）になり、
+        大きく外れるほど0に近づくため、検出器の高い信頼度のまま異常と表示・記録されることはない。
+        
+        Returns:
+        - 同じ result
+        """
+        if not isinstance(result.details, dict):
+            result.details = {"message": result.details}
+        if result.clean_mask is None:
+            result.zones = {}
+            result.details["zones"] = {}
+            result.details["zone_violations"] = []
+            return result
+        
+        percentages = self.occupancy(result, timings)
+        result.zones = {zone.name: {"percentage": percentages[zone.name],
+                                    "satisfied": zone.is_satisfied(percentages[zone.name])}
+                        for zone in self.zones}
+        violations = [name for name, zone in result.zones.items() if not zone["satisfied"]]
+        result.details["zones"] = percentages
+        result.details["zone_violations"] = violations
+        if violations:
+            worst = max(zone.violation(percentages[zone.name]) for zone in self.zones if zone.name in violations)
+            result.is_cat = False
+            result.confidence = min(result.confidence, 0.5 * (1 - worst))
+        return result
+
+def draw_zone_overlay(frame, result, zone_monitor):
+    """領域の枠と占有率をフレームに描画する（規則を満たす領域は緑、満たさない領域は赤、英語で表示）"""
+    zones = getattr(result, "zones", None)
+    if not zones:
+        return
+    for zone in zone_monitor.zones:
+        state = zones.get(zone.name)
+        if state is None:
+            continue
+        color = (0, 255, 0) if state["satisfied"] else (0, 0, 255)
+        points = zone.to_pixels(frame.shape)
+        cv2.polylines(frame, [points], True, color, 2)
+        operator = ">=" if zone.rule == RULE_REQUIRED else "<="
+        x, y = points.min(axis=0)
+        cv2.putText(frame, f"{zone.name}: {state['percentage']:.0f}% ({operator}{zone.threshold:.0f}%)",
+                    (int(x) + 5, int(y) + 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)